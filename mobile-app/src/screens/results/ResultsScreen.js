@@ -59,7 +59,9 @@ const ResultsScreen = ({ navigation }) => {
         testsResponse.tests.map(async (test) => {
           try {
             // Get test results for completed tests
-            const testResults = await testService.getTestResults(test.id);
+            const testResults = await testService.getTestResults(test.id, {
+              fields: 'status,mostProbableParasite,overallConfidence,totalParasites,totalWbcs,severity'
+            });
             const patient = patientsResponse.patients.find(p => p.id == test.patientId);
             
             return {
@@ -106,9 +106,11 @@ const testService = {
   },
 
   // Get test results with diagnosis data
-  async getTestResults(testId) {
+  // params: { fields, include, boxes } to request a projection (see server /tests/<id>/results)
+  async getTestResults(testId, params = {}) {
     try {
-      const response = await api.get(`/tests/${testId}/results`);
+      const query = new URLSearchParams(params).toString();
+      const response = await api.get(`/tests/${testId}/results${query ? `?${query}` : ''}`);
       return response.data;
     } catch (error) {
       throw new Error(error.response?.data?.error || 'Failed to fetch test results');
@@ -27,21 +27,21 @@ class MalariaAnalyzer:
             all_parasite_confidences = defaultdict(list)  # Only actual parasites
             all_wbc_confidences = []  # WBC confidences tracked separately
 
-            logger.info(f"Starting analysis for {len(image_paths)} images")
+            # Per-image summaries come from the detector; detail here is DEBUG only
+            debug = logger.isEnabledFor(logging.DEBUG)
+            logger.info("Starting analysis for %d images", len(image_paths))
             
             for idx, image_path in enumerate(image_paths, 1):
-                logger.info(f"Processing image {idx}/{len(image_paths)}: {image_path}")
+                if debug:
+                    logger.debug("Processing image %d/%d: %s", idx, len(image_paths), image_path)
                 result, error = self.detector.detectAndQuantify(image_path)
                 
                 if error:
-                    logger.warning(f"Skipping image {image_path} due to error: {error}")
+                    logger.warning("Skipping image %s due to error: %s", image_path, error)
                     continue
 
                 image_id = image_path.split('/')[-1]
                 
-                # Debug logging: Check what we're getting from detector
-                logger.info(f"Raw detection result for {image_id}: parasites={result['parasiteCount']}, WBCs={result['whiteBloodCellsDetected']}")
-                
                 # ✅ UPDATED: Handle new structure with separated WBC data
                 detection_data = {
                     "imageId": image_id,  # ✅ FIXED: Changed from image_id to imageId to match backend schema
@@ -59,40 +59,31 @@ class MalariaAnalyzer:
                 }
                 detections.append(detection_data)
                 
-                # Debug: Log before adding to totals
-                logger.info(f"Before adding to totals - Current total parasites: {total_parasite_count}, Current total WBCs: {total_wbc_count}")
-                
                 total_parasite_count += result["parasiteCount"]
                 total_wbc_count += result["whiteBloodCellsDetected"]
-                
-                # Debug: Log after adding to totals
-                logger.info(f"After adding to totals - New total parasites: {total_parasite_count}, New total WBCs: {total_wbc_count}")
+                if debug:
+                    logger.debug("Running totals after %s: %d parasites, %d WBCs",
+                                 image_id, total_parasite_count, total_wbc_count)
                 
                 # ✅ FIXED: Only add actual parasites to parasite confidence tracking
-                logger.info(f"DEBUG: Processing {len(result['parasitesDetected'])} parasites from result")
                 for parasite in result["parasitesDetected"]:
                     parasite_type = parasite["type"].upper()  # Normalize case
-                    logger.info(f"DEBUG: Processing parasite type: '{parasite_type}' (original: '{parasite['type']}')")
-                    logger.info(f"DEBUG: Valid parasite types: {self.valid_parasite_types}")
                     
                     if parasite_type in self.valid_parasite_types:
                         all_parasite_confidences[parasite_type].append(parasite["confidence"])
-                        logger.info(f"Added PARASITE: {parasite_type} with confidence {parasite['confidence']:.3f}")
+                        if debug:
+                            logger.debug("Added parasite %s at confidence %.3f", parasite_type, parasite["confidence"])
                     else:
-                        logger.warning(f"Invalid parasite type detected: '{parasite_type}' - skipping from most probable calculation")
-                        logger.warning(f"Expected types: {self.valid_parasite_types}")
+                        logger.warning("Invalid parasite type %r skipped from most probable calculation (expected %s)",
+                                       parasite_type, self.valid_parasite_types)
 
                 # ✅ NEW: Track WBC confidences separately (for potential quality metrics)
                 for wbc in result.get("wbcsDetected", []):
                     if wbc["type"].upper() == "WBC":
                         all_wbc_confidences.append(wbc["confidence"])
-                        logger.info(f"Added WBC with confidence {wbc['confidence']:.3f}")
 
-            # Debug: Final totals before creating report
-            logger.info(f"FINAL TOTALS - Parasites: {total_parasite_count}, WBCs: {total_wbc_count}")
-            logger.info(f"Number of processed images: {len(detections)}")
-            logger.info(f"DEBUG: all_parasite_confidences keys: {list(all_parasite_confidences.keys())}")
-            logger.info(f"DEBUG: all_parasite_confidences content: {dict(all_parasite_confidences)}")
+            if debug:
+                logger.debug("Parasite confidences by type: %s", dict(all_parasite_confidences))
             
             patient_status = "POSITIVE" if total_parasite_count > 0 else "NEGATIVE"
             
@@ -122,12 +113,9 @@ class MalariaAnalyzer:
                         "confidence": max_confidence,
                         "fullName": parasite_type_names.get(max_conf_species, max_conf_species)
                     }
-                    logger.info(f"Most probable parasite: {most_probable_parasite}")
-                    logger.info(f"Selected from {len(all_parasite_confidences)} parasite types, excluding {len(all_wbc_confidences)} WBC detections")
-            else:
-                logger.info("No valid parasites found for most probable determination")
-                logger.warning(f"WARNING: all_parasite_confidences is empty but total_parasite_count is {total_parasite_count}")
-                logger.warning(f"This suggests parasites were detected but not properly tracked in confidence tracking")
+            elif total_parasite_count:
+                logger.warning("%d parasites counted but none had a valid type for the most probable "
+                               "determination", total_parasite_count)
 
             parasite_wbc_ratio = total_parasite_count / total_wbc_count if total_wbc_count > 0 else 0.0
             
@@ -149,30 +137,16 @@ class MalariaAnalyzer:
                 }
             }
 
-            # Final verification logging
-            logger.info(f"REPORT VERIFICATION:")
-            logger.info(f"- Status: {patient_status}")
-            logger.info(f"- Total Parasites in Report: {total_parasite_count}")
-            logger.info(f"- Total WBCs in Report: {total_wbc_count}")
-            logger.info(f"- Ratio: {parasite_wbc_ratio:.2f}")
-            logger.info(f"- Images processed: {len(detections)}/{len(image_paths)}")
-            
-            # Verify each image's data in the report
-            for i, detection in enumerate(detections):
-                parasite_count = detection['parasiteCount']
-                wbc_count = detection['whiteBloodCellsDetected']
-                wbc_bbox_count = len(detection.get('wbcsDetected', []))
-                logger.info(f"- Image {i+1} ({detection['imageId']}): {parasite_count} parasites, {wbc_count} WBCs ({wbc_bbox_count} with bboxes)")
-            
-            if most_probable_parasite:
-                logger.info(f"- Most Probable: {most_probable_parasite['type']} ({most_probable_parasite['confidence']:.2f})")
-            else:
-                logger.info("- Most Probable: None (no parasites detected)")
+            logger.info("Analysis finished: %s, %d/%d images, %d parasites, %d WBCs, ratio %.2f, most probable %s",
+                        patient_status, len(detections), len(image_paths), total_parasite_count, total_wbc_count,
+                        parasite_wbc_ratio,
+                        f"{most_probable_parasite['type']} ({most_probable_parasite['confidence']:.2f})"
+                        if most_probable_parasite else "none")
             
             return analysis_report
 
         except Exception as e:
-            logger.error(f"Analysis failed: {str(e)}")
+            logger.error("Analysis failed: %s", e)
             return {
                 "status": "ERROR",
                 "error": str(e),
@@ -6,31 +6,34 @@ from datetime import timedelta, datetime
 import os
 import sys
 import argparse
-import logging
-from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]',
-    handlers=[
-        RotatingFileHandler('logs/app.log', maxBytes=10240000, backupCount=10),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: records go through a queue, file/console I/O happens
+# on a listener thread (see utils/logging.py)
+from utils.logging import setup_logging
+setup_logging()
 
 # Import models and routes
 from models import db, bcrypt
+from utils.json_provider import FastJSONProvider
+from middleware.compression import init_compression
+from services.audit_writer import audit_writer
+from services.audit_retention import audit_retention
+from services.identity_cache import identity_cache
+from services.password_hashing import password_hasher
+from services.metrics import metrics
+from services.tracing import tracer
+from services.profiler import profiler
 from routes.auth import auth_bp
 from routes.patients import patients_bp
 from routes.tests import tests_bp
 from routes.upload import upload_bp
 from routes.dashboard import dashboard_bp
 from routes.activity_logs import activity_logs_bp
+from routes.admin import admin_bp
 
 def create_app():
     """Application factory pattern"""
@@ -52,22 +55,13 @@ def create_app():
     print(f"Python path includes server directory: {server_dir in sys.path}")
     
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Ensure logs directory exists
     os.makedirs('logs', exist_ok=True)
     
-    # Configure app logging
-    if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240000, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('Malaria Lab startup')
+    # app.logger propagates to the root logger's queue handler
+    app.logger.info('Malaria Lab startup')
     
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
@@ -77,6 +71,9 @@ def create_app():
     )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Password hashing cost; existing hashes are upgraded on the next login
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    
     # File upload configuration
     app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
@@ -95,8 +92,27 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
     jwt = JWTManager(app)
+    
+    # Resolve the token's user once per request (flask_jwt_extended keeps it
+    # for get_current_user()), from a short-lived cache of role/permissions
+    @jwt.user_lookup_loader
+    def load_user_identity(jwt_header, jwt_data):
+        return identity_cache.get(jwt_data['sub'])
+    
+    @jwt.user_lookup_error_loader
+    def user_lookup_error(jwt_header, jwt_data):
+        return jsonify({'error': 'User not found'}), 404
     migrate = Migrate(app, db)
+    audit_writer.init_app(app)
+    audit_retention.init_app(app)
+    # Prometheus metrics at GET /metrics (request latency, DB queries, AI pipeline)
+    metrics.init_app(app)
+    # Per-stage spans of each test, exported to a file or an OTLP collector
+    tracer.init_app(app)
+    # Sampling profiler: /api/admin/profile and per-request X-Profile: 1
+    profiler.init_app(app)
     
     # Enable CORS
     CORS(app, resources={
@@ -128,6 +144,10 @@ def create_app():
     app.register_blueprint(upload_bp, url_prefix='/api/upload')
     app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
     app.register_blueprint(activity_logs_bp, url_prefix='/api/activity-logs')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+    # gzip/brotli compression for JSON, CSV and MessagePack bodies
+    init_compression(app)
 
     # Static serving for uploaded/annotated images
     @app.route('/uploads/<path:filename>')
@@ -166,6 +186,35 @@ def create_app():
             'version': '1.0.0'
         }), 200
 
+    @app.route('/api/health/live')
+    def liveness_check():
+        """Liveness: the process is up and serving requests"""
+        return jsonify({'status': 'alive'}), 200
+
+    @app.route('/api/health/ready')
+    def readiness_check():
+        """Readiness: the database answers and the detection model is loaded"""
+        from services.ai_analysis import ai_service
+
+        # Also starts the model load when no server hook has done it yet
+        ai_service.start(app)
+        model = ai_service.model_status()
+        model_ready = model['state'] == 'ready' or \
+            os.getenv('READINESS_REQUIRES_MODEL', 'true').lower() != 'true'
+
+        try:
+            db.session.execute(db.text('SELECT 1'))
+            database = {'state': 'ready'}
+        except Exception as e:
+            database = {'state': 'failed', 'error': str(e)}
+
+        ready = model_ready and database['state'] == 'ready'
+        return jsonify({
+            'status': 'ready' if ready else 'not_ready',
+            'model': model,
+            'database': database
+        }), 200 if ready else 503
+
     # Test malaria detection endpoint
     @app.route('/api/test-malaria-detection')
     def test_malaria_detection():
@@ -212,6 +261,12 @@ if __name__ == '__main__':
     host = args.host if args.host is not None else os.getenv('HOST', '0.0.0.0')
     debug = args.debug if args.debug else (os.getenv('FLASK_ENV') == 'development')
     
+    # Load the model in the background while the server starts and resume
+    # interrupted AI jobs; with the reloader only the serving child does this
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from services.ai_analysis import ai_service
+        ai_service.start(app)
+    
     # Run the app
     app.run(
         host=host,
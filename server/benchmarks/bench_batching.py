@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Latency/throughput benchmark for dynamic inference batching.
+
+Runs --jobs concurrent jobs of --images images each through an
+InferenceBatcher, once per (max batch size, max wait) combination, and
+reports images/sec plus per-image latency percentiles. Each job submits its
+images one at a time, like AIAnalysisService job workers do.
+
+By default the detector is simulated with a batch cost of
+--fixed-ms + n * --per-image-ms (the fixed part is what batching amortises).
+With --model the real MalariaDetector.detect_batch runs on synthetic slides.
+
+Usage:
+    python benchmarks/bench_batching.py [--jobs 4] [--images 10] [--sizes 1,2,4,8] [--waits 0,2,5,10]
+    python benchmarks/bench_batching.py --model best.pt --imgsz 640
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from services.inference_batcher import InferenceBatcher
+
+
+class SimulatedDetector:
+    def __init__(self, fixed_ms, per_image_ms):
+        self.fixed = fixed_ms / 1000
+        self.per_image = per_image_ms / 1000
+
+    def detect_batch(self, image_paths, **options):
+        time.sleep(self.fixed + self.per_image * len(image_paths))
+        return [({'parasiteCount': 0, 'whiteBloodCellsDetected': 0}, None) for _ in image_paths]
+
+
+def synthetic_images(count, imgsz):
+    import cv2
+    import numpy as np
+
+    directory = tempfile.mkdtemp(prefix='bench-batching-')
+    rng = np.random.default_rng(0)
+    paths = []
+    for index in range(count):
+        slide = np.clip(rng.normal((205, 175, 215), 12, (imgsz, imgsz, 3)), 0, 255).astype(np.uint8)
+        path = os.path.join(directory, f'slide_{index}.jpg')
+        cv2.imwrite(path, slide)
+        paths.append(path)
+    return paths
+
+
+def run(detector, paths, jobs, images, max_batch_size, max_wait_ms):
+    batcher = InferenceBatcher(lambda batch, **options: detector.detect_batch(batch, **options),
+                               max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    latencies = []
+    lock = threading.Lock()
+
+    def job(job_index):
+        local = []
+        for image_index in range(images):
+            path = paths[(job_index * images + image_index) % len(paths)]
+            started = time.perf_counter()
+            batcher.detect(path)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=job, args=(index,)) for index in range(jobs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'mean': statistics.fmean(latencies) * 1000,
+        'avg_batch': batcher.stats()['avgBatchSize'],
+        'elapsed': elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dynamic batching of detector calls')
+    parser.add_argument('--jobs', type=int, default=4, help='Concurrent jobs')
+    parser.add_argument('--images', type=int, default=10, help='Images per job')
+    parser.add_argument('--sizes', default='1,2,4,8', help='Max batch sizes to try')
+    parser.add_argument('--waits', default='0,2,5,10', help='Max batch waits (ms) to try')
+    parser.add_argument('--fixed-ms', type=float, default=40, help='Simulated per-batch overhead')
+    parser.add_argument('--per-image-ms', type=float, default=25, help='Simulated per-image cost')
+    parser.add_argument('--model', help='Benchmark the real detector with this model file')
+    parser.add_argument('--imgsz', type=int, default=640, help='Synthetic slide size for --model')
+    args = parser.parse_args()
+
+    if args.model:
+        from malaria_detector import MalariaDetector
+        detector = MalariaDetector(args.model)
+        paths = synthetic_images(args.jobs * args.images, args.imgsz)
+        detector.detect_batch(paths[:1])  # predictor setup is not part of the measurement
+        label = f'MalariaDetector({args.model})'
+    else:
+        detector = SimulatedDetector(args.fixed_ms, args.per_image_ms)
+        paths = [f'image_{index}.jpg' for index in range(args.jobs * args.images)]
+        label = f'simulated detector ({args.fixed_ms:g} ms + {args.per_image_ms:g} ms/image)'
+
+    print(f'{label}: {args.jobs} concurrent jobs x {args.images} images\n')
+    print(f"{'batch':>5} {'wait ms':>8} {'img/s':>8} {'avg batch':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+    baseline = None
+    for size in [int(value) for value in args.sizes.split(',')]:
+        for wait in [float(value) for value in args.waits.split(',')]:
+            if size == 1 and wait > 0:
+                continue  # waiting never helps a batch of one
+            row = run(detector, paths, args.jobs, args.images, size, wait)
+            baseline = baseline or row['throughput']
+            print(f"{size:>5} {wait:>8g} {row['throughput']:>8.1f} {row['avg_batch']:>10} "
+                  f"{row['mean']:>9.1f} {row['p50']:>9.1f} {row['p95']:>9.1f}"
+                  f"   ({row['throughput'] / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+JSON serialisation benchmark for the heaviest API endpoints.
+
+Seeds a throwaway SQLite database with a detection-heavy diagnosis, a large
+activity log and a patient with a long test history, then times those
+endpoints through the Flask test client once per available JSON backend
+(stdlib json, msgspec, orjson).
+
+Usage:
+    python benchmarks/bench_json.py [--images 20] [--wbcs 300] [--logs 5000] [--repeat 20]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.chdir(SERVER_DIR)
+    os.makedirs('logs', exist_ok=True)
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    app.logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed(app, client, args):
+    """Create a user, a patient history, a heavy diagnosis and activity logs"""
+    from models import db, Test, DiagnosisResult
+    from models.activity_log import ActivityLog
+
+    client.post('/api/auth/register', json={
+        'email': 'bench@malarialab.com', 'username': 'bench', 'password': 'bench12345',
+        'first_name': 'Bench', 'last_name': 'User', 'role': 'admin'
+    })
+    token = client.post('/api/auth/login', json={
+        'email': 'bench@malarialab.com', 'password': 'bench12345'
+    }).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    patient_id = client.post('/api/patients/', json={
+        'firstName': 'Heavy', 'lastName': 'Patient', 'phoneNumber': '+255700000000'
+    }, headers=headers).get_json()['patient']['id']
+
+    with app.app_context():
+        user_id = db.session.execute(db.text('SELECT id FROM users')).scalar()
+        tests = []
+        for _ in range(args.history):
+            test = Test(
+                patient_id=patient_id, sample_type='blood_smear',
+                sample_collection_date=datetime.utcnow(), sample_collected_by=user_id,
+                technician_id=user_id, created_by=user_id
+            )
+            db.session.add(test)
+            tests.append(test)
+        db.session.flush()
+
+        heavy = tests[0]
+        result = DiagnosisResult(test_id=heavy.id, status='POSITIVE', model_version='YOLOv12-1.0',
+                                 total_parasites=0, total_wbcs=0)
+        for i in range(args.images):
+            parasites = [{'type': 'PF', 'confidence': 0.91, 'bbox': [10.5 + j, 20.25, 40.75, 60.5]}
+                         for j in range(args.parasites)]
+            wbcs = [{'type': 'WBC', 'confidence': 0.83, 'bbox': [100.5 + j, 200.25, 140.75, 260.5]}
+                    for j in range(args.wbcs)]
+            result.add_detection(str(i), f'slide_{i}.jpg', parasites, wbcs, len(wbcs), len(parasites), 1.0)
+        result.calculate_severity()
+        db.session.add(result)
+
+        now = datetime.utcnow()
+        user_info = {'username': 'bench', 'email': 'bench@malarialab.com', 'role': 'admin'}
+        request_info = {'ipAddress': '127.0.0.1', 'userAgent': 'bench', 'method': 'POST', 'endpoint': 'bench'}
+        db.session.add_all([
+            ActivityLog(action='patient_viewed', user_id=user_id, user_info=user_info,
+                        resource_type='patient', resource_id=patient_id, details={'index': i},
+                        request_info=request_info, created_at=now - timedelta(seconds=i))
+            for i in range(args.logs)
+        ])
+        db.session.commit()
+        heavy_id = heavy.id
+
+    return headers, {
+        'test results (full boxes)': f'/api/tests/{heavy_id}/results',
+        'diagnosis result': f'/api/tests/{heavy_id}/diagnosis',
+        'activity log export (json)': '/api/activity-logs/export?startDate=2000-01-01&endDate=2100-01-01',
+        'patient history': f'/api/patients/{patient_id}',
+    }
+
+
+def available_backends():
+    from utils.json_provider import orjson, msgspec
+    backends = ['json']
+    if msgspec is not None:
+        backends.append('msgspec')
+    if orjson is not None:
+        backends.append('orjson')
+    return backends
+
+
+def time_endpoint(client, url, headers, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(response.data)
+        assert response.status_code == 200, f'{url} -> {response.status_code}'
+    return statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON backends on the heaviest endpoints')
+    parser.add_argument('--images', type=int, default=20, help='Images in the heavy diagnosis')
+    parser.add_argument('--wbcs', type=int, default=300, help='WBC boxes per image')
+    parser.add_argument('--parasites', type=int, default=20, help='Parasite boxes per image')
+    parser.add_argument('--logs', type=int, default=5000, help='Activity log rows to export')
+    parser.add_argument('--history', type=int, default=200, help='Tests in the patient history')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint and backend')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        headers, endpoints = seed(app, client, args)
+
+        from utils.json_provider import FastJSONProvider
+
+        print(f"{'endpoint':<30} {'backend':<8} {'median ms':>10} {'bytes':>10}")
+        for name, url in endpoints.items():
+            baseline = None
+            for backend in available_backends():
+                app.json = FastJSONProvider(app, backend=backend)
+                client.get(url, headers=headers)  # warm caches
+                median_ms, size = time_endpoint(client, url, headers, args.repeat)
+                baseline = baseline or median_ms
+                print(f'{name:<30} {backend:<8} {median_ms:>10.2f} {size:>10}  ({baseline / median_ms:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the API process.
+
+Each measurement runs in a fresh interpreter:
+
+  * import time of the modules on the request path (app, routes.upload,
+    services.ai_analysis, malaria_detector) and, from `python -X importtime`,
+    the slowest individual imports behind `import app`;
+  * time from launching `python app.py` until /api/health answers, and until
+    /api/health/ready reports the model as ready (or failed).
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 3] [--top 15] [--ready-timeout 180]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['app', 'routes.upload', 'services.ai_analysis', 'malaria_detector']
+
+
+def import_seconds(module, env):
+    code = (
+        'import time, os, sys; os.makedirs("logs", exist_ok=True); sys.path.insert(0, os.getcwd()); '
+        f't = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=SERVER_DIR, env=env,
+                            capture_output=True, text=True)
+    if output.returncode != 0:
+        return None
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    """(cumulative microseconds, module) for the slowest imports under `import app`"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def serve_times(env, ready_timeout):
+    """Seconds from launch until /api/health answers and until readiness settles"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py', '--host', '127.0.0.1', '--port', str(port)],
+                               cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    healthy = ready = None
+    state = 'unknown'
+    try:
+        deadline = started + ready_timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            try:
+                if healthy is None and get(port, '/api/health')[0] == 200:
+                    healthy = time.perf_counter() - started
+                if healthy is not None:
+                    status, body = get(port, '/api/health/ready')
+                    state = json.loads(body)['model']['state']
+                    if status == 200 or state == 'failed':
+                        ready = time.perf_counter() - started
+                        break
+            except OSError:
+                pass
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return healthy, ready, state
+
+
+def fmt(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return 'n/a'
+    return f'{statistics.median(values) * 1000:9.1f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure API import and cold-start times')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh processes per measurement')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    parser.add_argument('--ready-timeout', type=float, default=180, help='Seconds to wait for readiness')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               AUDIT_WAL_DIR=os.path.join(workdir, 'audit_wal'),
+               AUDIT_RETENTION_INTERVAL_HOURS='0',
+               FLASK_ENV='production')
+    try:
+        print(f'Import time (median of {args.repeat} fresh interpreters)')
+        for module in MODULES:
+            print(f'  {module:<24} {fmt([import_seconds(module, env) for _ in range(args.repeat)])}')
+
+        print(f'\nSlowest imports under `import app` (cumulative)')
+        for cumulative, name in slowest_imports(env, args.top):
+            print(f'  {cumulative / 1000:9.1f} ms  {name}')
+
+        print(f'\nCold start of `python app.py` (median of {args.repeat})')
+        runs = [serve_times(env, args.ready_timeout) for _ in range(args.repeat)]
+        print(f"  {'first /api/health':<24} {fmt([run[0] for run in runs])}")
+        print(f"  {'readiness settled':<24} {fmt([run[1] for run in runs])}  (model: {runs[-1][2]})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
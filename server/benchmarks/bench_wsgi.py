@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: Flask development server vs gunicorn.
+
+Starts each server as a subprocess on a throwaway SQLite database, registers
+a user, then drives it with --concurrency keep-alive client threads for
+--duration seconds per endpoint and reports requests/sec, latency
+percentiles and errors. The model is not warmed in the gunicorn workers, so
+the numbers measure request handling only.
+
+Usage:
+    python benchmarks/bench_wsgi.py [--concurrency 16] [--duration 10] [--workers 1] [--threads 8]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ('health', '/api/health', False),
+    ('patients', '/api/patients/?page=1&per_page=20', True),
+    ('dashboard', '/api/dashboard/', True),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, env, args):
+    if kind == 'dev':
+        command = [sys.executable, 'app.py', '--host', '127.0.0.1', '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+        env = dict(env, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(args.workers),
+                   GUNICORN_THREADS=str(args.threads), GUNICORN_WARM_MODEL='false',
+                   GUNICORN_ACCESS_LOG='/dev/null')
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited with code {process.returncode}')
+        try:
+            status, _ = request(port, 'GET', '/api/health')
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{kind} server did not become healthy')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def request(port, method, path, body=None, headers=None, connection=None):
+    conn = connection or http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    payload = json.dumps(body).encode() if body is not None else None
+    all_headers = {'Content-Type': 'application/json'} if payload else {}
+    all_headers.update(headers or {})
+    conn.request(method, path, body=payload, headers=all_headers)
+    response = conn.getresponse()
+    data = response.read()
+    if connection is None:
+        conn.close()
+    return response.status, data
+
+
+def login(port):
+    user = {'email': 'bench@malarialab.com', 'username': 'bench', 'password': 'bench12345',
+            'first_name': 'Bench', 'last_name': 'User', 'role': 'admin'}
+    request(port, 'POST', '/api/auth/register', user)
+    status, data = request(port, 'POST', '/api/auth/login',
+                           {'email': user['email'], 'password': user['password']})
+    if status != 200:
+        raise RuntimeError(f'login failed with {status}: {data[:200]}')
+    return {'Authorization': f"Bearer {json.loads(data)['access_token']}"}
+
+
+def load(port, path, headers, concurrency, duration):
+    """Run concurrency client threads against path; returns (requests, errors, latencies)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed = [], 0
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                status, _ = request(port, 'GET', path, headers=headers, connection=conn)
+                if status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return len(latencies), errors[0], latencies
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench(kind, args):
+    workdir = tempfile.mkdtemp(prefix=f'bench-wsgi-{kind}-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               AUDIT_WAL_DIR=os.path.join(workdir, 'audit_wal'),
+               AUDIT_RETENTION_INTERVAL_HOURS='0',
+               BCRYPT_LOG_ROUNDS='4',
+               FLASK_ENV='production')
+    port = free_port()
+    process = start_server(kind, port, env, args)
+    results = {}
+    try:
+        headers = login(port)
+        for name, path, authenticated in ENDPOINTS:
+            load(port, path, headers if authenticated else None, args.concurrency, min(1.0, args.duration))
+            count, errors, latencies = load(port, path, headers if authenticated else None,
+                                            args.concurrency, args.duration)
+            results[name] = {
+                'rps': count / args.duration,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p95': percentile(latencies, 0.95) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'mean': (statistics.fmean(latencies) * 1000) if latencies else 0.0,
+                'errors': errors
+            }
+    finally:
+        stop_server(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the dev server with gunicorn under load')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per endpoint')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--servers', default='dev,gunicorn', help='Comma-separated servers to run')
+    args = parser.parse_args()
+
+    servers = args.servers.split(',')
+    if 'gunicorn' in servers:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print('gunicorn is not installed; benchmarking the dev server only')
+            servers.remove('gunicorn')
+
+    print(f'{args.concurrency} clients, {args.duration:.0f}s per endpoint, '
+          f'gunicorn {args.workers} worker(s) x {args.threads} threads\n')
+    print(f"{'server':<10} {'endpoint':<10} {'req/s':>9} {'mean ms':>9} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+    all_results = {}
+    for kind in servers:
+        all_results[kind] = bench(kind, args)
+        for name, row in all_results[kind].items():
+            print(f"{kind:<10} {name:<10} {row['rps']:>9.1f} {row['mean']:>9.2f} {row['p50']:>9.2f} "
+                  f"{row['p95']:>9.2f} {row['p99']:>9.2f} {row['errors']:>7}")
+
+    if 'dev' in all_results and 'gunicorn' in all_results:
+        print()
+        for name, row in all_results['gunicorn'].items():
+            baseline = all_results['dev'][name]['rps']
+            if baseline:
+                print(f"{name}: gunicorn serves {row['rps'] / baseline:.2f}x the dev server's requests/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the API: the workflow of a lab technician, repeated.
+
+Each virtual user loops over
+
+    login -> create patient -> create test -> upload session -> upload N
+    images -> start processing -> poll progress until analysed -> results
+    -> dashboard
+
+and every request is timed per step. Besides request latency, `analysis`
+is the time from starting processing until the test is analysed (queue wait
+plus inference) and `workflow` the whole loop.
+
+By default a throwaway server is started on a temporary SQLite database with
+the stub detector (AI_STUB_DETECTOR=true, see services/stub_detector.py), so
+no model, torch or GPU is needed; --batch-ms/--image-ms set its service
+time. --real-model uses best.pt instead (pass real slides with
+--images-dir), --url targets an already running server.
+
+Results (p50/p95/p99 per step, throughput, errors) can be saved as a
+baseline and later runs compared against it; the run fails (exit code 1)
+when a step's p50 grows by more than --tolerance (p95: twice that; both
+plus --slack-ms), throughput drops by more than --tolerance, or requests
+start failing.
+Baselines are per scenario and only comparable on the same machine.
+
+Usage:
+    python benchmarks/loadtest.py [--users 4] [--iterations 10] [--images 5]
+    python benchmarks/loadtest.py --save-baseline           # record benchmarks/loadtest_baseline.json
+    python benchmarks/loadtest.py --check                   # compare against it
+    python benchmarks/loadtest.py --server gunicorn --users 16 --duration 60
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_wsgi import free_port, percentile, start_server, stop_server
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadtest_baseline.json')
+
+STEPS = ('login', 'create_patient', 'create_test', 'create_session', 'upload', 'process',
+         'poll', 'analysis', 'results', 'dashboard', 'workflow')
+
+# Steps whose p95 is compared with the baseline (poll is dominated by the interval)
+CHECKED_STEPS = ('login', 'create_patient', 'create_test', 'create_session', 'upload', 'process',
+                 'analysis', 'results', 'dashboard', 'workflow')
+
+
+class WorkflowError(Exception):
+    pass
+
+
+class Client:
+    """Keep-alive HTTP client for one virtual user"""
+
+    def __init__(self, host, port, timeout=60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.headers = {}
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, path, body=None, files=None):
+        """Send a request; returns (status, parsed JSON or None, headers)"""
+        headers = dict(self.headers)
+        if files is not None:
+            boundary = uuid.uuid4().hex
+            payload = encode_multipart(boundary, files)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        else:
+            payload = None
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            raise
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = None
+        return response.status, parsed, response.headers
+
+    def close(self):
+        self.conn.close()
+
+
+def encode_multipart(boundary, files):
+    parts = []
+    for filename, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="images"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts)
+
+
+def synthetic_jpeg(size_kb):
+    """Bytes that pass the upload checks (JPEG markers, size) without being decoded"""
+    header = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    return header + b'\x00' * max(size_kb * 1024 - len(header) - 2, 1024) + b'\xff\xd9'
+
+
+def load_images(args):
+    if args.images_dir:
+        names = sorted(name for name in os.listdir(args.images_dir)
+                       if name.lower().endswith(('.jpg', '.jpeg', '.png', '.tif', '.tiff')))
+        if not names:
+            raise SystemExit(f'No images in {args.images_dir}')
+        images = []
+        for name in names:
+            with open(os.path.join(args.images_dir, name), 'rb') as f:
+                images.append((name, f.read()))
+        return images
+    return [(f'slide_{index}.jpg', synthetic_jpeg(args.image_kb)) for index in range(args.images)]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = 0
+        self.requests = 0
+        self.workflows = 0
+        self.images = 0
+
+    def record(self, step, seconds, ok=True):
+        with self.lock:
+            if ok:
+                self.latencies[step].append(seconds)
+            else:
+                self.errors[step] += 1
+
+
+class VirtualUser:
+    def __init__(self, index, client, recorder, images, args):
+        self.index = index
+        self.client = client
+        self.recorder = recorder
+        self.images = images
+        self.args = args
+        self.email = f'loadtest{index}@malarialab.com'
+        self.password = 'loadtest12345'
+
+    def call(self, step, method, path, expected, body=None, files=None):
+        """Time one request; 429/503 with Retry-After are waited out and retried"""
+        for _ in range(self.args.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                status, data, headers = self.client.request(method, path, body, files)
+            except (OSError, http.client.HTTPException) as e:
+                self.recorder.record(step, 0, ok=False)
+                raise WorkflowError(f'{step}: {e}')
+            elapsed = time.perf_counter() - started
+            with self.recorder.lock:
+                self.recorder.requests += 1
+            if status in (429, 503) and headers.get('Retry-After'):
+                with self.recorder.lock:
+                    self.recorder.throttled += 1
+                time.sleep(min(float(headers['Retry-After']), self.args.max_retry_wait))
+                continue
+            if status not in expected:
+                self.recorder.record(step, elapsed, ok=False)
+                raise WorkflowError(f'{step}: HTTP {status} {str(data)[:200]}')
+            self.recorder.record(step, elapsed)
+            return data
+        self.recorder.record(step, 0, ok=False)
+        raise WorkflowError(f'{step}: still throttled after {self.args.max_retries} retries')
+
+    def register(self):
+        self.client.request('POST', '/api/auth/register', {
+            'email': self.email, 'username': f'loadtest{self.index}', 'password': self.password,
+            'first_name': 'Load', 'last_name': f'Tester{self.index}', 'role': self.args.role
+        })
+
+    def workflow(self, iteration):
+        started = time.perf_counter()
+        data = self.call('login', 'POST', '/api/auth/login', (200,),
+                         {'email': self.email, 'password': self.password})
+        self.client.headers = {'Authorization': f"Bearer {data['access_token']}"}
+
+        patient = self.call('create_patient', 'POST', '/api/patients/', (201,), {
+            'firstName': 'Load', 'lastName': f'Patient{self.index}x{iteration}', 'gender': 'unknown'
+        })['patient']
+        test = self.call('create_test', 'POST', '/api/tests/', (201,), {
+            'patientId': patient['id'], 'sampleType': 'blood_smear', 'priority': self.args.priority,
+            'sampleCollectionDate': time.strftime('%Y-%m-%dT%H:%M:%S')
+        })['test']
+        session = self.call('create_session', 'POST', '/api/upload/session', (200, 201),
+                            {'testId': test['id']})['session']
+        session_id = session['sessionId']
+        self.call('upload', 'POST', f'/api/upload/files/{session_id}', (200, 201), files=self.images)
+
+        self.call('process', 'POST', '/api/upload/start-processing', (200,),
+                  {'sessionId': session_id, 'testId': test['id']})
+        processing_started = time.perf_counter()
+        deadline = processing_started + self.args.analysis_timeout
+        while True:
+            progress = self.call('poll', 'GET', f'/api/upload/progress/{session_id}', (200,))
+            status = (progress.get('aiProcessing') or {}).get('status') or progress.get('status')
+            if status == 'completed':
+                break
+            if status in ('failed', 'cancelled'):
+                self.recorder.record('analysis', 0, ok=False)
+                raise WorkflowError(f"analysis {status}: {(progress.get('aiProcessing') or {}).get('error')}")
+            if time.perf_counter() > deadline:
+                self.recorder.record('analysis', 0, ok=False)
+                raise WorkflowError(f'analysis not finished after {self.args.analysis_timeout}s')
+            time.sleep(self.args.poll_interval)
+        self.recorder.record('analysis', time.perf_counter() - processing_started)
+
+        self.call('results', 'GET', f"/api/tests/{test['id']}/results", (200,))
+        self.call('dashboard', 'GET', '/api/dashboard/', (200,))
+        self.recorder.record('workflow', time.perf_counter() - started)
+        with self.recorder.lock:
+            self.recorder.workflows += 1
+            self.recorder.images += len(self.images)
+
+    def run(self, stop_at, failures):
+        iteration = 0
+        while iteration < self.args.iterations or (self.args.duration and time.perf_counter() < stop_at):
+            if self.args.duration and time.perf_counter() >= stop_at:
+                break
+            try:
+                self.workflow(iteration)
+            except WorkflowError as e:
+                self.recorder.record('workflow', 0, ok=False)
+                with self.recorder.lock:
+                    failures.append(f'user {self.index}: {e}')
+            iteration += 1
+        self.client.close()
+
+
+def run_load(host, port, args):
+    images = load_images(args)
+    recorder = Recorder()
+    failures = []
+    users = [VirtualUser(index, Client(host, port), recorder, images, args) for index in range(args.users)]
+    for user in users:
+        user.register()
+
+    if args.duration:
+        args.iterations = 0
+    started = time.perf_counter()
+    stop_at = started + (args.duration or 0)
+    threads = [threading.Thread(target=user.run, args=(stop_at, failures), name=f'vuser-{user.index}')
+               for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize(recorder, elapsed), failures
+
+
+def summarize(recorder, elapsed):
+    steps = {}
+    for step in STEPS:
+        latencies = recorder.latencies.get(step, [])
+        if not latencies and not recorder.errors.get(step):
+            continue
+        steps[step] = {
+            'count': len(latencies),
+            'errors': recorder.errors.get(step, 0),
+            'p50': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2)
+        }
+    return {
+        'seconds': round(elapsed, 2),
+        'workflows': recorder.workflows,
+        'requests': recorder.requests,
+        'throttled': recorder.throttled,
+        'errors': sum(recorder.errors.values()),
+        'workflowsPerMinute': round(recorder.workflows / elapsed * 60, 2) if elapsed else 0.0,
+        'requestsPerSecond': round(recorder.requests / elapsed, 2) if elapsed else 0.0,
+        'imagesPerSecond': round(recorder.images / elapsed, 3) if elapsed else 0.0,
+        'steps': steps
+    }
+
+
+def print_report(summary):
+    print(f"{'step':<15} {'count':>6} {'errors':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for step, row in summary['steps'].items():
+        print(f"{step:<15} {row['count']:>6} {row['errors']:>6} {row['p50']:>10.2f} "
+              f"{row['p95']:>10.2f} {row['p99']:>10.2f}")
+    print(f"\n{summary['workflows']} workflows in {summary['seconds']}s: "
+          f"{summary['workflowsPerMinute']} workflows/min, {summary['requestsPerSecond']} req/s, "
+          f"{summary['imagesPerSecond']} images/s, {summary['errors']} errors, "
+          f"{summary['throttled']} throttled (429/503) responses")
+
+
+def compare(summary, baseline, tolerance, slack_ms):
+    """Regressions of this run against a baseline summary, as messages"""
+    regressions = []
+    for step in CHECKED_STEPS:
+        current, previous = summary['steps'].get(step), baseline['steps'].get(step)
+        if not current or not previous:
+            continue
+        # p95 of a few dozen samples is close to the maximum, so it gets twice
+        # the relative allowance; the absolute slack keeps fast steps from
+        # failing on scheduling noise
+        for stat, allowance in (('p50', tolerance), ('p95', 2 * tolerance)):
+            limit = previous[stat] * (1 + allowance) + slack_ms
+            if current[stat] > limit:
+                regressions.append(f"{step} {stat} {current[stat]:.2f} ms > {limit:.2f} ms "
+                                   f"(baseline {previous[stat]:.2f} ms)")
+    floor = baseline['workflowsPerMinute'] * (1 - tolerance)
+    if summary['workflowsPerMinute'] < floor:
+        regressions.append(f"throughput {summary['workflowsPerMinute']} workflows/min < {floor:.2f} "
+                           f"(baseline {baseline['workflowsPerMinute']})")
+    if summary['errors'] > baseline.get('errors', 0):
+        regressions.append(f"{summary['errors']} errors (baseline {baseline.get('errors', 0)})")
+    return regressions
+
+
+def scenario_settings(args):
+    """The options that make runs comparable; stored with the baseline"""
+    return {
+        'server': 'external' if args.url else args.server,
+        'users': args.users,
+        'iterations': args.iterations,
+        'duration': args.duration,
+        'images': args.images if not args.images_dir else f'dir:{args.images_dir}',
+        'imageKb': args.image_kb,
+        'detector': 'model' if args.real_model else f'stub {args.batch_ms}+{args.image_ms}/image ms',
+        'bcryptRounds': args.bcrypt_rounds
+    }
+
+
+def local_server(args):
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+               AUDIT_WAL_DIR=os.path.join(workdir, 'audit_wal'),
+               AUDIT_RETENTION_INTERVAL_HOURS='0',
+               LOG_FILE=os.path.join(workdir, 'app.log'),
+               BCRYPT_LOG_ROUNDS=str(args.bcrypt_rounds),
+               FLASK_ENV='production')
+    if not args.real_model:
+        env.update(AI_STUB_DETECTOR='true', AI_STUB_BATCH_MS=str(args.batch_ms), AI_STUB_IMAGE_MS=str(args.image_ms))
+    port = free_port()
+    return workdir, port, start_server(args.server, port, env, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of the lab workflow')
+    parser.add_argument('--url', help='Test a running server instead of starting one (e.g. http://127.0.0.1:5000)')
+    parser.add_argument('--server', default='dev', choices=('dev', 'gunicorn'), help='Local server to start')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--users', type=int, default=4, help='Concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=10, help='Workflows per user')
+    parser.add_argument('--duration', type=float, default=0, help='Run for this many seconds instead')
+    parser.add_argument('--images', type=int, default=5, help='Images per test (max 20)')
+    parser.add_argument('--image-kb', type=int, default=64, help='Size of each synthetic image')
+    parser.add_argument('--images-dir', help='Upload these slides instead of synthetic images')
+    parser.add_argument('--priority', default='normal', choices=('low', 'normal', 'high', 'urgent'))
+    parser.add_argument('--role', default='technician', help='Role of the virtual users')
+    parser.add_argument('--real-model', action='store_true', help='Use best.pt instead of the stub detector')
+    parser.add_argument('--batch-ms', type=float, default=20, help='Stub detector cost per batch')
+    parser.add_argument('--image-ms', type=float, default=80, help='Stub detector cost per image')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='BCRYPT_LOG_ROUNDS of the local server')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='Seconds between progress polls')
+    parser.add_argument('--analysis-timeout', type=float, default=300, help='Give up on a test after this long')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries of a 429/503 response')
+    parser.add_argument('--max-retry-wait', type=float, default=10, help='Longest Retry-After honoured')
+    parser.add_argument('--scenario', default='default', help='Baseline entry to save or compare')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the scenario baseline')
+    parser.add_argument('--check', action='store_true', help='Fail on regressions against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Allowed relative regression (p95: twice this)')
+    parser.add_argument('--slack-ms', type=float, default=25, help='Allowed absolute latency regression')
+    parser.add_argument('--json', help='Also write the summary to this file')
+    args = parser.parse_args()
+    args.images = min(args.images, 20)  # upload sessions accept at most 20 files
+
+    if args.server == 'gunicorn' and not args.url:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            raise SystemExit('gunicorn is not installed')
+
+    workdir = process = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        workdir, port, process = local_server(args)
+        host = '127.0.0.1'
+
+    settings = scenario_settings(args)
+    print(f"Scenario {args.scenario!r}: {settings}\n")
+    try:
+        summary, failures = run_load(host, port, args)
+    finally:
+        if process is not None:
+            stop_server(process)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary['settings'] = settings
+    print_report(summary)
+    for failure in failures[:10]:
+        print(f'  failed: {failure}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[args.scenario] = summary
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nSaved baseline {args.scenario!r} to {args.baseline}')
+        return
+
+    if args.check:
+        baseline = baselines.get(args.scenario)
+        if baseline is None:
+            raise SystemExit(f'No baseline {args.scenario!r} in {args.baseline}; run with --save-baseline first')
+        if baseline.get('settings') != settings:
+            print(f"\nWarning: baseline was recorded with {baseline.get('settings')}")
+        regressions = compare(summary, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print(f'\nRegressions against baseline {args.scenario!r} (tolerance {args.tolerance:.0%}):')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'\nNo regressions against baseline {args.scenario!r}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+malaria-bench: inference benchmark of MalariaDetector on real slides.
+
+For every combination of backend (pytorch, onnx, openvino), imgsz and
+thread count, a separate process loads the model and runs
+MalariaDetector.detect_batch over the slides at each batch size,
+measuring
+
+    - latency per stage (decode, preprocess, forward, nms, postprocess,
+      annotate), taken from the same metrics hooks production uses
+    - throughput (images/s) and batch latency p50/p95 per batch size
+    - model load time and peak RSS of the process
+    - parasite/WBC counts per slide, compared across backends at the same
+      imgsz (the first backend is the reference)
+
+ONNX and OpenVINO models are exported from --model once per imgsz into
+<output>/exports (with dynamic batch); a backend whose runtime is not
+installed is skipped. Results are written to
+<output>/malaria-bench-<timestamp>.json and .csv, and the CSV rows are
+appended to <output>/history.csv so runs can be tracked over time. The
+exit code is 1 when detection counts disagree beyond --count-tolerance.
+
+Usage:
+    python benchmarks/malaria_bench.py SLIDES_DIR [--model best.pt]
+        [--backends pytorch,onnx,openvino] [--imgsz 640] [--batch-sizes 1,2,4,8]
+        [--threads 1,2,4] [--runs 3] [--annotate] [--output benchmarks/results]
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+# Python packages each backend needs (exporting ONNX also needs onnx)
+BACKEND_REQUIREMENTS = {
+    'pytorch': ('torch', 'ultralytics'),
+    'onnx': ('torch', 'ultralytics', 'onnx', 'onnxruntime'),
+    'openvino': ('torch', 'ultralytics', 'openvino'),
+}
+EXPORT_FORMATS = {'onnx': 'onnx', 'openvino': 'openvino'}
+STAGES = ('decode', 'preprocess', 'forward', 'nms', 'postprocess', 'annotate')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+
+CSV_FIELDS = ['timestamp', 'commit', 'host', 'backend', 'imgsz', 'threads', 'batch', 'images',
+              'imagesPerSecond', 'msPerImage', 'batchP50Ms', 'batchP95Ms'] + \
+             [f'{stage}Ms' for stage in STAGES] + ['loadSeconds', 'peakRssMb']
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def find_images(directory, limit):
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+def missing_requirements(backend):
+    return [name for name in BACKEND_REQUIREMENTS[backend] if importlib.util.find_spec(name) is None]
+
+
+# -- Worker: one backend / imgsz / thread count per process ----------------
+
+def set_threads(detector, backend, threads):
+    """Limit the runtime to `threads` intra-op threads (after the predictor exists)"""
+    backend_model = detector.model.predictor.model
+    if backend == 'pytorch':
+        import torch
+        torch.set_num_threads(threads)
+    elif backend == 'onnx':
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        backend_model.session = onnxruntime.InferenceSession(
+            str(backend_model.w), sess_options=options, providers=backend_model.session.get_providers())
+    elif backend == 'openvino':
+        backend_model.ov_compiled_model = backend_model.core.compile_model(
+            backend_model.ov_model, device_name='CPU',
+            config={'PERFORMANCE_HINT': 'LATENCY', 'INFERENCE_NUM_THREADS': threads})
+
+
+def run_worker(spec):
+    """Benchmark one configuration; writes its results as JSON to spec['result']"""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    from malaria_detector import MalariaDetector
+    from services.metrics import metrics
+
+    stage_times = defaultdict(list)
+    metrics.observe_stage = lambda stage, seconds: stage_times[stage].append(seconds)
+
+    images = spec['images']
+    started = time.perf_counter()
+    detector = MalariaDetector(spec['model'])
+    detector.model.overrides.update(imgsz=spec['imgsz'], device=spec['device'])
+    detector.detect_batch(images[:1], spec['conf'])  # creates the predictor
+    load_seconds = time.perf_counter() - started
+    set_threads(detector, spec['backend'], spec['threads'])
+
+    # Counts per slide at batch size 1, for the cross-backend comparison
+    counts = {}
+    for path in images:
+        result, error = detector.detect_batch([path], spec['conf'])[0]
+        counts[os.path.basename(path)] = None if error else [result['parasiteCount'],
+                                                             result['whiteBloodCellsDetected']]
+
+    batches = {}
+    for batch in spec['batch_sizes']:
+        chunks = [[images[(start + offset) % len(images)] for offset in range(batch)]
+                  for start in range(0, max(len(images), batch) * spec['runs'], batch)]
+        for chunk in chunks[:spec['warmup']]:
+            detector.detect_batch(chunk, spec['conf'], annotate=spec['annotate'])
+        stage_times.clear()
+        latencies = []
+        for chunk in chunks:
+            chunk_started = time.perf_counter()
+            detector.detect_batch(chunk, spec['conf'], annotate=spec['annotate'])
+            latencies.append(time.perf_counter() - chunk_started)
+        total_images = batch * len(chunks)
+        elapsed = sum(latencies)
+        batches[str(batch)] = {
+            'images': total_images,
+            'imagesPerSecond': round(total_images / elapsed, 3),
+            'msPerImage': round(elapsed / total_images * 1000, 3),
+            'batchP50Ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'batchP95Ms': round(percentile(latencies, 0.95) * 1000, 3),
+            # Mean milliseconds per image
+            'stagesMs': {stage: round(sum(stage_times[stage]) / total_images * 1000, 3)
+                         for stage in STAGES if stage_times.get(stage)}
+        }
+
+    with open(spec['result'], 'w', encoding='utf-8') as f:
+        json.dump({
+            'loadSeconds': round(load_seconds, 3),
+            # ru_maxrss is in KiB on Linux, bytes on macOS
+            'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+                               (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+            'counts': counts,
+            'batches': batches
+        }, f)
+
+
+# -- Orchestration ---------------------------------------------------------
+
+def export_model(model, backend, imgsz, export_dir):
+    """Export --model for backend at imgsz (cached); returns the exported path"""
+    if backend == 'pytorch':
+        return model
+    target = os.path.join(export_dir, f'{backend}-{imgsz}')
+    stem = os.path.splitext(os.path.basename(model))[0]
+    exported = os.path.join(target, f'{stem}.onnx' if backend == 'onnx' else f'{stem}_openvino_model')
+    if os.path.exists(exported):
+        return exported
+
+    from ultralytics import YOLO
+
+    os.makedirs(target, exist_ok=True)
+    copy = os.path.join(target, os.path.basename(model))
+    shutil.copyfile(model, copy)  # exports are written next to the weights
+    print(f'Exporting {backend} model at imgsz {imgsz}...')
+    path = YOLO(copy, task='detect').export(format=EXPORT_FORMATS[backend], imgsz=imgsz, dynamic=True)
+    os.remove(copy)
+    return str(path)
+
+
+def run_configuration(spec):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        spec = dict(spec, result=f.name)
+    threads = str(spec['threads'])
+    env = dict(os.environ, OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads, OPENBLAS_NUM_THREADS=threads)
+    try:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+                                 cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip()
+                               else f'worker exited with {process.returncode}')
+        with open(spec['result'], encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(spec['result'])
+
+
+def compare_counts(configurations, tolerance):
+    """Slides whose parasite/WBC counts differ from the reference backend at the same imgsz"""
+    by_imgsz = defaultdict(dict)
+    for configuration in configurations:
+        if 'counts' in configuration:
+            by_imgsz[configuration['imgsz']].setdefault(configuration['backend'], configuration['counts'])
+    mismatches = []
+    for imgsz, backends in by_imgsz.items():
+        reference_backend, reference = next(iter(backends.items()))
+        for backend, counts in backends.items():
+            if backend == reference_backend:
+                continue
+            for image, expected in reference.items():
+                actual = counts.get(image)
+                if expected is None or actual is None:
+                    if expected != actual:
+                        mismatches.append({'imgsz': imgsz, 'image': image, 'reference': reference_backend,
+                                           'backend': backend, 'expected': expected, 'actual': actual})
+                    continue
+                if any(abs(a - e) > tolerance for a, e in zip(actual, expected)):
+                    mismatches.append({'imgsz': imgsz, 'image': image, 'reference': reference_backend,
+                                       'backend': backend, 'expected': expected, 'actual': actual})
+    return mismatches
+
+
+def csv_rows(report):
+    rows = []
+    for configuration in report['configurations']:
+        for batch, stats in configuration.get('batches', {}).items():
+            row = {
+                'timestamp': report['timestamp'], 'commit': report['commit'], 'host': report['host'],
+                'backend': configuration['backend'], 'imgsz': configuration['imgsz'],
+                'threads': configuration['threads'], 'batch': int(batch),
+                'loadSeconds': configuration['loadSeconds'], 'peakRssMb': configuration['peakRssMb']
+            }
+            row.update({key: stats[key] for key in ('images', 'imagesPerSecond', 'msPerImage',
+                                                      'batchP50Ms', 'batchP95Ms')})
+            row.update({f'{stage}Ms': stats['stagesMs'].get(stage, '') for stage in STAGES})
+            rows.append(row)
+    return rows
+
+
+def write_results(report, output):
+    os.makedirs(output, exist_ok=True)
+    stamp = report['timestamp'].replace(':', '').replace('-', '')
+    json_path = os.path.join(output, f'malaria-bench-{stamp}.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    rows = csv_rows(report)
+    csv_path = os.path.join(output, f'malaria-bench-{stamp}.csv')
+    history_path = os.path.join(output, 'history.csv')
+    new_history = not os.path.exists(history_path)
+    for path, mode in ((csv_path, 'w'), (history_path, 'a')):
+        with open(path, mode, newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if mode == 'w' or new_history:
+                writer.writeheader()
+            writer.writerows(rows)
+    return json_path, csv_path
+
+
+def print_report(report):
+    print(f"\n{'backend':<9} {'imgsz':>5} {'thr':>3} {'batch':>5} {'img/s':>8} {'ms/img':>8} "
+          f"{'p95 ms':>9} {'fwd ms':>8} {'nms ms':>7} {'rss MB':>7}")
+    for configuration in report['configurations']:
+        if 'error' in configuration:
+            print(f"{configuration['backend']:<9} {configuration['imgsz']:>5} {configuration['threads'] or '-':>3} "
+                  f"failed: {configuration['error']}")
+            continue
+        for batch, stats in configuration['batches'].items():
+            stages = stats['stagesMs']
+            print(f"{configuration['backend']:<9} {configuration['imgsz']:>5} {configuration['threads']:>3} "
+                  f"{batch:>5} {stats['imagesPerSecond']:>8.2f} {stats['msPerImage']:>8.1f} "
+                  f"{stats['batchP95Ms']:>9.1f} {stages.get('forward', 0):>8.1f} {stages.get('nms', 0):>7.1f} "
+                  f"{configuration['peakRssMb']:>7.0f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--worker':
+        run_worker(json.loads(sys.argv[2]))
+        return
+
+    parser = argparse.ArgumentParser(prog='malaria-bench', description='Benchmark MalariaDetector backends on slides')
+    parser.add_argument('slides', help='Folder of slide images')
+    parser.add_argument('--model', default=os.path.join(SERVER_DIR, 'best.pt'), help='PyTorch weights')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated: pytorch,onnx,openvino')
+    parser.add_argument('--imgsz', type=int_list, default=[640], help='Comma-separated input sizes')
+    parser.add_argument('--batch-sizes', type=int_list, default=[1, 2, 4, 8], help='Comma-separated batch sizes')
+    parser.add_argument('--threads', type=int_list, default=None,
+                        help=f'Comma-separated thread counts (default 1,2,4,...,{os.cpu_count()})')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many slides')
+    parser.add_argument('--runs', type=int, default=3, help='Passes over the slides per batch size')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed batches before each batch size')
+    parser.add_argument('--conf', type=float, default=0.26, help='Confidence threshold')
+    parser.add_argument('--device', default='cpu', help='Device for the PyTorch backend')
+    parser.add_argument('--annotate', action='store_true', help='Also time plotting the annotated image')
+    parser.add_argument('--count-tolerance', type=int, default=0,
+                        help='Allowed per-slide difference in parasite/WBC counts between backends')
+    parser.add_argument('--output', default=os.path.join(SERVER_DIR, 'benchmarks', 'results'),
+                        help='Directory for JSON/CSV results and exported models')
+    args = parser.parse_args()
+
+    images = [os.path.abspath(path) for path in find_images(args.slides, args.limit)]
+    if not images:
+        raise SystemExit(f'No slide images in {args.slides}')
+    model = os.path.abspath(args.model)
+    if not os.path.exists(model):
+        raise SystemExit(f'Model not found: {model}')
+    if args.threads is None:
+        cpus = os.cpu_count() or 1
+        args.threads = sorted({1, cpus} | {2 ** i for i in range(1, cpus.bit_length()) if 2 ** i < cpus})
+
+    backends = []
+    for backend in args.backends.split(','):
+        backend = backend.strip()
+        if backend not in BACKENDS:
+            raise SystemExit(f'Unknown backend {backend!r}; choose from {", ".join(BACKENDS)}')
+        missing = missing_requirements(backend)
+        if missing:
+            print(f'Skipping {backend}: {", ".join(missing)} not installed')
+            continue
+        backends.append(backend)
+    if not backends:
+        raise SystemExit('No backend can run here')
+
+    report = {
+        'timestamp': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpuCount': os.cpu_count(),
+        'python': platform.python_version(),
+        'model': model,
+        'slides': len(images),
+        'settings': {key: getattr(args, key) for key in ('imgsz', 'batch_sizes', 'threads', 'runs', 'warmup',
+                                                         'conf', 'device', 'annotate', 'count_tolerance')},
+        'configurations': []
+    }
+    print(f'{len(images)} slides; backends {backends}, imgsz {args.imgsz}, batch sizes {args.batch_sizes}, '
+          f'threads {args.threads}')
+
+    export_dir = os.path.join(args.output, 'exports')
+    for backend in backends:
+        for imgsz in args.imgsz:
+            try:
+                path = export_model(model, backend, imgsz, export_dir)
+            except Exception as e:
+                report['configurations'].append({'backend': backend, 'imgsz': imgsz, 'threads': None,
+                                                 'error': f'export failed: {e}'})
+                continue
+            for threads in args.threads:
+                print(f'Running {backend} imgsz={imgsz} threads={threads}...')
+                configuration = {'backend': backend, 'imgsz': imgsz, 'threads': threads}
+                spec = dict(configuration, model=path, images=images, batch_sizes=args.batch_sizes,
+                            runs=args.runs, warmup=args.warmup, conf=args.conf, annotate=args.annotate,
+                            device=args.device if backend == 'pytorch' else 'cpu')
+                try:
+                    configuration.update(run_configuration(spec))
+                except Exception as e:
+                    configuration['error'] = str(e)
+                report['configurations'].append(configuration)
+
+    mismatches = compare_counts(report['configurations'], args.count_tolerance)
+    report['countMismatches'] = mismatches
+    print_report(report)
+
+    json_path, csv_path = write_results(report, args.output)
+    print(f'\nWrote {json_path} and {csv_path}')
+
+    if mismatches:
+        print(f'\n{len(mismatches)} slide(s) with different parasite/WBC counts across backends:')
+        for mismatch in mismatches[:20]:
+            print(f"  imgsz {mismatch['imgsz']} {mismatch['image']}: {mismatch['reference']} "
+                  f"{mismatch['expected']} vs {mismatch['backend']} {mismatch['actual']}")
+        sys.exit(1)
+    compared = {c['backend'] for c in report['configurations'] if 'counts' in c}
+    if len(compared) > 1:
+        print(f'Detection counts agree across {", ".join(sorted(compared))}')
+
+
+if __name__ == '__main__':
+    main()
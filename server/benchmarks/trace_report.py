@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Break slow tests down into upload, queue wait, compute and database time.
+
+Reads the spans written with TRACING_EXPORTER=file (one trace per upload
+session) and prints the slowest sessions with the time spent in each part:
+
+    upload     upload.save + upload.validate
+    queue      ai.queue (waiting for a worker, including after preemption)
+    inference  ai.inference (batcher wait + detector forward pass)
+    annotate   ai.save_annotated
+    db         db.checkpoint + db.store_results
+    job        ai.job (wall clock of the job runs)
+
+Usage:
+    python benchmarks/trace_report.py [logs/traces.jsonl] [--top 20]
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+COLUMNS = {
+    'upload': ('upload.save', 'upload.validate'),
+    'queue': ('ai.queue',),
+    'inference': ('ai.inference',),
+    'annotate': ('ai.save_annotated',),
+    'db': ('db.checkpoint', 'db.store_results'),
+    'job': ('ai.job',),
+}
+
+
+def load_traces(path):
+    traces = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                span = json.loads(line)
+                traces[span['traceId']].append(span)
+    return traces
+
+
+def summarize(spans):
+    row = {column: 0.0 for column in COLUMNS}
+    for span in spans:
+        for column, names in COLUMNS.items():
+            if span['name'] in names:
+                row[column] += span['durationMs'] / 1000
+    attributes = {}
+    for span in spans:
+        attributes.update({key: span['attributes'][key] for key in ('session_id', 'test_id')
+                           if key in span['attributes']})
+    row['session'] = attributes.get('session_id', '-')
+    row['test'] = attributes.get('test_id', '-')
+    row['images'] = sum(1 for span in spans if span['name'] == 'ai.image')
+    row['errors'] = sum(1 for span in spans if span['status'] == 'error')
+    row['total'] = row['upload'] + row['queue'] + row['job']
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise exported traces per upload session')
+    parser.add_argument('path', nargs='?', default=os.path.join('logs', 'traces.jsonl'))
+    parser.add_argument('--top', type=int, default=20, help='Slowest sessions to show')
+    args = parser.parse_args()
+
+    rows = [summarize(spans) for spans in load_traces(args.path).values()]
+    rows = [row for row in rows if row['job'] or row['upload']]  # skip batch-only traces
+    rows.sort(key=lambda row: row['total'], reverse=True)
+
+    header = f"{'session':<38} {'images':>6} {'upload':>8} {'queue':>8} {'infer':>8} {'annot':>8} {'db':>8} {'job':>8} {'err':>4}"
+    print(header)
+    print('-' * len(header))
+    for row in rows[:args.top]:
+        print(f"{str(row['session'])[:38]:<38} {row['images']:>6} {row['upload']:>8.2f} {row['queue']:>8.2f} "
+              f"{row['inference']:>8.2f} {row['annotate']:>8.2f} {row['db']:>8.2f} {row['job']:>8.2f} {row['errors']:>4}")
+    print(f"\n{len(rows)} sessions; times in seconds")
+
+
+if __name__ == '__main__':
+    main()
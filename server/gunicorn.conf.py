@@ -0,0 +1,86 @@
+"""
+Gunicorn configuration for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Worker model: threaded workers (gthread). API requests are I/O bound
+(database, uploads) and are served by GUNICORN_THREADS threads, while AI
+analysis runs in each worker's background queue with its own copy of the
+model. Every worker therefore holds the model exactly once, loaded after the
+fork, so GUNICORN_WORKERS multiplies model memory. The analysis queue and
+job progress are in-process, so keep one worker unless progress polling can
+tolerate landing on a different worker (it then falls back to the upload
+session stored in the database).
+
+preload_app imports the application once in the master so workers fork
+quickly and share its memory; the model is never loaded in the master, each
+worker loads it in a background thread after the fork.
+
+Reloading:
+    kill -HUP <master>   restarts workers gracefully; in-flight requests and
+                         the current AI job get GUNICORN_GRACEFUL_TIMEOUT
+                         seconds. With preload_app the application code is
+                         not re-imported, so for a code deploy either set
+                         GUNICORN_PRELOAD=false or use USR2 followed by
+                         WINCH/QUIT on the old master.
+"""
+
+import os
+import sys
+
+bind = os.getenv('GUNICORN_BIND', f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}")
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# graceful_timeout lets a running AI job finish before a worker is replaced
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 120))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycling a worker reloads the model, so this is off unless asked for
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+WARM_MODEL = os.getenv('GUNICORN_WARM_MODEL', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    # The master only supervises; background jobs belong to the workers
+    from services.audit_retention import audit_retention
+    audit_retention.stop()
+    server.log.info(f"Serving with {workers} gthread worker(s) x {threads} threads, preload={preload_app}")
+
+
+def post_fork(server, worker):
+    # Pooled connections opened in the master (create_all) must not be
+    # shared with the children; drop them without closing the master's
+    from wsgi import app
+    from models import db
+    from services.audit_retention import audit_retention
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    audit_retention.start()
+
+
+def post_worker_init(worker):
+    # Start loading the model in the background; the worker serves health
+    # checks and logins meanwhile and /api/health/ready reports when it is done.
+    # This also starts the thread that renews AI job leases and resumes jobs
+    # left behind by a worker that died.
+    from wsgi import app
+    from services.ai_analysis import ai_service
+    ai_service.start(app, load_model=WARM_MODEL)
+
+
+def worker_exit(server, worker):
+    # Only wait for the queue if this worker ever loaded the AI service
+    ai_analysis = sys.modules.get('services.ai_analysis')
+    if ai_analysis is not None:
+        ai_analysis.ai_service.shutdown(timeout=graceful_timeout)
@@ -0,0 +1,179 @@
+import os
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Optional brotli encoder (either the C binding or the cffi one)
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Only text-like payloads are worth compressing; images are already compressed
+COMPRESSIBLE_MIME_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/msgpack',
+    'application/x-msgpack',
+    'application/javascript',
+    'text/csv',
+    'text/html',
+    'text/plain',
+    'text/xml',
+}
+
+# Event streams must reach the client as soon as each event is written
+NEVER_COMPRESS_MIME_TYPES = {'text/event-stream'}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ResponseCompressor:
+    """Compress API responses with brotli or gzip based on Accept-Encoding.
+
+    Buffered bodies below COMPRESS_MIN_SIZE are sent as-is; bodies above
+    COMPRESS_STREAM_THRESHOLD, and responses that are already streamed
+    (exports), are compressed chunk by chunk so the whole compressed body is
+    never held in memory.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.stream_threshold = 512 * 1024
+        self.gzip_level = 6
+        self.brotli_quality = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true')
+        app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+        app.config.setdefault('COMPRESS_STREAM_THRESHOLD', int(os.getenv('COMPRESS_STREAM_THRESHOLD', 512 * 1024)))
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', int(os.getenv('COMPRESS_GZIP_LEVEL', 6)))
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', int(os.getenv('COMPRESS_BROTLI_QUALITY', 5)))
+
+        if not app.config['COMPRESS_ENABLED']:
+            logger.info("Response compression disabled")
+            return
+
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.stream_threshold = app.config['COMPRESS_STREAM_THRESHOLD']
+        self.gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+        app.after_request(self.after_request)
+        app.extensions['compression'] = self
+        logger.info(f"Response compression enabled (gzip{', br' if brotli else ''}, min {self.min_size} bytes)")
+
+    def available_encodings(self):
+        """Encodings this server can produce, in order of preference"""
+        return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def choose_encoding(self, accept_encodings):
+        """Pick the best encoding the client accepts, or None"""
+        return accept_encodings.best_match(self.available_encodings())
+
+    def make_compressor(self, encoding):
+        """Incremental compressor exposing compress(bytes) and flush()"""
+        if encoding == 'br':
+            return _BrotliCompressor(self.brotli_quality)
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+
+    def should_compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype in NEVER_COMPRESS_MIME_TYPES:
+            return False
+        if response.mimetype not in COMPRESSIBLE_MIME_TYPES:
+            return False
+        if response.is_streamed:
+            return True
+        return response.content_length is None or response.content_length >= self.min_size
+
+    def after_request(self, response):
+        from flask import request
+
+        response.vary.add('Accept-Encoding')
+        if request.method == 'HEAD' or not self.should_compress(response):
+            return response
+
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        try:
+            if response.is_streamed:
+                self._compress_stream(response, response.response, encoding)
+            else:
+                body = response.get_data()
+                if len(body) < self.min_size:
+                    return response
+                if len(body) >= self.stream_threshold:
+                    self._compress_stream(response, _chunks(body), encoding)
+                else:
+                    compressor = self.make_compressor(encoding)
+                    response.set_data(compressor.compress(body) + compressor.flush())
+                    response.headers['Content-Encoding'] = encoding
+        except Exception as e:
+            logger.error(f"Response compression failed, sending uncompressed: {str(e)}")
+            return response
+
+        return response
+
+    def _compress_stream(self, response, chunks, encoding):
+        response.response = _compress_chunks(chunks, self.make_compressor(encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        # Make sure Werkzeug iterates the generator rather than joining it
+        response.implicit_sequence_conversion = False
+
+
+class _BrotliCompressor:
+    """Adapter giving brotli the same compress()/flush() interface as zlib"""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def _chunks(body, size=STREAM_CHUNK_SIZE):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def _compress_chunks(chunks, compressor):
+    """Compress an iterable of str/bytes chunks, closing the source when done"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip an iterable of str/bytes chunks incrementally (for .gz downloads)"""
+    return _compress_chunks(chunks, zlib.compressobj(level, zlib.DEFLATED, 31))
+
+
+def init_compression(app):
+    """Register response compression on the app"""
+    return ResponseCompressor(app)
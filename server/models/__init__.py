@@ -10,6 +10,11 @@ from .user import User
 from .patient import Patient
 from .test import Test
 from .diagnosis_result import DiagnosisResult
+from .diagnosis_image import DiagnosisImage
 from .upload_session import UploadSession
+from .id_sequence import IdSequence
+from .analysis_job import AnalysisJob
+from .analysis_checkpoint import AnalysisCheckpoint
 
-__all__ = ['db', 'bcrypt', 'User', 'Patient', 'Test', 'DiagnosisResult', 'UploadSession']
+__all__ = ['db', 'bcrypt', 'User', 'Patient', 'Test', 'DiagnosisResult', 'DiagnosisImage', 'UploadSession', 'IdSequence',
+           'AnalysisJob', 'AnalysisCheckpoint']
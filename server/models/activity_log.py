@@ -2,6 +2,7 @@ from datetime import datetime
 import uuid
 
 from . import db
+from .activity_log_rollup import ActivityLogRollup
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
@@ -15,7 +16,7 @@ class ActivityLog(db.Model):
     
     # User Information
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    user_info = db.Column(db.JSON, nullable=False)  # {username, email, role, permissions}
+    user_info = db.Column(db.JSON, nullable=False)  # {username, email, role, firstName, lastName, department}
     
     # Resource Information
     resource_type = db.Column(db.String(50), nullable=False)  # patient, test, upload, diagnosis, etc.
@@ -29,7 +30,7 @@ class ActivityLog(db.Model):
     request_info = db.Column(db.JSON, nullable=False)  # {ipAddress, userAgent, method, endpoint}
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
     # Relationships
     user = db.relationship('User', backref='activity_logs', lazy=True)
@@ -81,7 +82,7 @@ class ActivityLog(db.Model):
             'resourceName': self.resource_name,
             'details': self.details,
             'requestInfo': self.request_info,
-            'createdAt': self.created_at.isoformat() if self.created_at else None
+            'createdAt': self.created_at
         }
     
     @staticmethod
@@ -104,6 +105,9 @@ class ActivityLog(db.Model):
             )
             
             db.session.add(log)
+            ActivityLogRollup.add_counts([{
+                'action': action, 'resource_type': resource_type, 'status': status, 'risk_level': risk_level
+            }])
             db.session.commit()
             return log
             
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from . import db
+
+class ActivityLogArchive(db.Model):
+    """One archived month of activity logs, moved out of activity_logs into a compressed file"""
+    __tablename__ = 'activity_log_archives'
+
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    status = db.Column(db.String(20), default='running', nullable=False)  # running, archived, failed
+    row_count = db.Column(db.Integer, default=0, nullable=False)
+    path = db.Column(db.String(500))
+    sha256 = db.Column(db.String(64))
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    archived_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'month': self.month,
+            'status': self.status,
+            'rowCount': self.row_count,
+            'path': self.path,
+            'sha256': self.sha256,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'archivedAt': self.archived_at
+        }
+
+    def __repr__(self):
+        return f'<ActivityLogArchive {self.month}: {self.status}>'
@@ -0,0 +1,125 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+
+class ActivityLogRollup(db.Model):
+    """Daily activity counts by action, resource type, status and risk level"""
+    __tablename__ = 'activity_log_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    action = db.Column(db.String(100), primary_key=True)
+    resource_type = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    risk_level = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+    KEY_COLUMNS = ('day', 'action', 'resource_type', 'status', 'risk_level')
+    _backfilled = False
+
+    @staticmethod
+    def add_counts(records):
+        """Add activity log records (dicts with ActivityLog column names) to the rollups.
+
+        Runs in the caller's transaction so rollups commit together with the
+        logs they count.
+        """
+        counts = Counter(
+            (
+                (record.get('created_at') or datetime.utcnow()).date(),
+                record['action'],
+                record['resource_type'],
+                record.get('status') or 'success',
+                record.get('risk_level') or 'low'
+            )
+            for record in records
+        )
+        if not counts:
+            return
+
+        table = ActivityLogRollup.__table__
+        values = [dict(zip(ActivityLogRollup.KEY_COLUMNS, key), count=count) for key, count in counts.items()]
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+            statement = insert(table).values(values)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(ActivityLogRollup.KEY_COLUMNS),
+                set_={'count': table.c['count'] + statement.excluded['count']}
+            )
+            db.session.execute(statement)
+            return
+
+        for value in values:
+            key = [table.c[column] == value[column] for column in ActivityLogRollup.KEY_COLUMNS]
+            updated = db.session.execute(
+                table.update().where(*key).values(count=table.c['count'] + value['count'])
+            )
+            if updated.rowcount == 0:
+                db.session.execute(table.insert().values(**value))
+
+    @staticmethod
+    def rebuild(start_day=None, end_day=None):
+        """Recompute rollups from activity_logs for [start_day, end_day) (all days when omitted).
+
+        Days whose logs have been archived are left untouched unless they
+        fall inside the requested range.
+        """
+        from .activity_log import ActivityLog
+
+        table = ActivityLogRollup.__table__
+        day = db.func.date(ActivityLog.created_at, type_=db.Date)
+        source = db.select(
+            day.label('day'), ActivityLog.action, ActivityLog.resource_type,
+            ActivityLog.status, ActivityLog.risk_level, db.func.count().label('count')
+        ).group_by(day, ActivityLog.action, ActivityLog.resource_type, ActivityLog.status, ActivityLog.risk_level)
+
+        delete = table.delete()
+        if start_day is not None:
+            source = source.where(ActivityLog.created_at >= start_day)
+            delete = delete.where(table.c.day >= start_day)
+        if end_day is not None:
+            source = source.where(ActivityLog.created_at < end_day)
+            delete = delete.where(table.c.day < end_day)
+
+        db.session.execute(delete)
+        inserted = db.session.execute(table.insert().from_select(
+            ['day', 'action', 'resource_type', 'status', 'risk_level', 'count'], source
+        ))
+        db.session.commit()
+        return inserted.rowcount
+
+    @staticmethod
+    def ensure_backfilled():
+        """Build rollups for logs written before rollups existed (once per process)"""
+        if ActivityLogRollup._backfilled:
+            return
+        from .activity_log import ActivityLog
+
+        first_log = db.session.execute(db.select(db.func.min(ActivityLog.created_at))).scalar()
+        first_rollup = db.session.execute(db.select(db.func.min(ActivityLogRollup.day))).scalar()
+        if first_log is not None and (first_rollup is None or first_log.date() < first_rollup):
+            # The first rolled-up day may only be partly counted, so recount it as well
+            end_day = first_rollup + timedelta(days=1) if first_rollup else None
+            ActivityLogRollup.rebuild(first_log.date(), end_day)
+        ActivityLogRollup._backfilled = True
+
+    @staticmethod
+    def totals(start_day, end_day=None):
+        """Counts per (action, resource_type, status, risk_level) for [start_day, end_day)"""
+        table = ActivityLogRollup.__table__
+        statement = db.select(
+            table.c.action, table.c.resource_type, table.c.status, table.c.risk_level,
+            db.func.sum(table.c['count'])
+        ).where(table.c.day >= start_day)
+        if end_day is not None:
+            statement = statement.where(table.c.day < end_day)
+        statement = statement.group_by(table.c.action, table.c.resource_type, table.c.status, table.c.risk_level)
+        return db.session.execute(statement).all()
+
+    def __repr__(self):
+        return f'<ActivityLogRollup {self.day} {self.action}/{self.resource_type}: {self.count}>'
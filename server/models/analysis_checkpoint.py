@@ -0,0 +1,63 @@
+from datetime import datetime
+import uuid
+
+from . import db
+
+class AnalysisCheckpoint(db.Model):
+    """Detection result for one image of a running AI job, saved as soon as it is computed.
+
+    A job that is preempted, interrupted or restarted skips the images that
+    already have a checkpoint. Failed images are not checkpointed, so they
+    are tried again when the job resumes. Checkpoints are removed once the job's
+    DiagnosisResult has been stored, or when the job is cancelled.
+    """
+    __tablename__ = 'analysis_checkpoints'
+    __table_args__ = (db.UniqueConstraint('session_id', 'image_path', name='uq_analysis_checkpoint_image'),)
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    session_id = db.Column(db.String(50), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    image_path = db.Column(db.String(500), nullable=False)
+    result = db.Column(db.JSON)  # detectAndQuantify() shape, plus image metadata
+    error = db.Column(db.Text)  # only set by older versions; such rows are ignored
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @staticmethod
+    def for_session(session_id):
+        """Successful checkpoints of a session keyed by image path"""
+        checkpoints = db.session.execute(
+            db.select(AnalysisCheckpoint).where(AnalysisCheckpoint.session_id == session_id,
+                                                AnalysisCheckpoint.error.is_(None))
+        ).scalars()
+        return {checkpoint.image_path: checkpoint for checkpoint in checkpoints}
+
+    @staticmethod
+    def count(session_id, image_paths):
+        """Number of the given images that already have a successful checkpoint"""
+        if not image_paths:
+            return 0
+        return db.session.execute(
+            db.select(db.func.count()).select_from(AnalysisCheckpoint).where(
+                AnalysisCheckpoint.session_id == session_id,
+                AnalysisCheckpoint.image_path.in_(image_paths),
+                AnalysisCheckpoint.error.is_(None))
+        ).scalar()
+
+    @staticmethod
+    def save(session_id, position, image_path, result):
+        """Persist one image's result, replacing an older row for the image (commits)"""
+        db.session.execute(db.delete(AnalysisCheckpoint).where(
+            AnalysisCheckpoint.session_id == session_id, AnalysisCheckpoint.image_path == image_path
+        ))
+        db.session.add(AnalysisCheckpoint(
+            session_id=session_id, position=position, image_path=image_path, result=result
+        ))
+        db.session.commit()
+
+    @staticmethod
+    def clear(session_id):
+        db.session.execute(db.delete(AnalysisCheckpoint).where(AnalysisCheckpoint.session_id == session_id))
+
+    def __repr__(self):
+        return f'<AnalysisCheckpoint {self.session_id}#{self.position}>'
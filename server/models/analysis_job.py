@@ -0,0 +1,109 @@
+from datetime import datetime
+
+from . import db
+
+ACTIVE_JOB_STATUSES = ('queued', 'processing')
+
+class AnalysisJob(db.Model):
+    """Durable record of an AI analysis job, used to cancel and resume it across processes.
+
+    The process running a job (owner) refreshes heartbeat_at while the job
+    is queued or processing; a job whose heartbeat has gone stale, or whose
+    owner process is gone, is taken over and resumed by another process.
+    """
+    __tablename__ = 'analysis_jobs'
+
+    session_id = db.Column(db.String(50), primary_key=True)
+    test_id = db.Column(db.String(36), index=True)
+    priority = db.Column(db.String(20), default='normal', nullable=False)
+    image_paths = db.Column(db.JSON, default=[])
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, processing, completed, failed, cancelled
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    error = db.Column(db.Text)
+
+    owner = db.Column(db.String(100))  # hostname:pid
+    heartbeat_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def start(session_id, test_id, priority, image_paths, owner):
+        """Create or re-queue the job row for a session (commits)"""
+        job = db.session.get(AnalysisJob, session_id)
+        if job is None:
+            job = AnalysisJob(session_id=session_id)
+            db.session.add(job)
+        job.test_id = test_id
+        job.priority = priority
+        job.image_paths = list(image_paths)
+        job.status = 'queued'
+        job.cancel_requested = False
+        job.error = None
+        job.owner = owner
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def set_status(session_id, status, error=None):
+        db.session.execute(
+            db.update(AnalysisJob).where(AnalysisJob.session_id == session_id)
+            .values(status=status, error=error, heartbeat_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    @staticmethod
+    def request_cancel(session_id):
+        """Flag an active job for cancellation; True if there was one"""
+        updated = db.session.execute(
+            db.update(AnalysisJob)
+            .where(AnalysisJob.session_id == session_id, AnalysisJob.status.in_(ACTIVE_JOB_STATUSES))
+            .values(cancel_requested=True, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return updated.rowcount > 0
+
+    @staticmethod
+    def is_cancel_requested(session_id):
+        return bool(db.session.execute(
+            db.select(AnalysisJob.cancel_requested).where(AnalysisJob.session_id == session_id)
+        ).scalar())
+
+    @staticmethod
+    def heartbeat(session_ids, owner):
+        """Refresh the lease on this process's active jobs"""
+        if not session_ids:
+            return
+        db.session.execute(
+            db.update(AnalysisJob)
+            .where(AnalysisJob.session_id.in_(list(session_ids)), AnalysisJob.owner == owner,
+                   AnalysisJob.status.in_(ACTIVE_JOB_STATUSES))
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    @staticmethod
+    def active():
+        return db.session.execute(
+            db.select(AnalysisJob).where(AnalysisJob.status.in_(ACTIVE_JOB_STATUSES))
+            .order_by(AnalysisJob.created_at)
+        ).scalars().all()
+
+    @staticmethod
+    def claim(session_id, owner, previous_owner, previous_heartbeat):
+        """Take over a job if nobody else has since; True when this process now owns it"""
+        claimed = db.session.execute(
+            db.update(AnalysisJob)
+            .where(AnalysisJob.session_id == session_id,
+                   AnalysisJob.status.in_(ACTIVE_JOB_STATUSES),
+                   AnalysisJob.owner.is_(None) if previous_owner is None else AnalysisJob.owner == previous_owner,
+                   AnalysisJob.heartbeat_at.is_(None) if previous_heartbeat is None
+                   else AnalysisJob.heartbeat_at == previous_heartbeat)
+            .values(owner=owner, heartbeat_at=datetime.utcnow(), status='queued')
+        )
+        db.session.commit()
+        return claimed.rowcount == 1
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.session_id}: {self.status}>'
@@ -0,0 +1,158 @@
+from array import array
+from datetime import datetime
+import sys
+import uuid
+
+from . import db
+
+# Packed box layout: one float32 row per detection
+BOX_FIELDS = ('xMin', 'yMin', 'xMax', 'yMax', 'confidence', 'classId')
+BOX_CLASSES = ('PF', 'PM', 'PO', 'PV', 'WBC')
+WBC_CLASS_ID = BOX_CLASSES.index('WBC')
+UNKNOWN_CLASS_ID = -1  # Only for legacy JSON detections; packed boxes never use it
+
+
+def float32_decimal(value):
+    """Shortest decimal that packs to the same float32 as `value`.
+
+    Packing keeps about 7 significant digits, so 0.9 unpacks as
+    0.8999999761581421; this returns 0.9 again. Any value written with up
+    to 6 significant digits reads back exactly.
+    """
+    for digits in (6, 7, 8):
+        candidate = float(f'{value:.{digits}g}')
+        if array('f', (candidate,))[0] == value:
+            return candidate
+    return float(f'{value:.9g}')
+
+
+class DiagnosisImage(db.Model):
+    """Per-image detection header with bounding boxes packed as float32 rows"""
+    __tablename__ = 'diagnosis_images'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    diagnosis_result_id = db.Column(db.String(36), db.ForeignKey('diagnosis_results.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # Order of the image within the result
+
+    image_id = db.Column(db.String(100))
+    original_filename = db.Column(db.String(255))
+    image_quality = db.Column(db.Float)
+    annotated_image_url = db.Column(db.String(500))
+
+    # Header counts so summaries never have to unpack boxes
+    parasite_count = db.Column(db.Integer, default=0, nullable=False)
+    wbc_count = db.Column(db.Integer, default=0, nullable=False)
+    box_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Little-endian float32 rows laid out as BOX_FIELDS; only loaded on request
+    boxes = db.deferred(db.Column(db.LargeBinary))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    diagnosis_result = db.relationship('DiagnosisResult', back_populates='images', lazy=True)
+
+    @staticmethod
+    def class_id_for(box_type):
+        """Map a detection type (PF, WBC, ...) to its packed class id.
+
+        Raises ValueError for a type outside BOX_CLASSES rather than storing
+        a box that could not be read back as what was written.
+        """
+        normalized = (box_type or '').upper()
+        if normalized not in BOX_CLASSES:
+            raise ValueError(f"Unknown detection type {box_type!r}; expected one of {', '.join(BOX_CLASSES)}")
+        return BOX_CLASSES.index(normalized)
+
+    @staticmethod
+    def pack_boxes(detections):
+        """Pack detection dicts ({type, confidence, bbox}) into float32 bytes"""
+        packed = array('f')
+        for detection in detections:
+            bbox = detection.get('bbox') or [0, 0, 0, 0]
+            packed.extend((
+                float(bbox[0]), float(bbox[1]), float(bbox[2]), float(bbox[3]),
+                float(detection.get('confidence') or 0),
+                float(DiagnosisImage.class_id_for(detection.get('type')))
+            ))
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return packed.tobytes()
+
+    def set_boxes(self, parasites_detected, wbcs_detected):
+        """Store parasite and WBC detections as one packed blob"""
+        detections = list(parasites_detected or []) + list(wbcs_detected or [])
+        self.boxes = self.pack_boxes(detections)
+        self.box_count = len(detections)
+
+    def box_rows(self):
+        """Unpack boxes into rows of [xMin, yMin, xMax, yMax, confidence, classId] as stored"""
+        if not self.boxes:
+            return []
+        packed = array('f')
+        packed.frombytes(self.boxes)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+
+        width = len(BOX_FIELDS)
+        return [packed[i:i + width - 1].tolist() + [int(packed[i + width - 1])]
+                for i in range(0, len(packed), width)]
+
+    @staticmethod
+    def split_rows(rows):
+        """Turn box rows into (parasitesDetected, wbcsDetected) dict lists"""
+        parasites = []
+        wbcs = []
+        for x_min, y_min, x_max, y_max, confidence, class_id in rows:
+            box = {
+                'type': BOX_CLASSES[class_id],
+                'confidence': confidence,
+                'bbox': [x_min, y_min, x_max, y_max]
+            }
+            if class_id == WBC_CLASS_ID:
+                wbcs.append(box)
+            else:
+                parasites.append(box)
+        return parasites, wbcs
+
+    def split_boxes(self):
+        """Unpack boxes into (parasitesDetected, wbcsDetected) dict lists as stored"""
+        return self.split_rows(self.box_rows())
+
+    @staticmethod
+    def rows_from_detections(parasites_detected, wbcs_detected):
+        """Compact rows for detections that are still held as dicts (legacy JSON results)"""
+        rows = []
+        for detection in list(parasites_detected or []) + list(wbcs_detected or []):
+            bbox = detection.get('bbox') or [0, 0, 0, 0]
+            box_type = (detection.get('type') or '').upper()
+            rows.append([bbox[0], bbox[1], bbox[2], bbox[3], detection.get('confidence'),
+                         BOX_CLASSES.index(box_type) if box_type in BOX_CLASSES else UNKNOWN_CLASS_ID])
+        return rows
+
+    def to_dict(self, include_boxes=True, compact=False):
+        """Convert to the per-image detection shape used by the API.
+
+        With compact set, boxes are returned as a single 'boxes' list of
+        BOX_FIELDS rows instead of per-box parasite/WBC dicts. Box values are
+        given as the shortest decimals that pack to the stored float32s.
+        """
+        data = {
+            'imageId': self.image_id,
+            'originalFilename': self.original_filename,
+            'whiteBloodCellsDetected': self.wbc_count,
+            'totalParasites': self.parasite_count,
+            'imageQuality': self.image_quality
+        }
+        if include_boxes:
+            rows = [[float32_decimal(value) for value in row[:-1]] + row[-1:] for row in self.box_rows()]
+            if compact:
+                data['boxes'] = rows
+            else:
+                data['parasitesDetected'], data['wbcsDetected'] = self.split_rows(rows)
+        if self.annotated_image_url:
+            data['annotatedImageUrl'] = self.annotated_image_url
+        return data
+
+    def __repr__(self):
+        return f'<DiagnosisImage {self.image_id}: {self.box_count} boxes>'
@@ -1,7 +1,10 @@
 from datetime import datetime
 import uuid
 
+from sqlalchemy import inspect
+
 from . import db
+from .diagnosis_image import DiagnosisImage
 
 class DiagnosisResult(db.Model):
     __tablename__ = 'diagnosis_results'
@@ -17,8 +20,8 @@ class DiagnosisResult(db.Model):
     
     parasite_wbc_ratio = db.Column(db.Float)
     
-    # Detections as JSON array
-    detections = db.Column(db.JSON, default=[])  # Array of detection objects
+    # Legacy detections JSON array; new results store boxes in diagnosis_images
+    legacy_detections = db.deferred(db.Column('detections', db.JSON, default=[]))
     
     total_parasites = db.Column(db.Integer, default=0)
     total_wbcs = db.Column(db.Integer, default=0)
@@ -37,29 +40,19 @@ class DiagnosisResult(db.Model):
     
     # Relationships
     test = db.relationship('Test', back_populates='diagnosis_result', uselist=False, lazy=True)
+    images = db.relationship('DiagnosisImage', back_populates='diagnosis_result', lazy=True,
+                             order_by='DiagnosisImage.position', cascade='all, delete-orphan')
     
     def __init__(self, **kwargs):
         super(DiagnosisResult, self).__init__(**kwargs)
     
     def add_detection(self, image_id, original_filename, parasites_detected, wbcs_detected, 
                       white_blood_cells_count, total_parasites, image_quality, annotated_image_url=None):
-        """Add a detection result for an image"""
-        if not self.detections:
-            self.detections = []
-        
-        detection = {
-            'imageId': image_id,
-            'originalFilename': original_filename,
-            'parasitesDetected': parasites_detected or [],
-            'wbcsDetected': wbcs_detected or [],
-            'whiteBloodCellsDetected': white_blood_cells_count,
-            'totalParasites': total_parasites,
-            'imageQuality': image_quality
-        }
-        if annotated_image_url:
-            detection['annotatedImageUrl'] = annotated_image_url
-        
-        self.detections.append(detection)
+        """Add a detection result for an image.
+
+        Each image becomes a DiagnosisImage row with its boxes packed as
+        float32; the rows are inserted in one batch when the result is flushed.
+        """
         # Initialize totals if they are None
         if self.total_parasites is None:
             self.total_parasites = 0
@@ -78,6 +71,18 @@ class DiagnosisResult(db.Model):
             safe_total_parasites = 0
             safe_white_blood_cells_count = 0
         
+        image = DiagnosisImage(
+            position=len(self.images),
+            image_id=image_id,
+            original_filename=original_filename,
+            image_quality=image_quality,
+            annotated_image_url=annotated_image_url,
+            parasite_count=safe_total_parasites,
+            wbc_count=safe_white_blood_cells_count
+        )
+        image.set_boxes(parasites_detected, wbcs_detected)
+        self.images.append(image)
+        
         # Update totals safely
         self.total_parasites += safe_total_parasites
         self.total_wbcs += safe_white_blood_cells_count
@@ -128,11 +133,50 @@ class DiagnosisResult(db.Model):
         else:
             self.confidence = 0
     
-    def to_dict(self):
+    def get_detections(self, include_boxes=True, compact=False):
+        """Per-image detections in API shape.
+
+        Each call queries the images again, so callers that need the list
+        more than once keep the result. Boxes are a deferred column, so they are only read (in one query)
+        when include_boxes is set; compact returns them as BOX_FIELDS rows.
+        Results stored before diagnosis_images existed fall back to the
+        legacy JSON column.
+        """
+        if inspect(self).persistent:
+            images = self._query_images(include_boxes)
+        else:
+            # Not flushed yet: the images and their boxes are still in memory
+            images = self.images
+        
+        if images:
+            return [image.to_dict(include_boxes=include_boxes, compact=compact) for image in images]
+        if not inspect(self).persistent:
+            return []
+        
+        legacy = self.legacy_detections or []
+        if include_boxes and not compact:
+            return legacy
+        detections = []
+        for detection in legacy:
+            detection = dict(detection)
+            parasites = detection.pop('parasitesDetected', [])
+            wbcs = detection.pop('wbcsDetected', [])
+            if include_boxes:
+                detection['boxes'] = DiagnosisImage.rows_from_detections(parasites, wbcs)
+            detections.append(detection)
+        return detections
+    
+    def _query_images(self, include_boxes):
+        query = DiagnosisImage.query.filter_by(diagnosis_result_id=self.id).order_by(DiagnosisImage.position)
+        if include_boxes:
+            query = query.options(db.undefer(DiagnosisImage.boxes))
+        return query.all()
+    
+    def to_dict(self, include_test=True, include_boxes=True):
         """Convert diagnosis result object to dictionary"""
         return {
             'id': self.id,
-            'test': self.test.to_dict() if self.test else None,
+            'test': self.test.to_dict() if include_test and self.test else None,
             'testId': self.test_id,
             'status': self.status,
             'mostProbableParasite': {
@@ -141,7 +185,7 @@ class DiagnosisResult(db.Model):
                 'fullName': self.most_probable_parasite_full_name
             } if self.most_probable_parasite_type else None,
             'parasiteWbcRatio': self.parasite_wbc_ratio,
-            'detections': self.detections or [],
+            'detections': self.get_detections(include_boxes=include_boxes),
             'totalParasites': self.total_parasites,
             'totalWbcs': self.total_wbcs,
             'severity': {
@@ -152,8 +196,8 @@ class DiagnosisResult(db.Model):
             'confidence': self.confidence,
             'processingTime': self.processing_time,
             'modelVersion': self.model_version,
-            'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
     
     def to_dict_summary(self):
@@ -172,7 +216,7 @@ class DiagnosisResult(db.Model):
                 'score': self.severity_score
             } if self.severity_level else None,
             'confidence': self.confidence,
-            'createdAt': self.created_at.isoformat()
+            'createdAt': self.created_at
         }
     
     @staticmethod
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+
+class IdSequence(db.Model):
+    """Daily counters backing the human-readable TEST-/PAT-/SESS- identifiers"""
+    __tablename__ = 'id_sequences'
+
+    prefix = db.Column(db.String(10), primary_key=True)  # TEST, PAT, SESS
+    day = db.Column(db.String(8), primary_key=True)  # YYYYMMDD
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+    @staticmethod
+    def next_id(prefix, id_column, when=None):
+        """Allocate the next ID in format PREFIX-YYYYMMDD-XXX.
+
+        The counter row is bumped with a single UPDATE inside the caller's
+        transaction, so concurrent allocations serialise on the row instead
+        of racing on a COUNT/MAX over the owning table. ``id_column`` is only
+        read once per prefix and day, to seed the counter from IDs that were
+        issued before the counter row existed.
+        """
+        date_str = (when or datetime.now()).strftime('%Y%m%d')
+        value = IdSequence._increment(prefix, date_str)
+
+        if value is None:
+            seed = IdSequence._highest_issued(prefix, date_str, id_column)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(IdSequence(prefix=prefix, day=date_str, value=seed + 1))
+                value = seed + 1
+            except IntegrityError:
+                # Another request created today's row first; take the next value from it
+                value = IdSequence._increment(prefix, date_str)
+
+        return f'{prefix}-{date_str}-{value:03d}'
+
+    @staticmethod
+    def _increment(prefix, date_str):
+        """Bump an existing counter row and return its new value, or None if missing"""
+        table = IdSequence.__table__
+        result = db.session.execute(
+            table.update()
+            .where(table.c.prefix == prefix, table.c.day == date_str)
+            .values(value=table.c.value + 1)
+        )
+        if result.rowcount == 0:
+            return None
+
+        return db.session.execute(
+            db.select(table.c.value).where(table.c.prefix == prefix, table.c.day == date_str)
+        ).scalar_one()
+
+    @staticmethod
+    def _highest_issued(prefix, date_str, id_column):
+        """Highest numeric suffix already issued for a prefix and day"""
+        pattern = f'{prefix}-{date_str}-'
+        existing = db.session.execute(
+            db.select(id_column).where(id_column.like(f'{pattern}%'))
+        ).scalars()
+
+        highest = 0
+        for issued_id in existing:
+            suffix = issued_id[len(pattern):]
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
+
+    def __repr__(self):
+        return f'<IdSequence {self.prefix}-{self.day}: {self.value}>'
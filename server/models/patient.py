@@ -2,6 +2,7 @@ from datetime import datetime
 import uuid
 
 from . import db
+from .id_sequence import IdSequence
 
 class Patient(db.Model):
     __tablename__ = 'patients'
@@ -43,15 +44,7 @@ class Patient(db.Model):
     
     def generate_patient_id(self):
         """Generate a unique patient ID in format PAT-YYYYMMDD-XXX"""
-        today = datetime.now()
-        date_str = today.strftime('%Y%m%d')
-        
-        # Find the next available number for today
-        existing_patients = Patient.query.filter(
-            Patient.patient_id.like(f'PAT-{date_str}-%')
-        ).count()
-        
-        return f'PAT-{date_str}-{existing_patients + 1:03d}'
+        return IdSequence.next_id('PAT', Patient.patient_id)
     
     def calculate_age(self):
         """Calculate age from date of birth"""
@@ -82,20 +75,20 @@ class Patient(db.Model):
             'patientId': self.patient_id,
             'firstName': self.first_name,
             'lastName': self.last_name,
-            'dateOfBirth': self.date_of_birth.isoformat() if self.date_of_birth is not None else None,
+            'dateOfBirth': self.date_of_birth,
             'gender': self.gender,
             'age': self.age,
             'phoneNumber': self.phone_number,
             'email': self.email,
             'totalTests': self.total_tests,
             'positiveTests': self.positive_tests,
-            'lastTestDate': self.last_test_date.isoformat() if self.last_test_date else None,
+            'lastTestDate': self.last_test_date,
             'lastTestResult': self.last_test_result,
             'tests': [test.to_dict_summary() for test in self.tests] if hasattr(self, 'tests') and self.tests else [],
             'createdBy': self.creator.to_dict_public() if hasattr(self, 'creator') and self.creator else None,
             'updatedBy': self.updater.to_dict_public() if hasattr(self, 'updater') and self.updater else None,
-            'createdAt': self.created_at.isoformat() if self.created_at is not None else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at is not None else None
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
     
     def to_dict_summary(self):
@@ -105,21 +98,27 @@ class Patient(db.Model):
             'patientId': self.patient_id,
             'firstName': self.first_name,
             'lastName': self.last_name,
-            'dateOfBirth': self.date_of_birth.isoformat() if self.date_of_birth is not None else None,
+            'dateOfBirth': self.date_of_birth,
             'age': self.age,
             'gender': self.gender,
             'phoneNumber': self.phone_number,
             'email': self.email,
             'totalTests': self.total_tests,
             'positiveTests': self.positive_tests,
-            'lastTestDate': self.last_test_date.isoformat() if self.last_test_date is not None else None,
+            'lastTestDate': self.last_test_date,
             'lastTestResult': self.last_test_result,
-            'createdAt': self.created_at.isoformat() if self.created_at is not None else None
+            'createdAt': self.created_at
         }
     
     @staticmethod
     def search_patients(query, limit=20):
-        """Search patients by name, ID, or phone number"""
+        """Search patients by name, ID, or phone number (indexed, prefix matches first)"""
+        from services.patient_search import patient_search
+        return patient_search.search(query, limit=limit)
+
+    @staticmethod
+    def like_search(query, limit=20):
+        """Unindexed LIKE scan, used for very short queries and when no search index is available"""
         search_term = f'%{query}%'
         
         return Patient.query.filter(
@@ -2,6 +2,7 @@ from datetime import datetime
 import uuid
 
 from . import db
+from .id_sequence import IdSequence
 
 class Test(db.Model):
     __tablename__ = 'tests'
@@ -60,22 +61,14 @@ class Test(db.Model):
             self.test_id = self.generate_test_id()
     
     def ensure_unique_test_id(self):
-        """Ensure the test_id is unique, regenerate if necessary"""
-        max_attempts = 10
-        attempts = 0
-        
-        while attempts < max_attempts:
-            # Check if this test_id already exists
-            existing_test = Test.query.filter_by(test_id=self.test_id).first()
-            if existing_test and existing_test.id != self.id:
-                # Regenerate test_id
-                self.test_id = self.generate_test_id()
-                attempts += 1
-            else:
-                break
-        
-        if attempts >= max_attempts:
-            raise ValueError(f"Could not generate unique test_id after {max_attempts} attempts")
+        """Ensure the test_id is unique.
+
+        IDs come from the daily IdSequence counter, so this is a single indexed
+        lookup guarding against manually assigned IDs rather than a retry loop.
+        """
+        existing_test = Test.query.filter_by(test_id=self.test_id).first()
+        if existing_test and existing_test.id != self.id:
+            raise ValueError(f"test_id {self.test_id} is already in use")
     
     @staticmethod
     def get_or_create_test_for_patient(patient_id, user_id, test_data):
@@ -124,33 +117,7 @@ class Test(db.Model):
     
     def generate_test_id(self):
         """Generate a unique test ID in format TEST-YYYYMMDD-XXX"""
-        today = datetime.now()
-        date_str = today.strftime('%Y%m%d')
-        
-        # Find the highest number for today to avoid conflicts
-        existing_tests = Test.query.filter(
-            Test.test_id.like(f'TEST-{date_str}-%')
-        ).all()
-        
-        if not existing_tests:
-            return f'TEST-{date_str}-001'
-        
-        # Extract numbers from existing test IDs and find the highest
-        numbers = []
-        for test in existing_tests:
-            try:
-                if test.test_id and '-' in test.test_id:
-                    num_part = test.test_id.split('-')[-1]
-                    if num_part.isdigit():
-                        numbers.append(int(num_part))
-            except (ValueError, IndexError):
-                continue
-        
-        if not numbers:
-            return f'TEST-{date_str}-001'
-        
-        next_number = max(numbers) + 1
-        return f'TEST-{date_str}-{next_number:03d}'
+        return IdSequence.next_id('TEST', Test.test_id)
     
     def add_image(self, filename, original_name, path, size, mimetype):
         """Add an image to the test"""
@@ -240,20 +207,20 @@ class Test(db.Model):
             'status': self.status,
             'priority': self.priority,
             'sampleType': self.sample_type,
-            'sampleCollectionDate': self.sample_collection_date.isoformat() if self.sample_collection_date is not None else None,
+            'sampleCollectionDate': self.sample_collection_date,
             'sampleCollectedBy': self.sample_collected_by,
             'images': self.images if self.images is not None else [],
-            'processedAt': self.processed_at.isoformat() if self.processed_at is not None else None,
+            'processedAt': self.processed_at,
             'processingTime': self.processing_time if self.processing_time is not None else 0,
             'technician': self.technician.to_dict_public() if hasattr(self, 'technician') and self.technician else None,
             'reviewedBy': self.reviewer.to_dict_public() if hasattr(self, 'reviewer') and self.reviewer else None,
-            'reviewedAt': self.reviewed_at.isoformat() if self.reviewed_at is not None else None,
+            'reviewedAt': self.reviewed_at,
             'createdBy': self.creator.to_dict_public() if hasattr(self, 'creator') and self.creator else None,
             'updatedBy': self.updater.to_dict_public() if hasattr(self, 'updater') and self.updater else None,
             'clinicalNotes': self.clinical_notes if self.clinical_notes is not None else {},
             'qualityScore': self.quality_score if self.quality_score is not None else 0,
-            'createdAt': self.created_at.isoformat() if self.created_at is not None else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at is not None else None
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
     
     def to_dict_summary(self):
@@ -266,10 +233,10 @@ class Test(db.Model):
             'status': self.status,
             'priority': self.priority,
             'sampleType': self.sample_type,
-            'sampleCollectionDate': self.sample_collection_date.isoformat() if self.sample_collection_date is not None else None,
+            'sampleCollectionDate': self.sample_collection_date,
             'technician': self.technician.to_dict_public() if hasattr(self, 'technician') and self.technician else None,
             'qualityScore': self.quality_score if self.quality_score is not None else 0,
-            'createdAt': self.created_at.isoformat() if self.created_at is not None else None
+            'createdAt': self.created_at
         }
     
     @staticmethod
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 import uuid
 
 from . import db
+from .id_sequence import IdSequence
 
 class UploadSession(db.Model):
     __tablename__ = 'upload_sessions'
@@ -37,15 +38,7 @@ class UploadSession(db.Model):
     
     def generate_session_id(self):
         """Generate a unique session ID in format SESS-YYYYMMDD-XXX"""
-        today = datetime.now()
-        date_str = today.strftime('%Y%m%d')
-        
-        # Find the next available number for today
-        existing_sessions = UploadSession.query.filter(
-            UploadSession.session_id.like(f'SESS-{date_str}-%')
-        ).count()
-        
-        return f'SESS-{date_str}-{existing_sessions + 1:03d}'
+        return IdSequence.next_id('SESS', UploadSession.session_id)
     
     def add_file(self, filename, original_name, path, size, mimetype):
         """Add a file to the upload session"""
@@ -171,8 +164,8 @@ class UploadSession(db.Model):
                 'failedFiles': self.failed_files,
                 'percentComplete': self.percent_complete
             },
-            'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
     
     def to_dict_summary(self):
@@ -184,7 +177,7 @@ class UploadSession(db.Model):
             'totalFiles': self.total_files,
             'uploadedFiles': self.uploaded_files,
             'percentComplete': self.percent_complete,
-            'createdAt': self.created_at.isoformat()
+            'createdAt': self.created_at
         }
     
     @staticmethod
@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 
-from . import db, bcrypt
+from . import db
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -46,12 +46,14 @@ class User(db.Model):
             self.set_default_permissions(kwargs['role'])
     
     def set_password(self, password):
-        """Hash and set the user's password"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        """Hash and set the user's password (in the password hashing pool; may raise PasswordHasherBusy)"""
+        from services.password_hashing import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check if the provided password matches the stored hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        """Check if the provided password matches the stored hash (may raise PasswordHasherBusy)"""
+        from services.password_hashing import password_hasher
+        return password_hasher.verify(self.password_hash, password)
     
     def set_default_permissions(self, role):
         """Set default permissions based on user role"""
@@ -98,9 +100,9 @@ class User(db.Model):
             'department': self.department,
             'licenseNumber': self.license_number,
             'permissions': self.permissions,
-            'lastLogin': self.last_login.isoformat() if self.last_login else None,
-            'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'lastLogin': self.last_login,
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
     
     def to_dict_public(self):
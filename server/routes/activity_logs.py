@@ -1,20 +1,50 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
+from collections import Counter
 from datetime import datetime, timedelta
+import itertools
 
+from models import db
 from models.activity_log import ActivityLog
-from models.user import User
+from models.activity_log_rollup import ActivityLogRollup
+from services.audit_retention import audit_retention
 from services.audit_service import AuditService
+from services.export_service import (
+    csv_lines, export_response, json_document_lines, ndjson_lines, stream_rows, validate_export_args
+)
 
 activity_logs_bp = Blueprint('activity_logs', __name__)
 
+# (CSV header, record key) pairs for the compliance export
+ACTIVITY_CSV_COLUMNS = [
+    ('Action', 'action'),
+    ('User', 'username'),
+    ('Resource', 'resource'),
+    ('Status', 'status'),
+    ('Risk Level', 'riskLevel'),
+    ('Timestamp', 'createdAt'),
+    ('Details', 'details'),
+]
+
+def _activity_csv_record(log):
+    """Flatten an activity log (to_dict() shape) into the CSV export columns"""
+    return {
+        'action': log['action'],
+        'username': (log['userInfo'] or {}).get('username', 'Unknown'),
+        'resource': f"{log['resourceType']}: {log['resourceName'] or log['resourceId'] or 'N/A'}",
+        'status': log['status'],
+        'riskLevel': log['riskLevel'],
+        'createdAt': log['createdAt'],
+        'details': log['details']
+    }
+
 @activity_logs_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_activity_logs():
     """Get activity logs with filtering and pagination"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
@@ -88,7 +118,7 @@ def get_user_activities(user_id):
     """Get all activities for a specific user"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
@@ -121,7 +151,7 @@ def get_resource_activities(resource_type, resource_id):
     """Get all activities for a specific resource"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
@@ -152,7 +182,7 @@ def get_activity_summary():
     """Get overall activity summary"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
@@ -168,42 +198,35 @@ def get_activity_summary():
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Get summary statistics
-        total_activities = ActivityLog.query.filter(
-            ActivityLog.created_at >= start_date
-        ).count()
-        
-        # Get activities by action
-        actions = db.session.query(
-            ActivityLog.action,
-            db.func.count(ActivityLog.id).label('count')
-        ).filter(
-            ActivityLog.created_at >= start_date
-        ).group_by(ActivityLog.action).all()
-        
-        # Get activities by resource type
-        resources = db.session.query(
-            ActivityLog.resource_type,
-            db.func.count(ActivityLog.id).label('count')
-        ).filter(
-            ActivityLog.created_at >= start_date
-        ).group_by(ActivityLog.resource_type).all()
-        
-        # Get activities by status
-        statuses = db.session.query(
-            ActivityLog.status,
-            db.func.count(ActivityLog.id).label('count')
+        # Whole days come from the daily rollups; only the partial first day
+        # is counted from activity_logs (an indexed range of at most one day)
+        ActivityLogRollup.ensure_backfilled()
+        first_full_day = start_date.date() + timedelta(days=1)
+        partial_day = db.session.query(
+            ActivityLog.action, ActivityLog.resource_type, ActivityLog.status, ActivityLog.risk_level,
+            db.func.count(ActivityLog.id)
         ).filter(
-            ActivityLog.created_at >= start_date
-        ).group_by(ActivityLog.status).all()
+            ActivityLog.created_at >= start_date,
+            ActivityLog.created_at < first_full_day
+        ).group_by(ActivityLog.action, ActivityLog.resource_type, ActivityLog.status, ActivityLog.risk_level).all()
+        # Once retention has archived its month, the partial day is read back
+        # from the archive (only happens when days reaches past retention)
+        archived_partial_day = Counter(
+            (log['action'], log['resourceType'], log['status'], log['riskLevel'])
+            for log in audit_retention.archived_logs(
+                start_date, datetime.combine(first_full_day, datetime.min.time()) - timedelta(microseconds=1)
+            )
+        )
+        partial_day += [(*key, count) for key, count in archived_partial_day.items()]
         
-        # Get activities by risk level
-        risk_levels = db.session.query(
-            ActivityLog.risk_level,
-            db.func.count(ActivityLog.id).label('count')
-        ).filter(
-            ActivityLog.created_at >= start_date
-        ).group_by(ActivityLog.risk_level).all()
+        total_activities = 0
+        actions, resources, statuses, risk_levels = {}, {}, {}, {}
+        for action, resource_type, status, risk_level, count in partial_day + ActivityLogRollup.totals(first_full_day):
+            total_activities += count
+            actions[action] = actions.get(action, 0) + count
+            resources[resource_type] = resources.get(resource_type, 0) + count
+            statuses[status] = statuses.get(status, 0) + count
+            risk_levels[risk_level] = risk_levels.get(risk_level, 0) + count
         
         # Get recent high-risk activities
         recent_high_risk = ActivityLog.query.filter(
@@ -218,10 +241,10 @@ def get_activity_summary():
                 'days': days
             },
             'totalActivities': total_activities,
-            'byAction': {action: count for action, count in actions},
-            'byResource': {resource: count for resource, count in resources},
-            'byStatus': {status: count for status, count in statuses},
-            'byRiskLevel': {risk: count for risk, count in risk_levels},
+            'byAction': actions,
+            'byResource': resources,
+            'byStatus': statuses,
+            'byRiskLevel': risk_levels,
             'recentHighRisk': [activity.to_dict() for activity in recent_high_risk]
         }
         
@@ -233,10 +256,17 @@ def get_activity_summary():
 @activity_logs_bp.route('/export', methods=['GET'])
 @jwt_required()
 def export_activity_logs():
-    """Export activity logs for compliance reporting"""
+    """Export activity logs for compliance reporting.
+
+    Query parameters: startDate, endDate (required), format (json, csv or
+    ndjson) and compress=gzip for a .gz download. Rows are streamed, so
+    memory use does not grow with the size of the date range. Months moved
+    out of activity_logs by audit retention are read back from their
+    archives and follow the hot rows.
+    """
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
@@ -248,7 +278,10 @@ def export_activity_logs():
         # Get query parameters
         start_date = request.args.get('startDate', '')
         end_date = request.args.get('endDate', '')
-        format_type = request.args.get('format', 'json')  # json, csv
+        format_type, compress, error = validate_export_args(request.args)  # json, csv, ndjson; gzip
+        
+        if error:
+            return jsonify({'error': error}), 400
         
         if not start_date or not end_date:
             return jsonify({'error': 'startDate and endDate are required'}), 400
@@ -259,39 +292,29 @@ def export_activity_logs():
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
         
-        # Get logs for the date range
-        logs = ActivityLog.query.filter(
+        # Logs for the date range are streamed in batches rather than loaded with .all()
+        statement = db.select(ActivityLog).where(
             ActivityLog.created_at >= start_datetime,
             ActivityLog.created_at <= end_datetime
-        ).order_by(ActivityLog.created_at.desc()).all()
+        ).order_by(ActivityLog.created_at.desc())
+        hot_logs = (log.to_dict() for log in stream_rows(statement, scalars=True))
+        logs = itertools.chain(hot_logs, audit_retention.archived_logs(start_datetime, end_datetime))
+        filename = f'activity_logs_{start_date}_{end_date}'
         
         if format_type == 'csv':
-            # Generate CSV format
-            csv_data = "Action,User,Resource,Status,Risk Level,Timestamp,Details\n"
-            for log in logs:
-                user_info = log.user_info
-                username = user_info.get('username', 'Unknown')
-                resource_info = f"{log.resource_type}: {log.resource_name or log.resource_id or 'N/A'}"
-                details = str(log.details) if log.details else ''
-                
-                csv_data += f'"{log.action}","{username}","{resource_info}","{log.status}","{log.risk_level}","{log.created_at}","{details}"\n'
-            
-            return csv_data, 200, {
-                'Content-Type': 'text/csv',
-                'Content-Disposition': f'attachment; filename=activity_logs_{start_date}_{end_date}.csv'
-            }
+            records = (_activity_csv_record(log) for log in logs)
+            lines = csv_lines(ACTIVITY_CSV_COLUMNS, records)
+        elif format_type == 'ndjson':
+            lines = ndjson_lines(logs)
         else:
-            # Return JSON format
-            return jsonify({
-                'logs': [log.to_dict() for log in logs],
-                'exportInfo': {
-                    'startDate': start_date,
-                    'endDate': end_date,
-                    'totalRecords': len(logs),
-                    'exportedBy': current_user.username,
-                    'exportedAt': datetime.utcnow().isoformat()
-                }
-            }), 200
+            lines = json_document_lines(logs, 'logs', 'exportInfo', {
+                'startDate': start_date,
+                'endDate': end_date,
+                'exportedBy': current_user.username,
+                'exportedAt': datetime.utcnow().isoformat()
+            })
+        
+        return export_response(lines, format_type, filename, compress)
         
     except Exception as e:
         return jsonify({'error': 'Failed to export activity logs', 'details': str(e)}), 500
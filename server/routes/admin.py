@@ -0,0 +1,75 @@
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import jwt_required, get_current_user
+
+from services.profiler import profiler, ProfilerBusy
+
+admin_bp = Blueprint('admin', __name__)
+
+def _require_admin():
+    """403/404 response unless the current user may manage users"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    if not current_user.has_permission('canManageUsers'):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    return None
+
+@admin_bp.route('/profile', methods=['POST'])
+@jwt_required()
+def capture_profile():
+    """Sample every thread of this server process for a few seconds.
+
+    Query parameters: seconds (default 10, capped by PROFILER_MAX_SECONDS),
+    intervalMs (default PROFILER_INTERVAL_MS), idle (include blocked
+    threads, default false) and format: 'folded' (default; collapsed stacks
+    for flamegraph.pl / speedscope) or 'json' (summary plus stacks).
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        seconds = request.args.get('seconds', 10, type=float)
+        interval_ms = request.args.get('intervalMs', type=float)
+        include_idle = request.args.get('idle', 'false').lower() == 'true'
+        output = request.args.get('format', 'folded')
+        if output not in ('folded', 'json'):
+            return jsonify({'error': "format must be 'folded' or 'json'"}), 400
+
+        sampler = profiler.capture(seconds, interval_ms / 1000 if interval_ms else None, include_idle)
+
+        if output == 'json':
+            return jsonify({**sampler.summary(), 'folded': sampler.folded()}), 200
+        return Response(sampler.folded(), mimetype='text/plain', headers={
+            'Content-Disposition': 'attachment; filename=profile.folded',
+            'X-Profile-Samples': str(sampler.samples)
+        })
+
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': 'Failed to capture profile', 'details': str(e)}), 500
+
+@admin_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+def list_request_profiles():
+    """Recent per-request profiles (requests sent with X-Profile: 1)"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({'profiles': profiler.recent()}), 200
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+def get_request_profile(profile_id):
+    """One per-request profile as collapsed stacks, or JSON with ?format=json"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    profile = profiler.get(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(profile), 200
+    return Response(profile['folded'], mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.folded'
+    })
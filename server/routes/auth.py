@@ -4,7 +4,8 @@ from flask_jwt_extended import (
     create_refresh_token, 
     jwt_required, 
     get_jwt_identity,
-    get_jwt
+    get_jwt,
+    get_current_user
 )
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
@@ -17,6 +18,7 @@ from models.user import db, User
 from utils.validators import validate_email, validate_password, validate_username
 from middleware.fileUpload import validate_file_upload, save_uploaded_file
 from services.image_validation import validate_image_buffer
+from services.password_hashing import password_hasher, PasswordHasherBusy
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -83,6 +85,11 @@ def register():
             'refresh_token': refresh_token
         }), 201
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': 'Password service is busy, please retry shortly'}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
@@ -105,15 +112,19 @@ def login():
             (User.email == email) | (User.username == email)
         ).first()
         
-        # Check if user exists and password is correct
-        if not user or not user.check_password(password):
+        # Check if user exists and password is correct (verified in the bounded hashing pool)
+        if not user or not password_hasher.verify(user.password_hash, password):
             return jsonify({'error': 'Invalid email/username or password'}), 401
         
         # Check if user is active
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 403
         
-        # Update last login
+        # Upgrade hashes made with a different BCRYPT_LOG_ROUNDS while we have the password
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(password)
+        
+        # Update last login (also commits a rehashed password)
         user.update_last_login()
         
         # Generate tokens
@@ -127,6 +138,10 @@ def login():
             'refresh_token': refresh_token
         }), 200
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': 'Too many login attempts in progress, please retry shortly'}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
     except Exception as e:
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
@@ -136,7 +151,7 @@ def refresh():
     """Refresh access token"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user or not user.is_active:
             return jsonify({'error': 'User not found or inactive'}), 401
@@ -168,8 +183,8 @@ def logout():
 def get_profile():
     """Get current user profile"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        # Served from the identity resolved for the token, without another query
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -187,12 +202,12 @@ def update_profile():
     """Update current user profile"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
+        if not get_current_user():
             return jsonify({'error': 'User not found'}), 404
         
         data = request.get_json()
+        # The row is only loaded here, where it is changed
+        user = db.session.get(User, current_user_id)
         
         # Update allowed fields
         if 'first_name' in data:
@@ -223,6 +238,11 @@ def update_profile():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': 'Password service is busy, please retry shortly'}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Profile update failed', 'details': str(e)}), 500
@@ -233,9 +253,7 @@ def change_password():
     """Change user password"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
+        if not get_current_user():
             return jsonify({'error': 'User not found'}), 404
         
         data = request.get_json()
@@ -243,8 +261,11 @@ def change_password():
         if not data.get('current_password') or not data.get('new_password'):
             return jsonify({'error': 'Current password and new password are required'}), 400
         
+        # The row (and its password hash) is only loaded once the request is valid
+        user = db.session.get(User, current_user_id)
+        
         # Verify current password
-        if not user.check_password(data['current_password']):
+        if not password_hasher.verify(user.password_hash, data['current_password']):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
         # Validate new password
@@ -252,12 +273,16 @@ def change_password():
             return jsonify({'error': 'Password must be at least 8 characters long and contain letters and numbers'}), 400
         
         # Set new password
-        user.set_password(data['new_password'])
+        user.password_hash = password_hasher.hash(data['new_password'])
         user.updated_at = datetime.utcnow()
         db.session.commit()
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': 'Password service is busy, please retry shortly'}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Password change failed', 'details': str(e)}), 500
@@ -268,8 +293,7 @@ def change_password():
 def upload_profile_avatar():
     """Upload user profile avatar"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -308,8 +332,9 @@ def upload_profile_avatar():
                 os.remove(file_path)
             return jsonify({'error': 'Invalid image file', 'details': errors}), 400
         
-        # Update user avatar path
+        # Update user avatar path; the row is only loaded here, where it is changed
         avatar_url = f"/uploads/avatars/{unique_filename}"
+        user = db.session.get(User, user.id)
         user.avatar = avatar_url
         user.updated_at = datetime.utcnow()
         
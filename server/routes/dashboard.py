@@ -1,14 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
 from models import db
-from models.user import User
 from models.patient import Patient
 from models.test import Test
 from models.diagnosis_result import DiagnosisResult
 from models.upload_session import UploadSession
+from utils.negotiation import negotiated_response
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -18,7 +18,7 @@ def get_dashboard():
     """Get dashboard summary data"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -95,7 +95,7 @@ def get_dashboard():
             })
         weekly_trend.reverse()
         
-        return jsonify({
+        return negotiated_response({
             'summary': {
                 'totalPatients': total_patients,
                 'newPatients30d': new_patients_30d,
@@ -115,7 +115,7 @@ def get_dashboard():
             'recentTests': [test.to_dict_summary() for test in recent_tests],
             'recentPatients': [patient.to_dict_summary() for patient in recent_patients],
             'user': user.to_dict_public()
-        }), 200
+        }, 200)
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch dashboard data', 'details': str(e)}), 500
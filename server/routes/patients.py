@@ -1,11 +1,11 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
 from datetime import datetime
 import re
 
 from models.patient import db, Patient
-from models.user import User
 from services.audit_service import AuditService
+from utils.negotiation import negotiated_response
 
 patients_bp = Blueprint('patients', __name__)
 
@@ -96,7 +96,7 @@ def create_patient():
         
         # Get current user
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -184,7 +184,7 @@ def update_patient(patient_id):
         
         # Get current user
         current_user_id = get_jwt_identity()
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -246,11 +246,11 @@ def get_patient_tests(patient_id):
             return jsonify({'error': 'Patient not found'}), 404
         
         tests = patient.tests
-        return jsonify({
+        return negotiated_response({
             'patient': patient.to_dict_summary(),
             'tests': [test.to_dict_summary() for test in tests],
             'totalTests': len(tests)
-        }), 200
+        }, 200)
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch patient tests', 'details': str(e)}), 500
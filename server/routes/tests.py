@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
 from datetime import datetime
 import os
 import logging
@@ -8,10 +8,14 @@ logger = logging.getLogger(__name__)
 
 from models.test import db, Test
 from models.patient import Patient
-from models.user import User
 from models.diagnosis_result import DiagnosisResult
+from models.diagnosis_image import BOX_FIELDS, BOX_CLASSES
 from models.upload_session import UploadSession
 from services.audit_service import AuditService
+from services.export_service import (
+    csv_lines, export_response, json_document_lines, ndjson_lines, stream_rows, validate_export_args
+)
+from utils.negotiation import negotiated_response
 
 tests_bp = Blueprint('tests', __name__)
 
@@ -110,7 +114,7 @@ def create_test():
             return jsonify({'error': 'Invalid priority value'}), 400
         
         # Get current user
-        current_user = User.query.filter_by(id=current_user_id).first()
+        current_user = get_current_user()
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -396,12 +400,42 @@ def get_diagnosis_result(test_id):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch diagnosis result', 'details': str(e)}), 500
 
+# Optional sections of the results payload that callers can drop with include=
+RESULT_SECTIONS = ('images', 'clinicalNotes', 'detections')
+BOX_FORMATS = ('full', 'compact', 'none')
+
+def _parse_list_arg(name):
+    """Parse a comma-separated query parameter into a set (None when absent)"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
 @tests_bp.route('/<test_id>/results', methods=['GET'])
 @jwt_required()
 def get_test_results(test_id):
-    """Get complete test results including diagnosis"""
+    """Get complete test results including diagnosis.
+
+    Query parameters:
+        fields: comma-separated top-level keys to return (default: all)
+        include: optional sections to build, any of images, clinicalNotes,
+            detections, or 'none' (default: all)
+        boxes: full (per-box dicts, default), compact (rows described by
+            boxFormat) or none (per-image counts only)
+    """
     try:
-        logger.info(f"Fetching results for test: {test_id}")
+        fields = _parse_list_arg('fields')
+        include = _parse_list_arg('include')
+        box_format = request.args.get('boxes', 'full')
+        if box_format not in BOX_FORMATS:
+            return jsonify({'error': f"boxes must be one of {', '.join(BOX_FORMATS)}"}), 400
+        
+        def wanted(key):
+            if fields is not None and key not in fields:
+                return False
+            if key in RESULT_SECTIONS and include is not None and key not in include:
+                return False
+            return True
         
         test = Test.query.filter_by(id=test_id).first()
         
@@ -409,79 +443,70 @@ def get_test_results(test_id):
             logger.warning(f"Test not found: {test_id}")
             return jsonify({'error': 'Test not found'}), 404
         
-        logger.info(f"Test found: {test.test_id}, status: {test.status}")
-        
-        # Get diagnosis result if it exists
-        try:
-            diagnosis_result = DiagnosisResult.query.filter_by(test_id=test_id).first()
-            logger.info(f"Diagnosis result found: {diagnosis_result is not None}")
-        except Exception as diag_error:
-            logger.error(f"Error querying diagnosis result: {str(diag_error)}")
-            diagnosis_result = None
-        
-        # Prepare response
-        try:
-            # Resolve human-friendly patient ID (PAT-...)
-            patient_public_id = None
-            try:
-                patient_obj = test.patient if hasattr(test, 'patient') and test.patient else Patient.query.filter_by(id=test.patient_id).first()
-                if patient_obj:
-                    patient_public_id = patient_obj.patient_id
-            except Exception:
-                patient_public_id = None
-
-            response = {
-                # IDs
-                'testUuid': test.id,
-                'testId': test.test_id,  # human-friendly TEST-...
-                'patientUuid': test.patient_id,
-                'patientId': patient_public_id,  # human-friendly PAT-...
+        # Resolve human-friendly patient ID (PAT-...) without loading the patient row
+        patient_public_id = None
+        if wanted('patientId'):
+            patient_public_id = db.session.query(Patient.patient_id).filter_by(id=test.patient_id).scalar()
+        
+        response = {
+            # IDs
+            'testUuid': test.id,
+            'testId': test.test_id,  # human-friendly TEST-...
+            'patientUuid': test.patient_id,
+            'patientId': patient_public_id,  # human-friendly PAT-...
 
-                # Test metadata
-                'status': test.status,
-                'priority': test.priority,
-                'sampleType': test.sample_type,
-                'sampleCollectionDate': test.sample_collection_date.isoformat() if test.sample_collection_date else None,
-                'createdAt': test.created_at.isoformat() if test.created_at else None,
-                'updatedAt': test.updated_at.isoformat() if test.updated_at else None,
-                'processingTime': test.processing_time,
-                'qualityScore': test.quality_score,
-                'images': test.images or [],
-                'clinicalNotes': test.clinical_notes or {}
-            }
-            logger.info("Basic response prepared successfully")
-        except Exception as resp_error:
-            logger.error(f"Error preparing basic response: {str(resp_error)}")
-            raise resp_error
+            # Test metadata
+            'status': test.status,
+            'priority': test.priority,
+            'sampleType': test.sample_type,
+            'sampleCollectionDate': test.sample_collection_date.isoformat() if test.sample_collection_date else None,
+            'createdAt': test.created_at.isoformat() if test.created_at else None,
+            'updatedAt': test.updated_at.isoformat() if test.updated_at else None,
+            'processingTime': test.processing_time,
+            'qualityScore': test.quality_score
+        }
+        if wanted('images'):
+            response['images'] = test.images or []
+        if wanted('clinicalNotes'):
+            response['clinicalNotes'] = test.clinical_notes or {}
         
-        # Add diagnosis results if available
+        # Add diagnosis results if available, read straight from columns
+        # rather than through to_dict(), which re-serialises the whole test
+        diagnosis_result = DiagnosisResult.query.filter_by(test_id=test_id).first()
         if diagnosis_result:
-            try:
-                # Use model's to_dict to ensure correct field names and shapes
-                diagnosis_dict = diagnosis_result.to_dict()
-
-                diagnosis_data = {
-                    # prefer diagnosis status (POSITIVE/NEGATIVE) over test status
-                    'status': diagnosis_dict.get('status', response.get('status')),
-                    'modelVersion': diagnosis_dict.get('modelVersion'),
-                    # frontend expects overallConfidence; model exposes 'confidence'
-                    'overallConfidence': diagnosis_dict.get('confidence'),
-                    'severity': diagnosis_dict.get('severity'),
-                    'mostProbableParasite': diagnosis_dict.get('mostProbableParasite'),
-                    'detections': diagnosis_dict.get('detections', []) or [],
-                    'totalParasites': diagnosis_dict.get('totalParasites'),
-                    'totalWbcs': diagnosis_dict.get('totalWbcs'),
-                    'parasiteWbcRatio': diagnosis_dict.get('parasiteWbcRatio'),
-                    'diagnosisCreatedAt': diagnosis_dict.get('createdAt')
-                }
-                response.update(diagnosis_data)
-                logger.info("Diagnosis data added successfully")
-            except Exception as diag_data_error:
-                logger.error(f"Error adding diagnosis data: {str(diag_data_error)}")
-                # Continue without diagnosis data rather than failing completely
+            response.update({
+                # prefer diagnosis status (POSITIVE/NEGATIVE) over test status
+                'status': diagnosis_result.status,
+                'modelVersion': diagnosis_result.model_version,
+                # frontend expects overallConfidence; model exposes 'confidence'
+                'overallConfidence': diagnosis_result.confidence,
+                'severity': {
+                    'level': diagnosis_result.severity_level,
+                    'score': diagnosis_result.severity_score,
+                    'description': diagnosis_result.severity_description
+                } if diagnosis_result.severity_level else None,
+                'mostProbableParasite': {
+                    'type': diagnosis_result.most_probable_parasite_type,
+                    'confidence': diagnosis_result.most_probable_parasite_confidence,
+                    'fullName': diagnosis_result.most_probable_parasite_full_name
+                } if diagnosis_result.most_probable_parasite_type else None,
+                'totalParasites': diagnosis_result.total_parasites,
+                'totalWbcs': diagnosis_result.total_wbcs,
+                'parasiteWbcRatio': diagnosis_result.parasite_wbc_ratio,
+                'diagnosisCreatedAt': diagnosis_result.created_at.isoformat() if diagnosis_result.created_at else None
+            })
+            if wanted('detections'):
+                response['detections'] = diagnosis_result.get_detections(
+                    include_boxes=box_format != 'none',
+                    compact=box_format == 'compact'
+                )
         
-        logger.info(f"Final response prepared: {len(response)} fields")
-        return jsonify(response), 200
+        if fields is not None:
+            response = {key: value for key, value in response.items() if key in fields}
+        if box_format == 'compact' and 'detections' in response:
+            response['boxFormat'] = {'fields': list(BOX_FIELDS), 'classes': list(BOX_CLASSES)}
+        
+        return negotiated_response(response, 200)
         
     except Exception as e:
         logger.error(f"Failed to fetch test results for test {test_id}: {str(e)}")
@@ -489,6 +514,97 @@ def get_test_results(test_id):
         logger.error(f"Full traceback: {traceback.format_exc()}")
         return jsonify({'error': 'Failed to fetch test results', 'details': str(e)}), 500
 
+# Flat diagnosis history row: (CSV header, select label, column)
+DIAGNOSIS_EXPORT_COLUMNS = [
+    ('Test ID', 'testId', Test.test_id),
+    ('Patient ID', 'patientId', Patient.patient_id),
+    ('Sample Type', 'sampleType', Test.sample_type),
+    ('Priority', 'priority', Test.priority),
+    ('Collected At', 'sampleCollectionDate', Test.sample_collection_date),
+    ('Status', 'status', DiagnosisResult.status),
+    ('Parasite', 'mostProbableParasite', DiagnosisResult.most_probable_parasite_type),
+    ('Parasite Confidence', 'parasiteConfidence', DiagnosisResult.most_probable_parasite_confidence),
+    ('Overall Confidence', 'overallConfidence', DiagnosisResult.confidence),
+    ('Total Parasites', 'totalParasites', DiagnosisResult.total_parasites),
+    ('Total WBCs', 'totalWbcs', DiagnosisResult.total_wbcs),
+    ('Parasite/WBC Ratio', 'parasiteWbcRatio', DiagnosisResult.parasite_wbc_ratio),
+    ('Severity', 'severityLevel', DiagnosisResult.severity_level),
+    ('Severity Score', 'severityScore', DiagnosisResult.severity_score),
+    ('Model Version', 'modelVersion', DiagnosisResult.model_version),
+    ('Reviewed At', 'reviewedAt', Test.reviewed_at),
+    ('Diagnosed At', 'diagnosisCreatedAt', DiagnosisResult.created_at),
+]
+
+@tests_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_diagnosis_results():
+    """Export diagnosis history as a streamed download.
+
+    Query parameters: startDate, endDate (required, on diagnosis time),
+    format (json, csv or ndjson), compress=gzip, and optional status and
+    patientId filters. Only the flat result columns are selected, so no
+    detections or boxes are loaded.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not current_user.has_permission('canExportReports'):
+            return jsonify({'error': 'Insufficient permissions'}), 403
+        
+        start_date = request.args.get('startDate', '')
+        end_date = request.args.get('endDate', '')
+        status = request.args.get('status', '')
+        patient_id = request.args.get('patientId', '')
+        format_type, compress, error = validate_export_args(request.args)
+        
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if not start_date or not end_date:
+            return jsonify({'error': 'startDate and endDate are required'}), 400
+        
+        try:
+            start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            end_datetime = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        statement = db.select(*[column.label(key) for _, key, column in DIAGNOSIS_EXPORT_COLUMNS])\
+            .select_from(DiagnosisResult)\
+            .join(Test, Test.id == DiagnosisResult.test_id)\
+            .join(Patient, Patient.id == Test.patient_id)\
+            .where(DiagnosisResult.created_at >= start_datetime, DiagnosisResult.created_at <= end_datetime)\
+            .order_by(DiagnosisResult.created_at.desc())
+        if status:
+            statement = statement.where(DiagnosisResult.status == status.upper())
+        if patient_id:
+            statement = statement.where(db.or_(Patient.id == patient_id, Patient.patient_id == patient_id))
+        
+        rows = stream_rows(statement)
+        filename = f'diagnosis_results_{start_date}_{end_date}'
+        
+        if format_type == 'csv':
+            lines = csv_lines([(header, key) for header, key, _ in DIAGNOSIS_EXPORT_COLUMNS], rows)
+        elif format_type == 'ndjson':
+            lines = ndjson_lines(dict(row) for row in rows)
+        else:
+            lines = json_document_lines((dict(row) for row in rows), 'results', 'exportInfo', {
+                'startDate': start_date,
+                'endDate': end_date,
+                'exportedBy': current_user.username,
+                'exportedAt': datetime.utcnow().isoformat()
+            })
+        
+        return export_response(lines, format_type, filename, compress)
+        
+    except Exception as e:
+        logger.error(f"Failed to export diagnosis results: {str(e)}")
+        return jsonify({'error': 'Failed to export diagnosis results', 'details': str(e)}), 500
+
 @tests_bp.route('/<test_id>', methods=['DELETE'])
 @jwt_required()
 def delete_test(test_id):
@@ -552,11 +668,11 @@ def get_patient_tests(patient_id):
         
         tests = Test.get_tests_by_patient(patient_id, limit=50)
         
-        return jsonify({
+        return negotiated_response({
             'patient': patient.to_dict_summary(),
             'tests': [test.to_dict_summary() for test in tests],
             'total': len(tests)
-        }), 200
+        }, 200)
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch patient tests', 'details': str(e)}), 500
@@ -606,7 +722,7 @@ def debug_diagnosis_result(test_id):
                     debug_info['most_probable_parasite_error'] = str(e)
                 
                 try:
-                    debug_info['detections'] = diagnosis_result.detections
+                    debug_info['detections'] = diagnosis_result.get_detections()
                 except Exception as e:
                     debug_info['detections_error'] = str(e)
                 
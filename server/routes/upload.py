@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
 from werkzeug.utils import secure_filename
 import os
+import time
 import uuid
 from datetime import datetime
 import logging
@@ -9,9 +10,14 @@ from middleware.fileUpload import validate_file_upload, save_uploaded_file
 from models.upload_session import UploadSession
 from models.test import Test
 from models.diagnosis_result import DiagnosisResult
-from models.user import User
 from services.image_validation import validate_image_buffer
+from services.admission import AdmissionRejected, format_duration
+from services.metrics import metrics
+from services.tracing import tracer
+from utils.negotiation import negotiated_response
+from utils.json_provider import encode_default
 import json
+from contextlib import contextmanager
 
 # Create logger with fallback
 try:
@@ -28,13 +34,39 @@ except Exception:
 
 upload_bp = Blueprint('upload', __name__)
 
+@contextmanager
+def _upload_stage(stage, session, filename):
+    """Time one file's upload stage as a metric and as a span in the session's trace"""
+    with metrics.upload_stage(stage), tracer.start_span(
+        f'upload.{stage}', trace_key=session.session_id, session_id=session.session_id,
+        test_id=session.test_id, filename=filename
+    ):
+        yield
+
+def _queue_full_response(e):
+    """429 for a job refused by AI admission control, 413 for one that can never fit"""
+    if e.retry_after is None:
+        return jsonify({
+            'error': 'Too many images for one AI job',
+            'reason': e.reason,
+            'limit': e.limit,
+            'images': e.outstanding
+        }), 413
+    return jsonify({
+        'error': 'AI processing queue is full, please retry later',
+        'reason': e.reason,
+        'limit': e.limit,
+        'outstandingImages': e.outstanding,
+        'retryAfter': e.retry_after
+    }), 429, {'Retry-After': str(e.retry_after)}
+
 @upload_bp.route('/session', methods=['POST'])
 @jwt_required()
 def create_upload_session():
     """Create a new upload session"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -107,7 +139,7 @@ def upload_files(session_id):
             return jsonify({'error': 'Upload session not found'}), 404
         
         # Check if user owns the session or is supervisor/admin
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         if session.user_id != current_user_id and user.role not in ['supervisor', 'admin']:
             return jsonify({'error': 'Access denied to this session'}), 403
         
@@ -140,12 +172,15 @@ def upload_files(session_id):
                 os.makedirs(upload_dir, exist_ok=True)
                 
                 # Save file
-                file_path = save_uploaded_file(file, upload_dir, unique_filename)
+                with _upload_stage('save', session, filename):
+                    file_path = save_uploaded_file(file, upload_dir, unique_filename)
                 
                 # Validate image (basic security and format check)
                 file.seek(0)
                 file_content = file.read()
-                is_valid, metadata, errors = validate_image_buffer(file_content, filename)
+                with _upload_stage('validate', session, filename):
+                    is_valid, metadata, errors = validate_image_buffer(file_content, filename)
+                metrics.file_uploaded(len(file_content) if is_valid else None, error=not is_valid)
                 
                 if not is_valid:
                     failed_files.append({
@@ -242,7 +277,7 @@ def initiate_processing(session_id):
             return jsonify({'error': 'Upload session not found'}), 404
         
         # Check if user owns the session or is supervisor/admin
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         if session.user_id != current_user_id and user.role not in ['supervisor', 'admin']:
             return jsonify({'error': 'Access denied to this session'}), 403
         
@@ -283,11 +318,22 @@ def initiate_processing(session_id):
         image_paths = [file_info['path'] for file_info in valid_files]
         
         # Add to AI processing queue
-        success = ai_service.add_to_processing_queue(
-            session_id=session_id,
-            test_id=session.test_id,
-            image_paths=image_paths
-        )
+        try:
+            success = ai_service.add_to_processing_queue(
+                session_id=session_id,
+                test_id=session.test_id,
+                image_paths=image_paths,
+                priority=test.priority if session.test_id else 'normal',
+                user_id=current_user_id,
+                lab=user.department
+            )
+        except AdmissionRejected as e:
+            # Overloaded: undo the status changes so the client can retry later
+            session.status = 'active'
+            if session.test_id and test.status == 'processing':
+                test.update_status('pending')
+            db.session.commit()
+            return _queue_full_response(e)
         
         if not success:
             logger.error(f"Failed to add session {session_id} to AI processing queue")
@@ -300,12 +346,14 @@ def initiate_processing(session_id):
         
         logger.info(f"Processing initiated for session {session_id} with {len(valid_files)} files")
         
+        estimated_seconds = ai_service.estimate_seconds_remaining(session_id)
         return jsonify({
             'message': 'Processing initiated successfully',
             'sessionId': session.session_id,
             'status': session.status,
             'filesToProcess': len(valid_files),
-            'estimatedTime': '5-10 minutes'  # Placeholder
+            'estimatedTime': format_duration(estimated_seconds) if estimated_seconds is not None else None,
+            'estimatedSeconds': estimated_seconds
         }), 200
         
     except Exception as e:
@@ -322,7 +370,7 @@ def upload_images():
         
         # Get current user
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -419,12 +467,15 @@ def upload_images():
                 os.makedirs(upload_dir, exist_ok=True)
                 
                 # Save file as-is (no preprocessing)
-                file_path = save_uploaded_file(file, upload_dir, unique_filename)
+                with _upload_stage('save', session, filename):
+                    file_path = save_uploaded_file(file, upload_dir, unique_filename)
                 
                 # Validate image (basic security and format check)
                 file.seek(0)
                 file_content = file.read()
-                is_valid, metadata, errors = validate_image_buffer(file_content, filename)
+                with _upload_stage('validate', session, filename):
+                    is_valid, metadata, errors = validate_image_buffer(file_content, filename)
+                metrics.file_uploaded(len(file_content) if is_valid else None, error=not is_valid)
                 
                 if not is_valid:
                     failed_files.append({
@@ -565,6 +616,89 @@ def get_upload_progress(session_id):
         logger.error(f"Failed to get progress: {str(e)}")
         return jsonify({'error': 'Failed to get progress'}), 500
 
+def _sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=encode_default, separators=(',', ':'))}\n\n"
+
+@upload_bp.route('/progress/<session_id>/stream', methods=['GET'])
+@jwt_required()
+def stream_upload_progress(session_id):
+    """Stream AI progress for an upload session as Server-Sent Events.
+
+    Events: `status` (queued/processing and overall progress), `image` (one
+    per analysed image with its detection counts) and a final `completed`
+    or `failed`, after which the stream ends. Each open stream occupies a
+    server thread, so streams are closed after SSE_MAX_SECONDS and clients
+    reconnect (the current state is replayed on connect), and beyond
+    SSE_MAX_STREAMS open streams the request gets 503 with Retry-After;
+    such clients fall back to polling /progress/<session_id>.
+    """
+    try:
+        session = UploadSession.query.filter_by(session_id=session_id).first()
+        
+        if not session:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        from services.progress_broker import progress_broker, TERMINAL_EVENTS
+        
+        initial = []
+        if not progress_broker.has_channel(session_id):
+            # No job for this session in this process (finished long ago or
+            # never queued here): start from what the database knows
+            test = Test.query.get(session.test_id) if session.test_id else None
+            status = test.status if test is not None and test.status == 'completed' else session.status
+            snapshot = {
+                'sessionId': session.session_id,
+                'testId': session.test_id,
+                'status': status,
+                'progress': 100 if status == 'completed' else session.percent_complete
+            }
+            initial.append((status if status in TERMINAL_EVENTS else 'status', snapshot))
+        
+        heartbeat = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+        max_seconds = float(os.getenv('SSE_MAX_SECONDS', 900))
+        
+        if not progress_broker.acquire_stream():
+            return jsonify({'error': 'Too many progress streams open, poll /api/upload/progress instead'}), 503, {
+                'Retry-After': str(int(heartbeat))
+            }
+        
+        def events():
+            subscription = progress_broker.subscribe(session_id)
+            try:
+                yield 'retry: 3000\n\n'
+                for event, data in initial:
+                    yield _sse_message(event, data)
+                    if event in TERMINAL_EVENTS:
+                        return
+                
+                deadline = time.monotonic() + max_seconds
+                while time.monotonic() < deadline:
+                    item = subscription.get(timeout=heartbeat)
+                    if subscription.dropped:
+                        return  # fell behind; the client reconnects and gets a fresh replay
+                    if item is None:
+                        yield ': keep-alive\n\n'
+                        continue
+                    event, data = item
+                    yield _sse_message(event, data)
+                    if event in TERMINAL_EVENTS:
+                        return
+            finally:
+                subscription.close()
+        
+        response = Response(events(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # Released when the server closes the response, even if the client
+        # went away before the first event was sent
+        response.call_on_close(progress_broker.release_stream)
+        return response
+        
+    except Exception as e:
+        logger.error(f"Failed to stream progress: {str(e)}")
+        return jsonify({'error': 'Failed to stream progress'}), 500
+
 @upload_bp.route('/cancel/<session_id>', methods=['POST'])
 @jwt_required()
 def cancel_upload(session_id):
@@ -578,8 +712,17 @@ def cancel_upload(session_id):
         if session.status in ['completed', 'failed']:
             return jsonify({'error': 'Cannot cancel completed or failed session'}), 400
         
+        # Stop its AI job before the images go away; a running job stops
+        # before its next image and its checkpoints are dropped
+        from services.ai_analysis import ai_service
+        job_cancelled = ai_service.cancel_job(session_id)
+        
         # Cancel the session
         session.cancel()
+        if job_cancelled and session.test_id:
+            test = Test.query.get(session.test_id)
+            if test and test.status != 'completed':
+                test.update_status('cancelled')
         
         # Clean up uploaded files
         if session.files:
@@ -625,11 +768,11 @@ def get_upload_history():
                 'uploadedFiles': session.uploaded_files,
                 'failedFiles': session.failed_files,
                 'percentComplete': session.percent_complete,
-                'createdAt': session.created_at.isoformat(),
-                'updatedAt': session.updated_at.isoformat() if session.updated_at else None
+                'createdAt': session.created_at,
+                'updatedAt': session.updated_at
             })
         
-        return jsonify({
+        return negotiated_response({
             'history': history,
             'pagination': {
                 'page': page,
@@ -637,7 +780,7 @@ def get_upload_history():
                 'total': sessions.total,
                 'pages': sessions.pages
             }
-        }), 200
+        }, 200)
         
     except Exception as e:
         logger.error(f"Failed to get upload history: {str(e)}")
@@ -690,11 +833,19 @@ def start_ai_processing():
         # Trigger AI processing
         from services.ai_analysis import ai_service
         
-        success = ai_service.add_to_processing_queue(
-            session_id=str(session_id),
-            test_id=str(test_id),
-            image_paths=image_paths
-        )
+        test = Test.query.get(test_id)
+        user = get_current_user()
+        try:
+            success = ai_service.add_to_processing_queue(
+                session_id=str(session_id),
+                test_id=str(test_id),
+                image_paths=image_paths,
+                priority=test.priority if test else 'normal',
+                user_id=get_jwt_identity(),
+                lab=user.department if user else None
+            )
+        except AdmissionRejected as e:
+            return _queue_full_response(e)
         
         if success:
             # Update session status to processing
@@ -702,8 +853,6 @@ def start_ai_processing():
             session.updated_at = datetime.utcnow()
             
             # Update test status to processing
-            from models.test import Test
-            test = Test.query.get(test_id)
             if test:
                 test.update_status('processing')
             
@@ -717,7 +866,8 @@ def start_ai_processing():
                 'message': 'AI processing started successfully',
                 'sessionId': session_id,
                 'testId': test_id,
-                'imageCount': len(image_paths)
+                'imageCount': len(image_paths),
+                'estimatedSeconds': ai_service.estimate_seconds_remaining(str(session_id))
             }), 200
         else:
             return jsonify({
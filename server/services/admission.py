@@ -0,0 +1,129 @@
+import math
+import os
+import threading
+
+
+class AdmissionRejected(Exception):
+    """Raised when queueing a job would exceed an outstanding-image limit"""
+
+    def __init__(self, reason, limit, outstanding, retry_after):
+        super().__init__(f'AI queue limit reached ({reason}: {outstanding}/{limit} images outstanding)')
+        self.reason = reason
+        self.limit = limit
+        self.outstanding = outstanding
+        self.retry_after = retry_after
+
+
+class JobTooLarge(AdmissionRejected):
+    """Raised when a job alone has more images than a limit allows; retrying cannot help"""
+
+    def __init__(self, reason, limit, images):
+        Exception.__init__(self, f'AI job too large ({reason} limit is {limit} images, job has {images})')
+        self.reason = reason
+        self.limit = limit
+        self.outstanding = images
+        self.retry_after = None
+
+
+class ServiceTimeEstimator:
+    """Exponentially weighted moving average of the time one image takes.
+
+    Fed with the measured detection time of every analysed image (which
+    includes the time spent waiting in an inference batch). Until the
+    first image is measured, AI_ETA_DEFAULT_IMAGE_SECONDS is assumed.
+    """
+
+    def __init__(self, initial=None, smoothing=None):
+        self.seconds_per_image = float(initial if initial is not None
+                                       else os.getenv('AI_ETA_DEFAULT_IMAGE_SECONDS', 2))
+        self.smoothing = float(smoothing if smoothing is not None else os.getenv('AI_ETA_SMOOTHING', 0.2))
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            if self.samples == 0:
+                self.seconds_per_image = seconds
+            else:
+                self.seconds_per_image += self.smoothing * (seconds - self.seconds_per_image)
+            self.samples += 1
+
+    def estimate(self, images_ahead, images, parallelism):
+        """Seconds until a job of `images` images finishes behind `images_ahead` others.
+
+        The backlog drains `parallelism` images at a time, but a job's own
+        images run one after another, so it never beats images * per-image time.
+        """
+        per_image = self.seconds_per_image
+        return max(images * per_image, (images_ahead + images) * per_image / max(1, parallelism))
+
+
+class AdmissionController:
+    """Outstanding-image limits for the AI queue.
+
+    An image is outstanding from the moment its job is queued until it has
+    been analysed. A new job is refused when it would take the total over
+    AI_MAX_OUTSTANDING_IMAGES, the requesting user over
+    AI_USER_MAX_OUTSTANDING_IMAGES, or the user's lab (department) over
+    AI_LAB_MAX_OUTSTANDING_IMAGES; 0 disables a limit. Limits apply per
+    process, like the queue itself.
+    """
+
+    def __init__(self):
+        self.max_outstanding = int(os.getenv('AI_MAX_OUTSTANDING_IMAGES', 500))
+        self.max_per_user = int(os.getenv('AI_USER_MAX_OUTSTANDING_IMAGES', 100))
+        self.max_per_lab = int(os.getenv('AI_LAB_MAX_OUTSTANDING_IMAGES', 300))
+        self.max_retry_after = int(os.getenv('AI_MAX_RETRY_AFTER_SECONDS', 600))
+        self.rejections = {'total': 0, 'user': 0, 'lab': 0}
+
+    def check(self, jobs, images, user_id, lab, estimator, parallelism):
+        """Raise AdmissionRejected if a job of `images` images may not be queued.
+
+        `jobs` are the queued and running jobs, each with 'remaining' images
+        and the 'user_id' and 'lab' it was queued for. A job bigger than a
+        limit raises JobTooLarge, since no amount of waiting lets it in.
+        """
+        total = by_user = by_lab = 0
+        for job in jobs:
+            remaining = job.get('remaining', 0)
+            total += remaining
+            if user_id is not None and job.get('user_id') == user_id:
+                by_user += remaining
+            if lab is not None and job.get('lab') == lab:
+                by_lab += remaining
+
+        for reason, limit, outstanding, drain_parallelism in (
+            ('user', self.max_per_user, by_user, 1),
+            ('lab', self.max_per_lab, by_lab, parallelism),
+            ('total', self.max_outstanding, total, parallelism)
+        ):
+            if limit <= 0 or outstanding + images <= limit:
+                continue
+            self.rejections[reason] += 1
+            if images > limit:
+                raise JobTooLarge(reason, limit, images)
+            # Time until enough of the backlog has drained for this job to fit
+            excess = min(outstanding, outstanding + images - limit)
+            retry_after = excess * estimator.seconds_per_image / drain_parallelism
+            raise AdmissionRejected(reason, limit, outstanding,
+                                    retry_after=min(self.max_retry_after, max(1, math.ceil(retry_after))))
+
+    def stats(self):
+        return {
+            'maxOutstandingImages': self.max_outstanding,
+            'maxUserOutstandingImages': self.max_per_user,
+            'maxLabOutstandingImages': self.max_per_lab,
+            'rejections': dict(self.rejections)
+        }
+
+
+def format_duration(seconds):
+    """Rough human-readable duration for ETAs"""
+    seconds = max(0, int(round(seconds)))
+    if seconds < 60:
+        return 'less than a minute'
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f"about {minutes} minute{'s' if minutes != 1 else ''}"
+    hours = seconds / 3600
+    return f'about {hours:.1f} hours'
@@ -1,14 +1,16 @@
 import os
 import logging
 import json
+import math
 from datetime import datetime
-import cv2
-import numpy as np
 from typing import Dict, List, Optional, Tuple
-import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import threading
+import time
+import socket
 import sys
+from collections import OrderedDict
+from flask import current_app, has_app_context
 
 # ============================================================================
 # CUSTOM YOLOV12 PATH SETUP
@@ -33,105 +35,556 @@ if server_dir not in sys.path:
 
 logger = logging.getLogger(__name__)
 
-# Fallback imports
-malaria_detector_available = False
-try:
+from services.model_loader import ModelLoader, ModelNotReady
+from services.progress_broker import progress_broker
+from services.job_scheduler import PriorityJobQueue, PRIORITY_LEVELS, priority_level
+from services.inference_batcher import InferenceBatcher
+from services.admission import AdmissionController, AdmissionRejected, ServiceTimeEstimator
+from services.metrics import metrics
+from services.tracing import tracer
+
+ACTIVE_STATUSES = ('queued', 'processing')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# torch/ultralytics are only imported by the loader thread, not at import time
+def _build_detector():
+    if os.getenv('AI_STUB_DETECTOR', 'false').lower() == 'true':
+        from services.stub_detector import StubDetector
+        logger.warning("AI_STUB_DETECTOR is set: results come from the load-test stub, not the model")
+        return StubDetector()
+    
     from malaria_detector import MalariaDetector
-    logger.info("MalariaDetector imported successfully")
-    malaria_detector_available = True
-except ImportError as e:
-    logger.warning(f"MalariaDetector not available: {e}")
-    MalariaDetector = None
-
-malaria_analyzer_available = False
-try:
-    from analysis import MalariaAnalyzer
-    logger.info("MalariaAnalyzer imported successfully")
-    malaria_analyzer_available = True
-except ImportError as e:
-    logger.warning(f"MalariaAnalyzer not available: {e}")
-    MalariaAnalyzer = None
+    detector = MalariaDetector()
+    
+    # Warm up before the model is reported ready, so the first real slide
+    # does not pay for kernel selection and allocation
+    if os.getenv('AI_WARMUP', 'true').lower() == 'true':
+        try:
+            detector.warmup(
+                batch_sizes=[int(size) for size in os.getenv('AI_WARMUP_BATCH_SIZES', '1').split(',') if size.strip()],
+                runs=int(os.getenv('AI_WARMUP_RUNS', 2)),
+                channels_last=os.getenv('AI_CHANNELS_LAST', 'false').lower() == 'true',
+                compile_model=os.getenv('AI_TORCH_COMPILE', 'false').lower() == 'true'
+            )
+        except Exception as e:
+            logger.warning(f"Model warm-up failed, continuing without it: {e}")
+    return detector
 
 class AIAnalysisService:
     def __init__(self):
-        self.detector = MalariaDetector() if malaria_detector_available else None
-        self.processing_queue = []
-        self.is_processing = False
+        self.model_loader = ModelLoader(_build_detector, name='malaria detector')
+        self.app = None
+        self.processing_queue = PriorityJobQueue()
+        # Jobs below this priority yield to it between images
+        self.preempt_level = priority_level(os.getenv('AI_PREEMPT_PRIORITY', 'urgent'))
+        self.preemptions = 0
+        self.current_jobs = {}  # worker thread name -> job
+        self.jobs = OrderedDict()  # session id -> job, including recently finished ones
+        self.finished_job_limit = int(os.getenv('AI_FINISHED_JOB_HISTORY', 500))
+        # Several jobs run at once so their images can share inference batches
+        self.job_workers = max(1, int(os.getenv('AI_JOB_WORKERS', 4)))
+        self.batcher = InferenceBatcher(self._run_batch)
+        self.admission = AdmissionController()
+        self.service_time = ServiceTimeEstimator()
+        self._workers = set()
+        self._worker_sequence = 0
+        self._stopping = False
+        # Jobs are leased through their AnalysisJob row; a lease not renewed
+        # for this long is taken over by another process
+        self.lease_seconds = float(os.getenv('AI_JOB_LEASE_SECONDS', 60))
+        self._maintenance = None
+        self._maintenance_pid = None
+        self._maintenance_stop = threading.Event()
+        self._resume_lock = threading.Lock()
         self.processing_lock = threading.Lock()
         self.executor = ThreadPoolExecutor(max_workers=3)
         logger.info("AI processing loop started")
 
-    def add_to_processing_queue(self, session_id: str, test_id: str, image_paths: List[str]) -> bool:
-        """Add a job to the processing queue"""
-        if not malaria_detector_available:
-            logger.error("MalariaDetector not available, cannot queue job")
+    @property
+    def owner(self) -> str:
+        """Lease owner id of this process"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self, app=None, load_model: bool = True):
+        """Start loading the model and the job lease/resume thread in this process.
+
+        Called once the serving process exists (after gunicorn's fork, or
+        from app.py's __main__); calling it again is cheap.
+        """
+        if app is not None and self.app is None:
+            self.app = app
+        if load_model:
+            self.model_loader.start()
+        if self.app is None or self.lease_seconds <= 0:
+            return
+        if self._maintenance_pid == os.getpid() and self._maintenance is not None and self._maintenance.is_alive():
+            return
+        with self.processing_lock:
+            if self._maintenance_pid == os.getpid() and self._maintenance is not None and self._maintenance.is_alive():
+                return
+            self._maintenance_pid = os.getpid()
+            self._maintenance_stop.clear()
+            self._maintenance = threading.Thread(target=self._maintenance_loop, name='ai-job-leases', daemon=True)
+            self._maintenance.start()
+
+    def _maintenance_loop(self):
+        # First pass right away so jobs interrupted by a restart resume promptly
+        interval = max(1.0, self.lease_seconds / 3)
+        delay = 0
+        while not self._maintenance_stop.wait(delay):
+            try:
+                with self.app.app_context():
+                    self._renew_leases()
+                    self.resume_interrupted()
+            except Exception as e:
+                logger.error(f"AI job lease maintenance failed: {str(e)}")
+            delay = interval
+
+    def _renew_leases(self):
+        from models.analysis_job import AnalysisJob
+        with self.processing_lock:
+            session_ids = [key for key, job in self.jobs.items() if job['status'] in ACTIVE_STATUSES]
+        AnalysisJob.heartbeat(session_ids, self.owner)
+
+    def _is_orphaned(self, record, now: datetime) -> bool:
+        """True if the job's owner can no longer be running it"""
+        if record.owner == self.owner:
+            # Ours by name but unknown here: the process restarted with the same pid
+            return record.session_id not in self.jobs
+        if record.heartbeat_at is None or (now - record.heartbeat_at).total_seconds() > self.lease_seconds:
+            return True
+        host, _, pid = (record.owner or '').rpartition(':')
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+        return False
+
+    def resume_interrupted(self) -> int:
+        """Take over queued/processing jobs whose owner died or stopped renewing its lease.
+
+        They are queued here and continue after their last checkpointed image;
+        jobs that were cancelled meanwhile are closed instead. Returns the
+        number of jobs taken over.
+        """
+        if self._stopping:
+            return 0
+        with self._resume_lock:
+            resumed = self._claim_interrupted(datetime.utcnow())
+        if resumed:
+            self.model_loader.start()
+            self._start_processing()
+        return resumed
+
+    def _claim_interrupted(self, now: datetime) -> int:
+        from models.analysis_job import AnalysisJob
+        
+        resumed = 0
+        for record in AnalysisJob.active():
+            if not self._is_orphaned(record, now):
+                continue
+            previous_owner = record.owner
+            if not AnalysisJob.claim(record.session_id, self.owner, previous_owner, record.heartbeat_at):
+                continue  # another process got there first
+            resumed += 1
+            
+            job = {
+                'session_id': record.session_id,
+                'test_id': record.test_id,
+                'image_paths': list(record.image_paths or []),
+                'priority': record.priority if record.priority in PRIORITY_LEVELS else 'normal',
+                'status': 'queued',
+                'created_at': record.created_at,
+                'progress': 0,
+                'remaining': self._unfinished_images(record.session_id, record.image_paths or []),
+                'cancel_requested': record.cancel_requested
+            }
+            if record.cancel_requested:
+                with self.processing_lock:
+                    self.jobs[record.session_id] = job
+                self._finish_cancelled(job)
+                continue
+            
+            logger.warning(f"Resuming interrupted AI job {record.session_id} (previous owner {previous_owner})")
+            with self.processing_lock:
+                self.jobs[record.session_id] = job
+                self._trace_queued(job, resumed=True)
+                self.processing_queue.push(job)
+            self._update_job(job, 'status')
+        return resumed
+
+    @staticmethod
+    def _unfinished_images(session_id: str, image_paths: List[str]) -> int:
+        """Images of a session still to be analysed: those that exist and have no checkpoint"""
+        from models.analysis_checkpoint import AnalysisCheckpoint
+        valid_paths = [path for path in image_paths if os.path.exists(path)]
+        return len(valid_paths) - AnalysisCheckpoint.count(session_id, valid_paths)
+
+    @property
+    def detector(self):
+        """The loaded MalariaDetector; blocks while the model is still loading"""
+        return self.model_loader.get()
+
+    @property
+    def is_processing(self) -> bool:
+        return bool(self._workers)
+
+    def _run_batch(self, image_paths: List[str], **options):
+        return self.detector.detect_batch(image_paths, **options)
+
+    def model_status(self) -> Dict:
+        return self.model_loader.status()
+
+    def add_to_processing_queue(self, session_id: str, test_id: str, image_paths: List[str],
+                                priority: str = 'normal', user_id: Optional[str] = None,
+                                lab: Optional[str] = None) -> bool:
+        """Add a job to the processing queue (priority is the test's low/normal/high/urgent).
+
+        Raises AdmissionRejected when the job would exceed the outstanding
+        image limits of the queue, the user or the lab (JobTooLarge when it
+        exceeds one on its own). Returns False when the model is unavailable
+        or the job's row cannot be written.
+        """
+        self.model_loader.start()
+        if self.model_loader.state == 'failed':
+            logger.error(f"MalariaDetector not available, cannot queue job: {self.model_status().get('error')}")
             return False
         
         logger.info(f"Adding job to queue: {session_id} with {len(image_paths)} images")
         
+        # Jobs run in a background thread; keep the app that queued them
+        # instead of building a new one for every job
+        if self.app is None and has_app_context():
+            self.app = current_app._get_current_object()
+        self.start()
+        
         job = {
             'session_id': session_id,
             'test_id': test_id,
             'image_paths': image_paths,
+            'priority': priority if priority in PRIORITY_LEVELS else 'normal',
             'status': 'queued',
             'created_at': datetime.utcnow(),
-            'progress': 0
+            'progress': 0,
+            'remaining': self._unfinished_images(session_id, image_paths),
+            'user_id': user_id,
+            'lab': lab
         }
         
         with self.processing_lock:
-            self.processing_queue.append(job)
-            logger.info(f"Added job to queue: {session_id} with {len(image_paths)} images")
+            existing = self.jobs.get(session_id)
+            if existing is not None and existing['status'] in ACTIVE_STATUSES:
+                logger.info(f"Job {session_id} is already {existing['status']}")
+                return True
+            # Checked and reserved under the lock, so concurrent requests
+            # cannot both squeeze in under a limit
+            try:
+                self.admission.check(self._active_jobs(), job['remaining'], user_id, lab,
+                                     self.service_time, self.job_workers)
+            except AdmissionRejected as e:
+                retry = f", retry after {e.retry_after}s" if e.retry_after is not None else ''
+                logger.warning(f"Rejected job {session_id}: {str(e)}{retry}")
+                raise
+            # Registered before its row is written, so the lease thread
+            # never mistakes it for an orphan
+            self.jobs[session_id] = job
         
-        if not self.is_processing:
-            logger.info("Starting processing loop")
-            self._start_processing()
+        # Persisted so the job can be cancelled from any worker and resumed
+        # after a crash; images already checkpointed for the session are kept
+        from models import db
+        from models.analysis_job import AnalysisJob
+        try:
+            AnalysisJob.start(session_id, test_id, job['priority'], image_paths, self.owner)
+        except Exception as e:
+            # Unregistered again, or it would hold its admission slot forever
+            # and make every retry for the session look already queued
+            logger.error(f"Failed to persist job {session_id}: {str(e)}")
+            db.session.rollback()
+            with self.processing_lock:
+                if self.jobs.get(session_id) is job:
+                    del self.jobs[session_id]
+            return False
+
+        with self.processing_lock:
+            self._trace_queued(job)
+            self.processing_queue.push(job)
+            logger.info(f"Added {job['priority']} job to queue: {session_id} with {len(image_paths)} images")
+        
+        self._update_job(job, 'status')
+        self._start_processing()
         
         return True
 
+    def cancel_job(self, session_id: str) -> bool:
+        """Cancel a queued or running job; returns False if there is no such job.
+
+        A queued job is dropped right away. A running job stops before its
+        next image; the flag is also stored on the job's row, so a job run
+        by another worker stops too.
+        """
+        from models.analysis_job import AnalysisJob
+        
+        with self.processing_lock:
+            job = self.jobs.get(session_id)
+            if job is not None and job['status'] not in ACTIVE_STATUSES:
+                job = None
+            if job is not None:
+                job['cancel_requested'] = True
+            queued = self.processing_queue.remove(session_id)
+        
+        found = AnalysisJob.request_cancel(session_id) or job is not None
+        if queued is not None:
+            self._finish_cancelled(queued)
+        return found
+
+    def _cancel_requested(self, job: Dict) -> bool:
+        if job.get('cancel_requested'):
+            return True
+        from models.analysis_job import AnalysisJob
+        job['cancel_requested'] = AnalysisJob.is_cancel_requested(job['session_id'])
+        return job['cancel_requested']
+
+    def _trace_queued(self, job: Dict, **attributes):
+        """Open the span covering the job's wait in the queue; ended when a worker picks it up"""
+        job['queue_span'] = tracer.start_span(
+            'ai.queue', trace_key=job['session_id'], session_id=job['session_id'], test_id=job['test_id'],
+            priority=job['priority'], images=len(job['image_paths']), **attributes
+        )
+
+    def _end_queue_span(self, job: Dict):
+        span = job.pop('queue_span', None)
+        if span is not None:
+            span.end()
+
+    def _finish_cancelled(self, job: Dict):
+        """Drop a cancelled job's checkpoints and close it"""
+        self._end_queue_span(job)
+        from models import db
+        from models.analysis_job import AnalysisJob
+        from models.analysis_checkpoint import AnalysisCheckpoint
+        
+        try:
+            AnalysisCheckpoint.clear(job['session_id'])
+            AnalysisJob.set_status(job['session_id'], 'cancelled')
+        except Exception as e:
+            logger.error(f"Failed to close cancelled job {job['session_id']}: {str(e)}")
+            db.session.rollback()
+        self._update_job(job, 'cancelled', status='cancelled')
+        logger.info(f"Job cancelled: {job['session_id']}")
+
     def get_job_status(self, session_id: str) -> Optional[Dict]:
-        """Get the status of a job in the queue"""
+        """Get the status of a queued, running or recently finished job"""
+        job = self.jobs.get(session_id)
+        if job is None:
+            return None
+        status = {
+            'status': job['status'],
+            'progress': job['progress']
+        }
+        if job['status'] in ACTIVE_STATUSES:
+            status['estimatedSecondsRemaining'] = self.estimate_seconds_remaining(session_id)
+        if job.get('error'):
+            status['error'] = job['error']
+        return status
+
+    def _active_jobs(self) -> List[Dict]:
+        """Queued and running jobs (call with processing_lock held)"""
+        return [job for job in self.jobs.values() if job['status'] in ACTIVE_STATUSES]
+
+    def outstanding_images(self) -> int:
+        with self.processing_lock:
+            return sum(job.get('remaining', 0) for job in self._active_jobs())
+
+    def estimate_seconds_remaining(self, session_id: str) -> Optional[int]:
+        """Seconds until a queued or running job is done, from the measured per-image time.
+
+        Counts the images of running jobs and of queued jobs that the
+        scheduler will start before this one.
+        """
+        with self.processing_lock:
+            job = self.jobs.get(session_id)
+            if job is None or job['status'] not in ACTIVE_STATUSES:
+                return None
+            ahead = sum(current.get('remaining', 0) for current in self.current_jobs.values()
+                        if current is not job)
+            if job['status'] == 'queued':
+                for queued in self.processing_queue:
+                    if queued is job:
+                        break
+                    ahead += queued.get('remaining', 0)
+            seconds = self.service_time.estimate(ahead, job.get('remaining', 0), self.job_workers)
+        return int(math.ceil(seconds))
+
+    def get_queue_status(self) -> Dict:
+        """Queue depth and wait times per priority, plus the job being processed"""
+        with self.processing_lock:
+            status = {
+                'isProcessing': self.is_processing,
+                'queued': len(self.processing_queue),
+                'byPriority': self.processing_queue.stats(),
+                'agingSeconds': self.processing_queue.aging_seconds,
+                'preemptions': self.preemptions,
+                'workers': {'active': len(self._workers), 'max': self.job_workers},
+                'currentJobs': [{
+                    'sessionId': current['session_id'],
+                    'testId': current['test_id'],
+                    'priority': current['priority'],
+                    'progress': current['progress']
+                } for current in self.current_jobs.values()]
+            }
+        status['outstandingImages'] = self.outstanding_images()
+        status['secondsPerImage'] = round(self.service_time.seconds_per_image, 3)
+        status['admission'] = self.admission.stats()
+        status['batching'] = self.batcher.stats()
+        status['model'] = self.model_status()
+        return status
+
+    def _should_preempt(self, job: Dict) -> bool:
+        """True if every worker is busy and the next queued job is of preempting priority and ranks ahead of this one"""
+        level = priority_level(job['priority'])
+        if level >= self.preempt_level:
+            return False
+        with self.processing_lock:
+            if len(self._workers) < self.job_workers:
+                return False  # a free worker will pick it up
+            head = self.processing_queue.peek()
+        return head is not None and priority_level(head['priority']) >= self.preempt_level \
+            and head['sort_key'] < job['sort_key']
+
+    def _update_job(self, job: Dict, event: str, **fields):
+        """Update a job's progress fields and publish them to stream listeners"""
+        image = fields.pop('image', None)
+        job.update(fields)
+        
+        data = {
+            'sessionId': job['session_id'],
+            'testId': job['test_id'],
+            'status': job['status'],
+            'progress': job['progress']
+        }
+        if job.get('totalImages') is not None:
+            data['totalImages'] = job['totalImages']
+        if image is not None:
+            data['image'] = image
+        if event in FINISHED_STATUSES:
+            data['error'] = job.get('error')
+            data['summary'] = job.get('summary')
+            if job.get('started_at') is not None:
+                metrics.job_seconds.observe(time.monotonic() - job['started_at'], outcome=event)
+            self._remember_finished(job)
+        progress_broker.publish(job['session_id'], event, data)
+
+    def _remember_finished(self, job: Dict):
+        """Keep finished jobs for status lookups, bounded to the most recent ones"""
         with self.processing_lock:
-            for job in self.processing_queue:
-                if job['session_id'] == session_id:
-                    return {
-                        'status': job['status'],
-                        'progress': job['progress']
-                    }
-        return None
+            self.jobs.move_to_end(job['session_id'])
+            finished = [key for key, value in self.jobs.items() if value['status'] in FINISHED_STATUSES]
+            for key in finished[:max(0, len(finished) - self.finished_job_limit)]:
+                del self.jobs[key]
 
     def _start_processing(self):
-        """Start the background processing thread"""
-        self.is_processing = True
-        processing_thread = threading.Thread(target=self._processing_loop, daemon=True)
-        processing_thread.start()
+        """Start another worker thread if jobs are waiting and the pool is not full"""
+        with self.processing_lock:
+            if self._stopping or not self.processing_queue or len(self._workers) >= self.job_workers:
+                return
+            self._worker_sequence += 1
+            thread = threading.Thread(target=self._processing_loop, name=f'ai-job-{self._worker_sequence}', daemon=True)
+            self._workers.add(thread)
+        logger.info("Starting processing loop")
+        thread.start()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Let the jobs in progress finish, then stop the processing loops.
+
+        Used on graceful worker shutdown; jobs still queued are not started
+        here but are resumed by another process once their lease expires.
+        """
+        self._maintenance_stop.set()
+        with self.processing_lock:
+            self._stopping = True
+            remaining = len(self.processing_queue)
+            workers = [thread for thread in self._workers if thread is not threading.current_thread()]
+        
+        if workers:
+            logger.info(f"Waiting for {len(workers)} AI job(s) to finish")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in workers:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                logger.warning("AI job still running at shutdown; it will resume from its last checkpoint")
+        if remaining:
+            logger.warning(f"{remaining} queued AI jobs were not processed before shutdown; they will be resumed")
 
     def _processing_loop(self):
-        """Main processing loop that runs in background thread"""
+        """Worker loop: runs queued jobs until the queue is empty"""
         logger.info("Processing loop started")
+        worker = threading.current_thread()
         
-        while self.is_processing:
-            job = None
+        while True:
             with self.processing_lock:
-                if not self.processing_queue:
-                    self.is_processing = False
+                if self._stopping or not self.processing_queue:
+                    self._workers.discard(worker)
                     logger.info("No more jobs in queue, stopping processing loop")
                     break
-                job = self.processing_queue.pop(0)
+                job = self.processing_queue.pop()
+                self.current_jobs[worker.name] = job
+            self._end_queue_span(job)
+            if 'wait_recorded' not in job:
+                metrics.job_wait_seconds.observe(job['started_at'] - job['queued_at'], priority=job['priority'])
+                job['wait_recorded'] = True
             
-            if job:
-                logger.info(f"Processing job: {job['session_id']} with {len(job['image_paths'])} images")
+            logger.info(f"Processing {job['priority']} job: {job['session_id']} with {len(job['image_paths'])} images")
+            try:
                 self._process_job(job)
+            finally:
+                with self.processing_lock:
+                    self.current_jobs.pop(worker.name, None)
+            # A preempted job went back to the queue; make sure someone runs it
+            self._start_processing()
 
     def _process_job(self, job: Dict):
         """Process a single job with Flask app context"""
-        from app import create_app
-        app = create_app()
+        app = self.app
+        if app is None:
+            from app import create_app
+            app = self.app = create_app()
         
-        with app.app_context():
+        with app.app_context(), tracer.start_span(
+            'ai.job', trace_key=job['session_id'], session_id=job['session_id'], test_id=job['test_id'],
+            priority=job['priority'], worker=threading.current_thread().name
+        ):
             self._process_job_with_context(job)
 
+    def _save_annotated_image(self, img_path: str, annotated_frame) -> Optional[str]:
+        """Write YOLO's plotted frame next to the session's uploads; returns its URL"""
+        if annotated_frame is None:
+            return None
+        try:
+            import cv2
+            
+            # Set up directory
+            upload_dir = os.path.join(server_dir, 'uploads')
+            session_dir = os.path.basename(os.path.dirname(img_path))
+            annotated_dir = os.path.join(upload_dir, session_dir)
+            os.makedirs(annotated_dir, exist_ok=True)
+            
+            annotated_filename = f"annotated_{os.path.basename(img_path)}"
+            annotated_path = os.path.join(annotated_dir, annotated_filename)
+            
+            with metrics.stage('save_annotated'):
+                cv2.imwrite(annotated_path, annotated_frame)
+            annotated_url = f"/uploads/{session_dir}/{annotated_filename}"
+            logger.debug("Generated annotated image: %s", annotated_url)
+            return annotated_url
+        except Exception as e:
+            logger.error(f"Error generating annotated image: {e}")
+            return None
+
     def _store_analysis_results(self, test_id: str, all_results: List[Dict]) -> bool:
-        """Stores results and generates annotated images using YOLO native plot"""
+        """Stores results, linking the annotated images written during detection"""
         try:
             from models import db
             from models.test import Test
@@ -147,8 +600,7 @@ class AIAnalysisService:
             # totals. We'll allow add_detection to accumulate per-image
             # values and compute overall totals after adding detections
             # to avoid double-counting.
-            logger.info("=== DIAGNOSIS RESULT DEBUG ===")
-            
+
             # ✅ CALCULATE MOST PROBABLE PARASITE
             most_probable = None
             max_confidence = 0
@@ -165,8 +617,6 @@ class AIAnalysisService:
                         max_confidence = parasite['confidence']
                         most_probable = parasite['type']
             
-            logger.info(f"Most probable parasite: {most_probable} with confidence {max_confidence}")
-            
             # Do not pre-calculate totals here; create a DiagnosisResult
             # with zeroed totals and let per-image add_detection calls
             # accumulate the totals. We'll compute the final ratio after
@@ -188,35 +638,11 @@ class AIAnalysisService:
                     max_confidence,
                     parasite_names.get(most_probable, most_probable)
                 )
-                logger.info(f"Set most probable parasite: {most_probable} ({parasite_names.get(most_probable)})")
-            else:
-                logger.info("No parasites detected, most probable parasite is None")
 
             # Process each image and add detections
             for i, result in enumerate(all_results):
-                annotated_url = None
-                img_path = result.get('imagePath', '')
-                
-                if img_path and os.path.exists(img_path):
-                    try:
-                        # Use YOLO's built-in plotting
-                        yolo_results = self.detector.model.predict(img_path, conf=0.26, verbose=False)
-                        annotated_frame = yolo_results[0].plot(labels=True, conf=True, boxes=True)
-
-                        # Set up directory
-                        upload_dir = os.path.join(server_dir, 'uploads')
-                        session_dir = os.path.basename(os.path.dirname(img_path))
-                        annotated_dir = os.path.join(upload_dir, session_dir)
-                        os.makedirs(annotated_dir, exist_ok=True)
-                        
-                        annotated_filename = f"annotated_{os.path.basename(img_path)}"
-                        annotated_path = os.path.join(annotated_dir, annotated_filename)
-                        
-                        cv2.imwrite(annotated_path, annotated_frame)
-                        annotated_url = f"/uploads/{session_dir}/{annotated_filename}"
-                        logger.info(f"Generated annotated image: {annotated_url}")
-                    except Exception as e:
-                        logger.error(f"Error generating annotated image: {e}")
+                # Annotated images are written during detection (see _save_annotated_image)
+                annotated_url = result.get('annotatedImageUrl')
 
                 # Add detection to diagnosis result
                 diagnosis_result.add_detection(
@@ -243,13 +669,11 @@ class AIAnalysisService:
             diagnosis_result.calculate_severity()
             diagnosis_result.calculate_overall_confidence()  # ✅ CALCULATE CONFIDENCE
             
-            logger.info(f"Diagnosis result created:")
-            logger.info(f"  - Status: {diagnosis_result.status}")
-            logger.info(f"  - Total Parasites: {diagnosis_result.total_parasites}")
-            logger.info(f"  - Total WBCs: {diagnosis_result.total_wbcs}")
-            logger.info(f"  - Ratio: {diagnosis_result.parasite_wbc_ratio}")
-            logger.info(f"  - Severity: {diagnosis_result.severity_level}")
-            logger.info(f"  - Confidence: {diagnosis_result.confidence}")
+            logger.info("Diagnosis result for test %s: status=%s parasites=%s wbcs=%s ratio=%.3f "
+                        "severity=%s confidence=%s top=%s (%.2f)", test_id, diagnosis_result.status,
+                        diagnosis_result.total_parasites, diagnosis_result.total_wbcs,
+                        diagnosis_result.parasite_wbc_ratio or 0.0, diagnosis_result.severity_level,
+                        diagnosis_result.confidence, most_probable, max_confidence)
             
             # Save to database
             db.session.add(diagnosis_result)
@@ -272,10 +696,21 @@ class AIAnalysisService:
             return False
 
     def _process_job_with_context(self, job: Dict):
-        """Process job with database context"""
+        """Process job with database context.
+
+        Each image's detection is checkpointed as soon as it is done, so a
+        preempted, failed or interrupted job picks up where it stopped; the
+        cancellation flag is checked between images.
+        """
+        from models import db
+        from models.analysis_job import AnalysisJob
+        from models.analysis_checkpoint import AnalysisCheckpoint
+        
+        session_id = job['session_id']
         try:
-            job['status'] = 'processing'
-            job['progress'] = 10
+            if self._cancel_requested(job):
+                self._finish_cancelled(job)
+                return
             
             # Filter valid image paths
             valid_paths = [p for p in job['image_paths'] if os.path.exists(p)]
@@ -283,60 +718,162 @@ class AIAnalysisService:
             
             if not valid_paths:
                 logger.error("No valid image paths found")
-                job['status'] = 'failed'
-                job['error'] = 'No valid image paths'
+                self._fail_job(job, 'No valid image paths')
                 return
             
-            job['progress'] = 20
+            checkpoints = AnalysisCheckpoint.for_session(session_id)
+            done = sum(1 for path in valid_paths if path in checkpoints)
+            job['remaining'] = len(valid_paths) - done
+            span = tracer.current_span()
+            if span is not None:
+                span.set_attribute('images', len(valid_paths))
+                span.set_attribute('checkpointed_images', done)
+            if done:
+                logger.info(f"Resuming job {session_id} at image {done + 1}/{len(valid_paths)}")
+            AnalysisJob.set_status(session_id, 'processing')
+            self._update_job(job, 'status', status='processing',
+                             progress=int(20 + (done / len(valid_paths)) * 60), totalImages=len(valid_paths))
+            
+            try:
+                self.model_loader.get()  # waits while the model is still loading
+            except ModelNotReady as e:
+                logger.error(str(e))
+                self._fail_job(job, str(e))
+                return
             
             # Process each image
             all_results = []
+            processed = 0
             for i, image_path in enumerate(valid_paths):
-                logger.info(f"Processing image {i+1}/{len(valid_paths)}: {image_path}")
-                
-                result, error = self.detector.detectAndQuantify(image_path)
-                
-                if error:
-                    logger.error(f"Error processing {image_path}: {error}")
+                checkpoint = checkpoints.get(image_path)
+                if checkpoint is not None:
+                    all_results.append(checkpoint.result)
                     continue
                 
-                # Add metadata to result
-                result['imagePath'] = image_path
-                result['originalFilename'] = os.path.basename(image_path)
-                result['imageQuality'] = 1.0  # Default quality
+                if self._cancel_requested(job):
+                    self._finish_cancelled(job)
+                    return
+                if processed and self._should_preempt(job):
+                    # Yield to an urgent test between images; the job keeps
+                    # its place in the queue and continues from its checkpoints
+                    with self.processing_lock:
+                        self._trace_queued(job, preempted=True)
+                        self.processing_queue.push(job)
+                        self.preemptions += 1
+                    AnalysisJob.set_status(session_id, 'queued')
+                    self._update_job(job, 'status', status='queued')
+                    logger.info(f"Job {session_id} preempted after {i}/{len(valid_paths)} images")
+                    return
                 
-                all_results.append(result)
-                
-                # Update progress
-                progress_percent = 20 + ((i + 1) / len(valid_paths)) * 60
-                job['progress'] = int(progress_percent)
-                logger.info(f"Progress: {job['progress']}%")
+                logger.debug("Processing image %d/%d: %s", i + 1, len(valid_paths), image_path)
+                with tracer.start_span('ai.image', index=i, filename=os.path.basename(image_path)):
+                    result = self._analyse_image(job, i, image_path, len(valid_paths))
+                processed += 1
+                if result is not None:
+                    all_results.append(result)
+                logger.debug("Progress: %s%%", job['progress'])
+            
+            if self._cancel_requested(job):
+                self._finish_cancelled(job)
+                return
             
             if not all_results:
                 logger.error("No images were successfully processed")
-                job['status'] = 'failed'
-                job['error'] = 'No images processed successfully'
+                self._fail_job(job, 'No images processed successfully')
                 return
             
-            job['progress'] = 80
+            self._update_job(job, 'status', progress=80)
             
             # Store results in database
             logger.info(f"Storing {len(all_results)} results in database")
-            success = self._store_analysis_results(job['test_id'], all_results)
+            with metrics.stage('db_store'), tracer.start_span('db.store_results', images=len(all_results)) as span:
+                success = self._store_analysis_results(job['test_id'], all_results)
+                if not success:
+                    span.record_error('Failed to store results')
             
             if success:
-                job['status'] = 'completed'
-                job['progress'] = 100
-                logger.info(f"Job completed successfully: {job['session_id']}")
+                AnalysisCheckpoint.clear(session_id)
+                AnalysisJob.set_status(session_id, 'completed')
+                self._update_job(job, 'completed', status='completed', progress=100, summary={
+                    'imagesProcessed': len(all_results),
+                    'totalParasites': sum(r.get('parasiteCount', 0) for r in all_results),
+                    'totalWbcs': sum(r.get('whiteBloodCellsDetected', 0) for r in all_results)
+                })
+                logger.info(f"Job completed successfully: {session_id}")
             else:
-                job['status'] = 'failed'
-                job['error'] = 'Failed to store results'
-                logger.error(f"Failed to store results for job: {job['session_id']}")
+                self._fail_job(job, 'Failed to store results')
+                logger.error(f"Failed to store results for job: {session_id}")
                 
         except Exception as e:
             logger.error(f"Error processing job: {e}", exc_info=True)
-            job['status'] = 'failed'
-            job['error'] = str(e)
+            db.session.rollback()
+            self._fail_job(job, str(e))
+
+    def _analyse_image(self, job: Dict, index: int, image_path: str, total: int) -> Optional[Dict]:
+        """Detect one image, checkpoint it and report progress; returns its result, or None on error"""
+        from models.analysis_checkpoint import AnalysisCheckpoint
+        
+        session_id = job['session_id']
+        
+        # Goes through the batcher, which may run it together with
+        # images from other jobs; YOLO's plot comes back with the result
+        started = time.perf_counter()
+        with tracer.start_span('ai.inference') as span:
+            result, error = self.batcher.detect(image_path, annotate=True)
+            if error:
+                span.record_error(error)
+        self.service_time.observe(time.perf_counter() - started)
+        job['remaining'] -= 1
+        progress = int(20 + ((index + 1) / total) * 60)
+        
+        metrics.image_processed('error' if error else 'ok')
+        if error:
+            # Not checkpointed: the image is tried again if the job resumes
+            logger.error(f"Error processing {image_path}: {error}")
+            self._update_job(job, 'image', progress=progress, image={
+                'index': index, 'total': total,
+                'filename': os.path.basename(image_path), 'error': error
+            })
+            return None
+        
+        # Add metadata to result
+        with tracer.start_span('ai.save_annotated'):
+            result['annotatedImageUrl'] = self._save_annotated_image(image_path, result.pop('annotatedFrame', None))
+        result['imagePath'] = image_path
+        result['originalFilename'] = os.path.basename(image_path)
+        result['imageQuality'] = 1.0  # Default quality
+        
+        with tracer.start_span('db.checkpoint'):
+            AnalysisCheckpoint.save(session_id, index, image_path, result)
+        
+        current = tracer.current_span()
+        if current is not None:
+            current.set_attribute('parasite_count', result.get('parasiteCount', 0))
+            current.set_attribute('wbc_count', result.get('whiteBloodCellsDetected', 0))
+        
+        # Update progress and push this image's counts to listeners
+        self._update_job(job, 'image', progress=progress, image={
+            'index': index,
+            'total': total,
+            'filename': result['originalFilename'],
+            'parasiteCount': result.get('parasiteCount', 0),
+            'wbcCount': result.get('whiteBloodCellsDetected', 0),
+            'parasiteWbcRatio': result.get('parasiteWbcRatio', 0.0)
+        })
+        return result
+
+    def _fail_job(self, job: Dict, error: str):
+        """Mark a job failed; its checkpoints stay, so queueing the session again
+        resumes it and retries only the images without a result"""
+        from models import db
+        from models.analysis_job import AnalysisJob
+        
+        try:
+            AnalysisJob.set_status(job['session_id'], 'failed', error=error)
+        except Exception as e:
+            logger.error(f"Failed to record failure of job {job['session_id']}: {str(e)}")
+            db.session.rollback()
+        self._update_job(job, 'failed', status='failed', error=error)
 
 # Create singleton instance
 ai_service = AIAnalysisService()
\ No newline at end of file
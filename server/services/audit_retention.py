@@ -0,0 +1,347 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.activity_log import ActivityLog
+from models.activity_log_archive import ActivityLogArchive
+from utils.json_provider import encode_default
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = [column.name for column in ActivityLog.__table__.columns]
+JSON_COLUMNS = {'user_info', 'details', 'request_info'}
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def default_archive_dir():
+    """Archives hold patient audit data, so by default they live in the user's
+    data directory rather than anywhere under the source tree"""
+    data_home = os.getenv('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(data_home, 'malaria-lab', 'audit_archive')
+
+
+def month_start(year, month):
+    return datetime(year, month, 1)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def months_back(now, months):
+    """(year, month) that lies `months` calendar months before now"""
+    index = now.year * 12 + (now.month - 1) - months
+    return index // 12, index % 12 + 1
+
+
+class AuditRetention:
+    """Monthly partitioning of activity logs by archival.
+
+    activity_logs keeps the most recent AUDIT_RETENTION_MONTHS calendar
+    months. Each older month is copied, as one unit, into its own SQLite
+    file, gzip-compressed under AUDIT_ARCHIVE_DIR and recorded in
+    activity_log_archives, then deleted from the hot table. Daily rollups
+    are never archived, so summaries keep covering archived months.
+
+    Archiving is opt-in (AUDIT_RETENTION_MONTHS=0, the default, keeps every
+    log in activity_logs). Archived months are only visible to the export
+    endpoint, which reads them back with read_archive(); the list endpoints
+    show hot rows only.
+
+    The job runs in a background thread every AUDIT_RETENTION_INTERVAL_HOURS;
+    the archive row doubles as a per-month claim, so several workers can run
+    it without archiving a month twice. A claim still 'running' after
+    AUDIT_ARCHIVE_CLAIM_TIMEOUT_MINUTES belongs to a process that died and
+    is taken over.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.retention_months = int(os.getenv('AUDIT_RETENTION_MONTHS', 0))
+        self.archive_dir = os.path.abspath(os.getenv('AUDIT_ARCHIVE_DIR') or default_archive_dir())
+        self.interval = float(os.getenv('AUDIT_RETENTION_INTERVAL_HOURS', 24)) * 3600
+        self.claim_timeout = timedelta(minutes=float(os.getenv('AUDIT_ARCHIVE_CLAIM_TIMEOUT_MINUTES', 60)))
+        app.extensions['audit_retention'] = self
+        self.start()
+
+    def start(self):
+        """Start the background thread in this process (threads do not survive a fork)"""
+        if self.retention_months <= 0 or self.interval <= 0:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # First pass after a short delay so startup (and create_all) is not slowed down
+        delay = min(300, self.interval)
+        while not self._stop.wait(delay):
+            try:
+                with self.app.app_context():
+                    self.archive_expired()
+            except Exception as e:
+                logger.error(f"Audit retention run failed: {str(e)}")
+            delay = self.interval
+
+    def due_months(self, now=None):
+        """(year, month) pairs older than the retention window that still have hot rows"""
+        if self.retention_months <= 0:
+            return []  # archiving disabled
+        now = now or datetime.utcnow()
+        cutoff = month_start(*months_back(now, self.retention_months - 1))
+        oldest = db.session.execute(
+            db.select(db.func.min(ActivityLog.created_at)).where(ActivityLog.created_at < cutoff)
+        ).scalar()
+        if oldest is None:
+            return []
+
+        months = []
+        year, month = oldest.year, oldest.month
+        while month_start(year, month) < cutoff:
+            months.append((year, month))
+            year, month = next_month(year, month)
+        return months
+
+    def archive_expired(self, now=None):
+        """Archive every month that has fallen out of the retention window"""
+        archived = []
+        for year, month in self.due_months(now):
+            archive = self.archive_month(year, month)
+            if archive is not None:
+                archived.append(archive)
+        return archived
+
+    def archive_month(self, year, month):
+        """Move one month of activity logs into a compressed SQLite archive.
+
+        Returns the ActivityLogArchive row, or None when the month has no rows
+        or another worker holds it. Hot rows are only deleted after the archive file has been
+        written and its row count checked.
+        """
+        label = f'{year:04d}-{month:02d}'
+        start = month_start(year, month)
+        end = month_start(*next_month(year, month))
+
+        has_rows = db.session.execute(
+            db.select(ActivityLog.id).where(ActivityLog.created_at >= start, ActivityLog.created_at < end).limit(1)
+        ).first()
+        if has_rows is None:
+            return None
+
+        archive = self._claim(label)
+        if archive is None:
+            return None
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f'activity_logs_{year:04d}_{month:02d}.sqlite.gz')
+
+        try:
+            row_count, sha256 = self._write_archive(start, end, path)
+            hot_count = db.session.execute(
+                db.select(db.func.count()).select_from(ActivityLog)
+                .where(ActivityLog.created_at >= start, ActivityLog.created_at < end)
+            ).scalar()
+            if hot_count != row_count:
+                raise RuntimeError(f'archive has {row_count} rows but {hot_count} are stored')
+
+            db.session.execute(
+                db.delete(ActivityLog).where(ActivityLog.created_at >= start, ActivityLog.created_at < end)
+            )
+            archive.status = 'archived'
+            archive.row_count = row_count
+            archive.path = path
+            archive.sha256 = sha256
+            archive.error = None
+            archive.archived_at = datetime.utcnow()
+            db.session.commit()
+            logger.info(f"Archived {row_count} activity logs for {label} to {path}")
+            return archive
+
+        except Exception as e:
+            db.session.rollback()
+            archive = db.session.get(ActivityLogArchive, label)
+            archive.status = 'failed'
+            archive.error = str(e)
+            db.session.commit()
+            logger.error(f"Failed to archive activity logs for {label}: {str(e)}")
+            return archive
+
+    def _claim(self, label):
+        """Insert (or retake a failed or stale) archive row for the month; None if taken.
+
+        created_at is reset on every claim, so it tells how long the current
+        claim has been running.
+        """
+        try:
+            with db.session.begin_nested():
+                db.session.add(ActivityLogArchive(month=label, status='running'))
+            db.session.commit()
+            return db.session.get(ActivityLogArchive, label)
+        except IntegrityError:
+            db.session.rollback()
+
+        now = datetime.utcnow()
+        retaken = db.session.execute(
+            db.update(ActivityLogArchive)
+            .where(ActivityLogArchive.month == label, db.or_(
+                ActivityLogArchive.status == 'failed',
+                db.and_(ActivityLogArchive.status == 'running',
+                        ActivityLogArchive.created_at < now - self.claim_timeout)
+            ))
+            .values(status='running', error=None, created_at=now)
+        )
+        db.session.commit()
+        if retaken.rowcount == 0:
+            return None
+        return db.session.get(ActivityLogArchive, label)
+
+    def _write_archive(self, start, end, path):
+        """Stream [start, end) into a temporary SQLite file, gzip it to path; returns (rows, sha256)"""
+        table = ActivityLog.__table__
+        statement = db.select(table).where(table.c.created_at >= start, table.c.created_at < end)\
+            .order_by(table.c.created_at).execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite', dir=self.archive_dir)
+        os.close(fd)
+        try:
+            archive_db = sqlite3.connect(tmp_path)
+            columns = ', '.join(ARCHIVE_COLUMNS)
+            placeholders = ', '.join('?' for _ in ARCHIVE_COLUMNS)
+            archive_db.execute(f'CREATE TABLE activity_logs ({columns})')
+
+            row_count = 0
+            result = db.session.execute(statement).mappings()
+            for batch in result.partitions():
+                archive_db.executemany(
+                    f'INSERT INTO activity_logs ({columns}) VALUES ({placeholders})',
+                    [[self._archive_value(name, row[name]) for name in ARCHIVE_COLUMNS] for row in batch]
+                )
+                row_count += len(batch)
+            archive_db.execute('CREATE INDEX ix_activity_logs_created_at ON activity_logs (created_at)')
+            archive_db.commit()
+            archive_db.close()
+
+            digest = hashlib.sha256()
+            with open(tmp_path, 'rb') as source, gzip.open(path, 'wb') as target:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    target.write(chunk)
+            return row_count, digest.hexdigest()
+        finally:
+            os.unlink(tmp_path)
+
+    @staticmethod
+    def _archive_value(name, value):
+        if name in JSON_COLUMNS:
+            return json.dumps(value, default=encode_default) if value is not None else None
+        if isinstance(value, datetime):
+            return value.isoformat(sep=' ')
+        return value
+
+    @staticmethod
+    def read_archive(path, start=None, end=None, descending=False):
+        """Yield the archived logs in a .sqlite.gz file as to_dict()-shaped dicts.
+
+        start/end (inclusive datetimes) limit the rows by created_at.
+        """
+        conditions, params = [], []
+        for operator, bound in (('>=', start), ('<=', end)):
+            if bound is not None:
+                conditions.append(f'created_at {operator} ?')
+                params.append(bound.replace(tzinfo=None).isoformat(sep=' '))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'DESC' if descending else 'ASC'
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite')
+        try:
+            with gzip.open(path, 'rb') as source, os.fdopen(fd, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            archive_db = sqlite3.connect(tmp_path)
+            archive_db.row_factory = sqlite3.Row
+            try:
+                for row in archive_db.execute(f'SELECT * FROM activity_logs{where} ORDER BY created_at {order}', params):
+                    yield {
+                        'id': row['id'],
+                        'action': row['action'],
+                        'status': row['status'],
+                        'riskLevel': row['risk_level'],
+                        'userId': row['user_id'],
+                        'userInfo': json.loads(row['user_info']) if row['user_info'] else None,
+                        'resourceType': row['resource_type'],
+                        'resourceId': row['resource_id'],
+                        'resourceName': row['resource_name'],
+                        'details': json.loads(row['details']) if row['details'] else None,
+                        'requestInfo': json.loads(row['request_info']) if row['request_info'] else None,
+                        'createdAt': row['created_at']
+                    }
+            finally:
+                archive_db.close()
+        finally:
+            os.unlink(tmp_path)
+
+    @classmethod
+    def archived_logs(cls, start, end):
+        """Archived logs with created_at in [start, end], newest first, from every archived month in range"""
+        first = f'{start.year:04d}-{start.month:02d}'
+        last = f'{end.year:04d}-{end.month:02d}'
+        archives = db.session.execute(
+            db.select(ActivityLogArchive)
+            .where(ActivityLogArchive.status == 'archived',
+                   ActivityLogArchive.month >= first, ActivityLogArchive.month <= last)
+            .order_by(ActivityLogArchive.month.desc())
+        ).scalars().all()
+        for archive in archives:
+            yield from cls.read_archive(archive.path, start, end, descending=True)
+
+
+# Global instance
+audit_retention = AuditRetention()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from models.activity_log_rollup import ActivityLogRollup
+
+    # Usage (from server/): python -m services.audit_retention [--months 12] [--rebuild-rollups]
+    parser = argparse.ArgumentParser(description='Archive expired activity logs and maintain rollups')
+    parser.add_argument('--months', type=int, default=None, help='Months to keep in activity_logs')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute daily rollups from hot logs')
+    args = parser.parse_args()
+
+    os.environ['AUDIT_RETENTION_INTERVAL_HOURS'] = '0'  # run once, no background thread
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if args.months is not None:
+            audit_retention.retention_months = args.months
+        if args.rebuild_rollups:
+            # Archived days are no longer in activity_logs; keep their rollups
+            first_log = db.session.execute(db.select(db.func.min(ActivityLog.created_at))).scalar()
+            if first_log is not None:
+                print(f"Rebuilt {ActivityLogRollup.rebuild(first_log.date())} rollup rows")
+        for archive in audit_retention.archive_expired():
+            print(f"{archive.month}: {archive.status} ({archive.row_count} rows) {archive.path or archive.error}")
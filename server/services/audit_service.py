@@ -1,6 +1,7 @@
 from flask import request
 from models.activity_log import ActivityLog
 from models.user import User
+from services.audit_writer import audit_writer
 
 class AuditService:
     """Service for logging user activities and maintaining audit trail"""
@@ -27,18 +28,21 @@ class AuditService:
             'role': user.role,
             'firstName': user.first_name,
             'lastName': user.last_name,
-            'department': user.department,
-            'permissions': user.permissions
+            'department': user.department
         }
     
     @staticmethod
     def log_activity(action, user_id, user_info, resource_type, resource_id=None, 
                     resource_name=None, details=None, status='success', risk_level='low'):
-        """Log an activity with comprehensive information"""
+        """Log an activity with comprehensive information.
+
+        The record is queued on the audit writer and inserted in the next
+        batch, so the request does not pay for a second commit.
+        """
         try:
             request_info = AuditService.get_request_info()
             
-            log = ActivityLog.log_activity(
+            log = audit_writer.submit(
                 action=action,
                 user_id=user_id,
                 user_info=user_info,
@@ -0,0 +1,291 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: segments are only recovered by the process that wrote them
+    fcntl = None
+
+from models import db
+from models.activity_log import ActivityLog
+from models.activity_log_rollup import ActivityLogRollup
+from utils.json_provider import encode_default
+
+logger = logging.getLogger(__name__)
+
+
+class _Segment:
+    """One append-only WAL file; the owning process holds an exclusive lock on it"""
+
+    def __init__(self, path):
+        self.path = path
+        # Lock under a temporary name first so recovery never sees an unlocked segment
+        pending_path = path + '.new'
+        self.fd = os.open(pending_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(pending_path, path)
+        self.records = []
+        self.dirty = False
+
+    def append(self, line, record):
+        os.write(self.fd, line)
+        self.records.append(record)
+        self.dirty = True
+
+    def sync(self):
+        if self.dirty:
+            os.fsync(self.fd)
+            self.dirty = False
+
+    def close(self, remove=False):
+        if self.fd is None:
+            return
+        if remove:
+            os.unlink(self.path)
+        os.close(self.fd)  # releases the lock
+        self.fd = None
+
+
+class AuditWriter:
+    """Batched, asynchronous writer for activity logs.
+
+    Each record is appended to a local write-ahead segment (one unbuffered
+    write, so it survives a crash of the process) and queued in memory. A
+    background thread seals the segment every AUDIT_FLUSH_INTERVAL seconds,
+    or as soon as AUDIT_BATCH_SIZE records are waiting, bulk-inserts its
+    records in one transaction and deletes the file. Segments left behind by
+    a crashed process are replayed on startup. Records carry their primary
+    key from the start and replays skip IDs that are already stored, so
+    delivery is at-least-once without duplicate rows.
+
+    AUDIT_WAL_FSYNC controls durability against power loss: 'interval'
+    (default) fsyncs the active segment once per flush interval, 'always'
+    fsyncs every record and 'never' leaves it to the OS.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._segment = None
+        self._sealed = []  # segments waiting to be (re)inserted
+        self._sequence = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = os.getenv('AUDIT_ASYNC', 'true').lower() == 'true'
+        self.wal_dir = os.path.abspath(os.getenv('AUDIT_WAL_DIR', os.path.join('logs', 'audit_wal')))
+        self.flush_interval = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+        self.batch_size = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+        self.fsync_mode = os.getenv('AUDIT_WAL_FSYNC', 'interval')
+        app.extensions['audit_writer'] = self
+
+        if self.enabled:
+            os.makedirs(self.wal_dir, exist_ok=True)
+            atexit.register(self.shutdown)
+            logger.info(f"Audit writer: batching into {self.wal_dir} every {self.flush_interval}s")
+
+    def submit(self, **fields):
+        """Queue an activity log record; returns the record dict (with its id).
+
+        Falls back to a synchronous insert when batching is disabled or the
+        WAL cannot be written.
+        """
+        if fields.get('action') not in ActivityLog.VALID_ACTIONS:
+            raise ValueError(f"Invalid action: {fields.get('action')}")
+
+        record = {
+            'id': str(uuid.uuid4()),
+            'status': 'success',
+            'risk_level': 'low',
+            **fields,
+            'created_at': datetime.utcnow()
+        }
+
+        if self.enabled:
+            try:
+                self._append(record)
+                return record
+            except OSError as e:
+                logger.error(f"Audit WAL write failed, logging synchronously: {str(e)}")
+
+        ActivityLog.log_activity(**{key: value for key, value in record.items() if key not in ('id', 'created_at')})
+        return record
+
+    def flush(self):
+        """Insert everything queued so far (blocking)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._seal()
+        self._insert_sealed()
+
+    def shutdown(self):
+        """Stop the flush thread and insert what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final audit flush failed; records remain in the WAL: {str(e)}")
+
+    def _append(self, record):
+        line = json.dumps(record, default=encode_default, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._lock:
+            self._ensure_started()
+            if self._segment is None:
+                self._segment = self._open_segment()
+            self._segment.append(line, record)
+            if self.fsync_mode == 'always':
+                self._segment.sync()
+            pending = len(self._segment.records)
+
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_started(self):
+        """Start the flush thread lazily, once per process (safe across fork)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        if self._pid is not None and self._pid != os.getpid():
+            # Forked child: drop our copies of the parent's segment descriptors
+            # so the parent's locks are released when the parent exits
+            for segment in self._sealed + ([self._segment] if self._segment else []):
+                segment.close()
+            self._segment = None
+            self._sealed = []
+        self._pid = os.getpid()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = f'audit-{os.getpid()}-{int(time.time() * 1000)}-{self._sequence}.jsonl'
+        return _Segment(os.path.join(self.wal_dir, name))
+
+    def _seal(self):
+        """Move the active segment to the sealed list (caller holds the lock)"""
+        if self._segment is not None and self._segment.records:
+            if self.fsync_mode != 'never':
+                self._segment.sync()
+            self._sealed.append(self._segment)
+            self._segment = None
+
+    def _run(self):
+        try:
+            self._recover()
+        except Exception as e:
+            logger.error(f"Audit WAL recovery failed: {str(e)}")
+
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._lock:
+                    self._seal()
+                self._insert_sealed()
+            except Exception as e:
+                logger.error(f"Audit flush failed, will retry: {str(e)}")
+
+    def _insert_sealed(self):
+        with self._lock:
+            sealed, self._sealed = self._sealed, []
+
+        for index, segment in enumerate(sealed):
+            try:
+                self._bulk_insert(segment.records)
+                segment.close(remove=True)
+            except Exception:
+                # Keep this and the remaining segments for the next round
+                with self._lock:
+                    self._sealed = sealed[index:] + self._sealed
+                raise
+
+    def _bulk_insert(self, records):
+        """Insert records in one transaction, skipping IDs that are already stored"""
+        if not records:
+            return
+        with self.app.app_context():
+            try:
+                ids = [record['id'] for record in records]
+                existing = set()
+                for start in range(0, len(ids), 500):
+                    existing.update(db.session.execute(
+                        db.select(ActivityLog.id).where(ActivityLog.id.in_(ids[start:start + 500]))
+                    ).scalars())
+
+                rows = [record for record in records if record['id'] not in existing]
+                if rows:
+                    db.session.execute(db.insert(ActivityLog), rows)
+                    self._after_insert(rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _after_insert(self, rows):
+        """Daily rollups are updated in the same transaction as the batch"""
+        ActivityLogRollup.add_counts(rows)
+
+    def _recover(self):
+        """Replay segments left behind by crashed processes"""
+        if self.app is None:
+            return
+        for path in sorted(glob.glob(os.path.join(self.wal_dir, 'audit-*.jsonl'))):
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # still owned by a live process
+                elif not os.path.basename(path).startswith(f'audit-{os.getpid()}-'):
+                    continue
+
+                records = self._read_segment(path)
+                self._bulk_insert(records)
+                os.unlink(path)
+                logger.info(f"Recovered {len(records)} audit records from {os.path.basename(path)}")
+            except Exception as e:
+                logger.error(f"Failed to recover audit segment {path}: {str(e)}")
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _read_segment(path):
+        records = []
+        with open(path, 'rb') as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn final write
+                record['created_at'] = datetime.fromisoformat(record['created_at'])
+                records.append(record)
+        return records
+
+
+# Global instance
+audit_writer = AuditWriter()
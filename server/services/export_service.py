@@ -0,0 +1,140 @@
+import csv
+import io
+import logging
+
+from flask import Response, current_app, stream_with_context
+
+from middleware.compression import gzip_chunks
+from models import db
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('json', 'csv', 'ndjson')
+EXPORT_MIME_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per round trip; on PostgreSQL yield_per also turns on a
+# server-side cursor, so only one batch is ever held in memory
+EXPORT_BATCH_SIZE = 1000
+
+# Small rows are coalesced into chunks of about this size before being written
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def stream_rows(statement, scalars=False, batch_size=EXPORT_BATCH_SIZE):
+    """Execute a select and yield its rows batch by batch.
+
+    With scalars set, entity selects yield model instances; otherwise rows
+    are yielded as mappings. The identity map only holds weak references,
+    so instances from earlier batches are released as the export moves on.
+    """
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    rows = result.scalars() if scalars else result.mappings()
+    try:
+        for row in rows:
+            yield row
+    finally:
+        result.close()
+
+
+def csv_lines(columns, records):
+    """CSV header and rows for (header, key) column pairs, one string per line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line([header for header, _ in columns])
+    for record in records:
+        yield line([_csv_value(record.get(key)) for _, key in columns])
+
+
+def ndjson_lines(records):
+    """One JSON document per line"""
+    encode = current_app.json.dumps
+    for record in records:
+        yield encode(record) + '\n'
+
+
+def json_document_lines(records, key, info_key, info):
+    """A single JSON object {key: [...records], info_key: info} written incrementally.
+
+    The record count is only known at the end, so it is added to info as
+    totalRecords after the last record has been written.
+    """
+    encode = current_app.json.dumps
+    yield '{"' + key + '":['
+    total = 0
+    for record in records:
+        yield (',' if total else '') + encode(record)
+        total += 1
+    yield '],"' + info_key + '":' + encode({**info, 'totalRecords': total}) + '}\n'
+
+
+def export_response(lines, format_type, filename, compress=None):
+    """Stream export lines as a download, optionally gzipped on the fly.
+
+    The generator runs inside the request context (stream_with_context), so
+    the database session stays open until the last row has been sent.
+    """
+    chunks = _coalesce(lines)
+    mimetype = EXPORT_MIME_TYPES[format_type]
+    filename = f'{filename}.{format_type}'
+
+    if compress == 'gzip':
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass chunks straight through
+    return response
+
+
+def validate_export_args(args):
+    """Return (format, compress, error message) from request args"""
+    format_type = args.get('format', 'json')
+    compress = args.get('compress') or None
+    if format_type not in EXPORT_FORMATS:
+        return format_type, compress, f"format must be one of {', '.join(EXPORT_FORMATS)}"
+    if compress not in (None, 'gzip'):
+        return format_type, compress, 'compress must be gzip'
+    return format_type, compress, None
+
+
+def _coalesce(lines, size=EXPORT_CHUNK_SIZE):
+    pending = []
+    pending_size = 0
+    try:
+        for line in lines:
+            data = line.encode('utf-8')
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= size:
+                yield b''.join(pending)
+                pending = []
+                pending_size = 0
+        if pending:
+            yield b''.join(pending)
+    except Exception as e:
+        # Headers are already sent; all we can do is stop the body early
+        logger.error(f"Export stream aborted: {str(e)}")
+        raise
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return current_app.json.dumps(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
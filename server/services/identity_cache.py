@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Columns needed for authorisation, audit snapshots and the profile
+# (User.to_dict()); the password hash and avatar are never read per request
+IDENTITY_COLUMNS = (
+    User.id, User.email, User.username, User.first_name, User.last_name,
+    User.role, User.is_active, User.department, User.permissions,
+    User.phone_number, User.license_number, User.last_login, User.created_at, User.updated_at
+)
+
+
+class CachedIdentity:
+    """Read-only snapshot of the fields handlers need from the current User.
+
+    Exposes the same attribute names and permission helpers as User, so it
+    can be passed wherever a handler only reads the user (permission checks,
+    role checks, audit user_info). Anything that writes to the user must
+    load the real model instead.
+    """
+
+    __slots__ = ('id', 'email', 'username', 'first_name', 'last_name', 'role', 'is_active',
+                 'department', 'permissions', 'phone_number', 'license_number', 'last_login',
+                 'created_at', 'updated_at')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.email = row.email
+        self.username = row.username
+        self.first_name = row.first_name
+        self.last_name = row.last_name
+        self.role = row.role
+        self.is_active = row.is_active
+        self.department = row.department
+        self.permissions = dict(row.permissions or {})
+        self.phone_number = row.phone_number
+        self.license_number = row.license_number
+        self.last_login = row.last_login
+        self.created_at = row.created_at
+        self.updated_at = row.updated_at
+
+    def has_permission(self, permission):
+        """Check if user has a specific permission"""
+        return self.permissions.get(permission, False)
+
+    def to_dict(self):
+        """Dictionary in the same shape as User.to_dict()"""
+        return {
+            'id': self.id,
+            'email': self.email,
+            'username': self.username,
+            'firstName': self.first_name,
+            'lastName': self.last_name,
+            'role': self.role,
+            'isActive': self.is_active,
+            'phoneNumber': self.phone_number,
+            'department': self.department,
+            'licenseNumber': self.license_number,
+            'permissions': dict(self.permissions),
+            'lastLogin': self.last_login,
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
+        }
+
+    def to_dict_public(self):
+        """Public dictionary in the same shape as User.to_dict_public()"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'firstName': self.first_name,
+            'lastName': self.last_name,
+            'role': self.role,
+            'department': self.department
+        }
+
+    def __repr__(self):
+        return f'<CachedIdentity {self.username}>'
+
+
+class IdentityCache:
+    """Small TTL + LRU cache of CachedIdentity objects keyed by user id.
+
+    Entries are dropped when a User row is updated or deleted and the
+    transaction commits. Other processes only see such changes once their
+    own entry expires, so IDENTITY_CACHE_TTL bounds how long a role or
+    permission change can take to reach every worker.
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = float(ttl if ttl is not None else os.getenv('IDENTITY_CACHE_TTL', 60))
+        self.max_size = int(max_size if max_size is not None else os.getenv('IDENTITY_CACHE_SIZE', 1024))
+        self._entries = OrderedDict()  # user id -> (expires_at, CachedIdentity)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Cached identity for user_id, loading it on a miss; None if the user does not exist"""
+        if user_id is None:
+            return None
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.session.execute(db.select(*IDENTITY_COLUMNS).where(User.id == user_id)).first()
+        if row is None:
+            return None
+
+        identity = CachedIdentity(row)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, identity)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global instance
+identity_cache = IdentityCache()
+
+
+def _mark_user_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('identity_cache_changed', set()).add(target.id)
+    identity_cache.invalidate(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    # Invalidate again after commit: a concurrent request may have re-cached
+    # the old row between the flush and the commit
+    for user_id in session.info.pop('identity_cache_changed', ()):
+        identity_cache.invalidate(user_id)
+
+
+event.listen(User, 'after_update', _mark_user_changed)
+event.listen(User, 'after_delete', _mark_user_changed)
@@ -0,0 +1,155 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ('image_path', 'options', 'future', 'submitted_at', 'span')
+
+    def __init__(self, image_path, options):
+        self.image_path = image_path
+        self.options = options
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+        self.span = tracer.current_span()  # the submitting job's span, if traced
+
+
+class InferenceBatcher:
+    """Dynamic micro-batching in front of the detector.
+
+    Job workers submit single images; one inference thread collects them
+    into batches of up to AI_BATCH_MAX_SIZE images, waiting at most
+    AI_BATCH_MAX_WAIT_MS after the first image for others to arrive, runs
+    the batch through `run_batch(image_paths, **options)` and resolves each
+    image's future with its own (result, error) pair. Only images with the
+    same options are batched together.
+
+    The inference thread is the only caller of the model, which is not
+    safe to share between threads. It is started lazily, once per process.
+    An error anywhere in a batch resolves that batch's images with an
+    error and the thread carries on; detect() gives up after
+    AI_BATCH_TIMEOUT_SECONDS and the image is dropped if not yet started.
+    """
+
+    def __init__(self, run_batch, max_batch_size=None, max_wait_ms=None, timeout=None):
+        self.run_batch = run_batch
+        self.max_batch_size = int(max_batch_size if max_batch_size is not None
+                                  else os.getenv('AI_BATCH_MAX_SIZE', 4))
+        self.max_wait = float(max_wait_ms if max_wait_ms is not None
+                              else os.getenv('AI_BATCH_MAX_WAIT_MS', 5)) / 1000
+        self.timeout = float(timeout if timeout is not None
+                             else os.getenv('AI_BATCH_TIMEOUT_SECONDS', 300))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._carry = None  # request that did not fit the previous batch
+        self.batches = 0
+        self.images = 0
+        self.failed_batches = 0
+        self.timeouts = 0
+
+    def submit(self, image_path, **options):
+        """Queue one image; returns a Future resolving to (result, error)"""
+        self._ensure_started()
+        request = _Request(image_path, options)
+        self._queue.put(request)
+        return request.future
+
+    def detect(self, image_path, **options):
+        """Blocking submit(); returns (result, error), an error after the timeout"""
+        future = self.submit(image_path, **options)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # skipped by the inference thread unless already running
+            self.timeouts += 1
+            logger.error(f"Inference of {image_path} timed out after {self.timeout:g}s")
+            return None, f"Error processing image: inference timed out after {self.timeout:g}s"
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'avgBatchSize': round(self.images / self.batches, 2) if self.batches else None,
+            'maxBatchSize': self.max_batch_size,
+            'maxWaitMs': self.max_wait * 1000,
+            'failedBatches': self.failed_batches,
+            'timeouts': self.timeouts,
+            'pending': self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._queue = queue.Queue()  # requests queued before a fork belong to the parent
+                self._carry = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.options != first.options:
+                self._carry = request
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._next_batch()
+                self._run_once(batch)
+            except Exception as e:
+                # Never let one batch take the inference thread down with it
+                self.failed_batches += 1
+                logger.error(f"Inference batch of {len(batch)} failed: {str(e)}", exc_info=True)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_result((None, f"Error processing image: {str(e)}"))
+
+    def _run_once(self, batch):
+        # Requests whose caller already gave up are dropped here
+        batch[:] = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        for request in batch:
+            if request.span is not None:
+                request.span.set_attribute('batch_size', len(batch))
+                request.span.set_attribute('batch_wait_ms', round((started - request.submitted_at) * 1000, 3))
+        
+        # One batch serves several traces; it is linked to each image's span
+        with tracer.start_span('ai.inference_batch', links=[request.span for request in batch],
+                               batch_size=len(batch)):
+            outputs = self.run_batch([request.image_path for request in batch], **batch[0].options)
+            if len(outputs) != len(batch):
+                raise ValueError(f"detector returned {len(outputs)} results for {len(batch)} images")
+
+        self.batches += 1
+        self.images += len(batch)
+        for request, output in zip(batch, outputs):
+            request.future.set_result(output)
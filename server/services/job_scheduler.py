@@ -0,0 +1,102 @@
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+
+# Test.priority values, lowest to highest
+PRIORITY_LEVELS = {'low': 0, 'normal': 1, 'high': 2, 'urgent': 3}
+DEFAULT_PRIORITY = 'normal'
+
+
+def priority_level(priority):
+    return PRIORITY_LEVELS.get((priority or DEFAULT_PRIORITY).lower(), PRIORITY_LEVELS[DEFAULT_PRIORITY])
+
+
+class PriorityJobQueue:
+    """Priority queue of AI jobs with aging.
+
+    Jobs are ordered by enqueue time minus AI_PRIORITY_AGING_SECONDS per
+    priority level, so a job's effective priority rises by one level for
+    every AI_PRIORITY_AGING_SECONDS it waits: an urgent test goes ahead of
+    normal work queued up to 2 aging periods earlier, and a low-priority
+    job can never be overtaken by newer work indefinitely. The key is fixed
+    at the first push, so a preempted job that is pushed back keeps its
+    place.
+
+    Not thread-safe; AIAnalysisService calls it under its processing lock.
+    """
+
+    def __init__(self, aging_seconds=None):
+        self.aging_seconds = float(
+            aging_seconds if aging_seconds is not None else os.getenv('AI_PRIORITY_AGING_SECONDS', 300)
+        )
+        self._heap = []
+        self._sequence = itertools.count()
+        self._depth = {priority: 0 for priority in PRIORITY_LEVELS}
+        self._recent_waits = {priority: deque(maxlen=100) for priority in PRIORITY_LEVELS}
+        self._started = {priority: 0 for priority in PRIORITY_LEVELS}
+
+    def push(self, job):
+        priority = job.get('priority')
+        if priority not in PRIORITY_LEVELS:
+            priority = job['priority'] = DEFAULT_PRIORITY
+        if 'queued_at' not in job:
+            job['queued_at'] = time.monotonic()
+            job['sort_key'] = job['queued_at'] - priority_level(priority) * self.aging_seconds
+        heapq.heappush(self._heap, (job['sort_key'], next(self._sequence), job))
+        self._depth[priority] += 1
+
+    def pop(self):
+        """Next job to run, or None when empty"""
+        if not self._heap:
+            return None
+        _, _, job = heapq.heappop(self._heap)
+        self._depth[job['priority']] -= 1
+        if 'started_at' not in job:
+            job['started_at'] = time.monotonic()
+            self._started[job['priority']] += 1
+            self._recent_waits[job['priority']].append(job['started_at'] - job['queued_at'])
+        return job
+
+    def remove(self, session_id):
+        """Drop a queued job by session id; returns it, or None if it is not queued"""
+        for index, (_, _, job) in enumerate(self._heap):
+            if job['session_id'] == session_id:
+                self._heap[index] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._depth[job['priority']] -= 1
+                return job
+        return None
+
+    def peek(self):
+        """The job pop() would return, without removing it"""
+        return self._heap[0][2] if self._heap else None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (job for _, _, job in sorted(self._heap))
+
+    def stats(self):
+        """Per-priority queue depth and wait times in seconds"""
+        now = time.monotonic()
+        oldest = {}
+        for _, _, job in self._heap:
+            waited = now - job['queued_at']
+            oldest[job['priority']] = max(oldest.get(job['priority'], 0.0), waited)
+
+        stats = {}
+        for priority in PRIORITY_LEVELS:
+            waits = self._recent_waits[priority]
+            stats[priority] = {
+                'queued': self._depth[priority],
+                'oldestWaitSeconds': round(oldest.get(priority, 0.0), 3),
+                # Over the last 100 jobs started at this priority
+                'avgWaitSeconds': round(sum(waits) / len(waits), 3) if waits else None,
+                'maxWaitSeconds': round(max(waits), 3) if waits else None,
+                'started': self._started[priority]
+            }
+        return stats
@@ -0,0 +1,397 @@
+import bisect
+import hmac
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.logging import dropped_records
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers fast API calls up to slow uploads and model stages on CPU
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge read at scrape time from state kept elsewhere.
+
+    The callback returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, type, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} could not be collected: {str(e)}")
+            return []
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        with self._lock:
+            self._values = {tuple(str(part) for part in key): value for key, value in values.items()
+                            if value is not None}
+        return super().render()
+
+
+class RateWindow:
+    """Events per second over the last `seconds` seconds"""
+
+    def __init__(self, seconds=60):
+        self.seconds = seconds
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, count))
+            self._trim(now)
+
+    def rate(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return sum(count for _, count in self._events) / self.seconds
+
+    def _trim(self, now):
+        while self._events and self._events[0][0] < now - self.seconds:
+            self._events.popleft()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, type, callback, labelnames=()):
+        return self._register(CallbackMetric(name, documentation, type, callback, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _ai_service():
+    # Only report the AI queue once something has imported it; a scrape
+    # should not be what loads the analysis service
+    module = sys.modules.get('services.ai_analysis')
+    return module.ai_service if module is not None else None
+
+
+class Metrics:
+    """Prometheus metrics for the API and the AI pipeline, served at GET /metrics.
+
+    Metrics are kept per process in the Prometheus text format, without the
+    prometheus_client dependency; with several gunicorn workers each scrape
+    sees the worker that answered it. Scrapes must send METRICS_TOKEN as a
+    bearer token; without a token configured /metrics answers 403.
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.enabled = True
+        self.token = None
+        self.image_rate = RateWindow(60)
+        r = self.registry
+
+        self.request_seconds = r.histogram(
+            'http_request_duration_seconds', 'API request latency',
+            ('blueprint', 'endpoint', 'method', 'status'))
+        self.request_queries = r.histogram(
+            'http_request_db_queries', 'Database queries issued by one API request',
+            ('blueprint', 'endpoint'), buckets=QUERY_COUNT_BUCKETS)
+        self.db_queries = r.counter('db_queries_total', 'Database queries executed')
+
+        # decode, preprocess, forward, nms, postprocess, annotate and
+        # save_annotated per image; db_store once per job
+        self.stage_seconds = r.histogram(
+            'ai_stage_duration_seconds', 'Time spent in each analysis stage', ('stage',))
+        self.job_wait_seconds = r.histogram(
+            'ai_job_wait_seconds', 'Time AI jobs waited in the queue before starting', ('priority',),
+            buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800))
+        self.job_seconds = r.histogram(
+            'ai_job_duration_seconds', 'Time from a job starting to it finishing', ('outcome',),
+            buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+        self.images = r.counter('ai_images_processed_total', 'Images analysed', ('outcome',))
+        self.upload_stage_seconds = r.histogram(
+            'upload_stage_duration_seconds', 'Time spent per uploaded file in each upload stage', ('stage',))
+        self.upload_bytes = r.counter('upload_bytes_total', 'Bytes of images accepted by upload endpoints')
+        self.upload_files = r.counter('upload_files_total', 'Uploaded image files', ('outcome',))
+
+        r.callback('ai_images_per_second', 'Images analysed per second over the last minute', 'gauge',
+                   self.image_rate.rate)
+        r.callback('ai_queue_depth', 'AI jobs waiting in the queue', 'gauge', self._queue_depth, ('priority',))
+        r.callback('ai_queue_oldest_wait_seconds', 'Wait of the oldest queued AI job', 'gauge',
+                   self._oldest_wait, ('priority',))
+        r.callback('ai_outstanding_images', 'Images queued or running, not yet analysed', 'gauge',
+                   lambda: self._ai('outstanding_images'))
+        r.callback('ai_workers_active', 'AI job worker threads running', 'gauge',
+                   lambda: len(_ai_service()._workers) if _ai_service() else None)
+        r.callback('ai_seconds_per_image', 'Smoothed measured time per analysed image', 'gauge',
+                   lambda: _ai_service().service_time.seconds_per_image if _ai_service() else None)
+        r.callback('ai_inference_batch_size_avg', 'Average images per inference batch', 'gauge',
+                   lambda: _ai_service().batcher.stats()['avgBatchSize'] if _ai_service() else None)
+        r.callback('ai_model_ready', 'Whether the detection model is loaded', 'gauge',
+                   lambda: int(_ai_service().model_loader.is_ready) if _ai_service() else None)
+        r.callback('log_records_dropped_total', 'Log records dropped because the log queue was full', 'counter',
+                   dropped_records)
+        r.callback('cache_hits_total', 'Cache hits', 'counter', self._cache_hits, ('cache',))
+        r.callback('cache_misses_total', 'Cache misses', 'counter', self._cache_misses, ('cache',))
+        r.callback('cache_hit_ratio', 'Cache hits over lookups since start', 'gauge',
+                   self._cache_hit_ratio, ('cache',))
+
+    def init_app(self, app):
+        self.enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+        self.token = os.getenv('METRICS_TOKEN') or None
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        if not self.token:
+            logger.warning("METRICS_TOKEN is not set; /metrics will refuse every scrape")
+
+    # -- API requests ------------------------------------------------------
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_queries = 0
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or 'app'
+        self.request_seconds.observe(time.perf_counter() - started, blueprint=blueprint, endpoint=endpoint,
+                                     method=request.method, status=response.status_code)
+        self.request_queries.observe(g.pop('_metrics_queries', 0), blueprint=blueprint, endpoint=endpoint)
+        return response
+
+    def count_query(self):
+        self.db_queries.inc()
+        if has_request_context() and '_metrics_queries' in g:
+            g._metrics_queries += 1
+
+    def _metrics_view(self):
+        if not self.token:
+            return Response('Metrics are disabled until METRICS_TOKEN is set\n', status=403, mimetype='text/plain')
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {self.token}'.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(self.registry.render(), content_type=CONTENT_TYPE)
+
+    # -- AI pipeline -------------------------------------------------------
+
+    def observe_stage(self, stage, seconds):
+        self.stage_seconds.observe(seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    @contextmanager
+    def upload_stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.upload_stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+    def file_uploaded(self, size=None, error=False):
+        self.upload_files.inc(outcome='rejected' if error else 'accepted')
+        if size:
+            self.upload_bytes.inc(size)
+
+    def image_processed(self, outcome):
+        self.images.inc(outcome=outcome)
+        if outcome == 'ok':
+            self.image_rate.add()
+
+    def _ai(self, attribute):
+        service = _ai_service()
+        return getattr(service, attribute)() if service is not None else None
+
+    def _queue_stats(self):
+        service = _ai_service()
+        if service is None:
+            return None
+        with service.processing_lock:
+            return service.processing_queue.stats()
+
+    def _queue_depth(self):
+        stats = self._queue_stats()
+        return {(priority,): values['queued'] for priority, values in stats.items()} if stats else None
+
+    def _oldest_wait(self):
+        stats = self._queue_stats()
+        return {(priority,): values['oldestWaitSeconds'] for priority, values in stats.items()} if stats else None
+
+    # -- Caches ------------------------------------------------------------
+
+    def _caches(self):
+        from services.identity_cache import identity_cache
+        return {'identity': identity_cache}
+
+    def _cache_hits(self):
+        return {(name,): cache.hits for name, cache in self._caches().items()}
+
+    def _cache_misses(self):
+        return {(name,): cache.misses for name, cache in self._caches().items()}
+
+    def _cache_hit_ratio(self):
+        return {(name,): cache.hits / (cache.hits + cache.misses)
+                for name, cache in self._caches().items() if cache.hits + cache.misses}
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.count_query()
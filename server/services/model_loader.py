@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    """Raised when the model is still loading or failed to load"""
+
+
+class ModelLoader:
+    """Loads the detection model in a background thread.
+
+    Importing torch/ultralytics and reading best.pt takes seconds, so it is
+    kept off the import path: the API serves health checks and logins while
+    the model loads, and readiness reports the state:
+
+        not_loaded -> loading -> ready
+                              -> failed
+
+    The loader is per process; after a fork the child starts from
+    not_loaded again (threads and CUDA state do not survive a fork).
+    """
+
+    def __init__(self, factory, name='model'):
+        self.factory = factory
+        self.name = name
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._state = 'not_loaded'
+        self._model = None
+        self._error = None
+        self._started_at = None
+        self._load_seconds = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def start(self):
+        """Begin loading in the background (no-op if already started)"""
+        with self._lock:
+            self._check_fork()
+            if self._state != 'not_loaded':
+                return
+            self._state = 'loading'
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._load, name=f'{self.name}-loader', daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        try:
+            model = self.factory()
+        except Exception as e:
+            logger.error(f"Failed to load {self.name}: {str(e)}")
+            with self._lock:
+                self._state = 'failed'
+                self._error = str(e)
+                self._load_seconds = time.perf_counter() - self._started_at
+        else:
+            with self._lock:
+                self._model = model
+                self._state = 'ready'
+                self._load_seconds = time.perf_counter() - self._started_at
+            logger.info(f"Loaded {self.name} in {self._load_seconds:.2f}s")
+        finally:
+            self._done.set()
+
+    def get(self, timeout=None):
+        """The loaded model, starting/awaiting the load; raises ModelNotReady"""
+        self.start()
+        if not self._done.wait(timeout):
+            raise ModelNotReady(f'{self.name} is still loading')
+        if self._state != 'ready':
+            raise ModelNotReady(f'{self.name} failed to load: {self._error}')
+        return self._model
+
+    @property
+    def state(self):
+        with self._lock:
+            self._check_fork()
+            return self._state
+
+    @property
+    def is_ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        """Readiness details for health endpoints"""
+        with self._lock:
+            self._check_fork()
+            status = {'state': self._state}
+            if self._load_seconds is not None:
+                status['loadSeconds'] = round(self._load_seconds, 3)
+            elif self._started_at is not None:
+                status['loadingFor'] = round(time.perf_counter() - self._started_at, 3)
+            if self._error:
+                status['error'] = self._error
+            warmup = getattr(self._model, 'warmup_stats', None)
+            if warmup:
+                status['warmup'] = warmup
+            return status
@@ -0,0 +1,112 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from models import bcrypt
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already queued"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password verification is saturated')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs bcrypt work in a small, low-priority worker pool.
+
+    At most PASSWORD_HASH_WORKERS hashes run at once, so a burst of logins
+    can only occupy that many cores and inference keeps the rest. On Linux
+    the worker threads are also reniced by PASSWORD_HASH_NICE. Up to
+    PASSWORD_HASH_MAX_PENDING requests may wait for a worker; beyond that,
+    or after PASSWORD_HASH_WAIT seconds in the queue, PasswordHasherBusy is
+    raised and the endpoint answers 503 with Retry-After.
+    """
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = 2
+        self.max_pending = 8
+        self.wait_timeout = 5.0
+        self.nice = 10
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+        self.max_pending = int(os.getenv('PASSWORD_HASH_MAX_PENDING', self.workers * 4))
+        self.wait_timeout = float(os.getenv('PASSWORD_HASH_WAIT', 5))
+        self.nice = int(os.getenv('PASSWORD_HASH_NICE', 10))
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        """Executor for this process (re-created after fork)"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix='password-hash',
+                        initializer=self._lower_priority
+                    )
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _lower_priority(self):
+        if self.nice <= 0 or not hasattr(os, 'setpriority'):
+            return
+        try:
+            # On Linux PRIO_PROCESS with a thread id renices only that thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except OSError as e:
+            logger.debug("Could not lower password hashing thread priority: %s", e)
+
+    def _run(self, fn, *args):
+        executor = self._pool()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordHasherBusy(retry_after=max(1, int(self.wait_timeout)))
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is held until the hash is done (or cancelled while still
+        # queued), not until the caller stops waiting for it
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy(retry_after=max(1, int(self.wait_timeout)))
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored bcrypt hash"""
+        if not password_hash or not password:
+            return False
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def hash(self, password):
+        """Hash a password at the configured cost"""
+        return self._run(bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different cost than BCRYPT_LOG_ROUNDS"""
+        match = BCRYPT_COST_PATTERN.match(password_hash or '')
+        return match is None or int(match.group(1)) != self.rounds
+
+
+# Global instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,211 @@
+import logging
+import threading
+
+from sqlalchemy import case, event, func, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db
+from models.patient import Patient
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes cannot serve terms shorter than this
+MIN_TERM_LENGTH = 3
+
+SEARCH_COLUMNS = ('patient_id', 'first_name', 'last_name', 'phone_number')
+
+SQLITE_INDEX_DDL = [
+    # Standalone (not external-content) table: patients has no INTEGER PRIMARY
+    # KEY, so its implicit rowids may change on VACUUM and cannot be relied on
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+        patient_uuid UNINDEXED, patient_id, first_name, last_name, phone_number,
+        tokenize = 'trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts (patient_uuid, patient_id, first_name, last_name, phone_number)
+        VALUES (new.id, new.patient_id, new.first_name, new.last_name, new.phone_number);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+        DELETE FROM patients_fts WHERE patient_uuid = old.id;
+    END
+    """,
+    # Only searchable columns re-index; test counters are updated far more often
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_fts_update
+    AFTER UPDATE OF id, patient_id, first_name, last_name, phone_number ON patients BEGIN
+        DELETE FROM patients_fts WHERE patient_uuid = old.id;
+        INSERT INTO patients_fts (patient_uuid, patient_id, first_name, last_name, phone_number)
+        VALUES (new.id, new.patient_id, new.first_name, new.last_name, new.phone_number);
+    END
+    """,
+]
+
+SQLITE_BACKFILL = """
+    INSERT INTO patients_fts (patient_uuid, patient_id, first_name, last_name, phone_number)
+    SELECT id, patient_id, first_name, last_name, phone_number FROM patients
+"""
+
+POSTGRES_INDEX_DDL = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS ix_patients_{column}_trgm ON patients USING gin ({column} gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+]
+
+
+class PatientSearchIndex:
+    """Indexed substring search over patient ID, names and phone number.
+
+    SQLite uses an FTS5 table with the trigram tokenizer, kept in sync by
+    triggers; PostgreSQL uses pg_trgm GIN indexes, which serve ILIKE
+    '%term%' directly. The index is installed (and back-filled) lazily on
+    the first search, so existing databases pick it up without a migration.
+    Any other backend, or a failed install, falls back to LIKE scans.
+
+    Dropping or creating the patients table (db.drop_all()/create_all())
+    forgets the cached backend, so the next search installs the index again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backends = {}  # engine url -> 'sqlite' | 'postgresql' | None
+
+    def backend(self):
+        """Index backend for the current engine, installing it on first use"""
+        engine = db.engine
+        key = str(engine.url)
+        if key in self._backends:
+            return self._backends[key]
+
+        with self._lock:
+            if key not in self._backends:
+                self._backends[key] = self._install(engine)
+        return self._backends[key]
+
+    def _install(self, engine):
+        dialect = engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                with engine.begin() as conn:
+                    exists = conn.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'")
+                    ).scalar()
+                    # Triggers go with the patients table; without them the
+                    # FTS rows may be stale and are rebuilt
+                    synced = conn.execute(
+                        text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'patients' "
+                             "AND name LIKE 'patients_fts_%'")
+                    ).scalar() == 3
+                    for statement in SQLITE_INDEX_DDL:
+                        conn.execute(text(statement))
+                    if not exists or not synced:
+                        conn.execute(text('DELETE FROM patients_fts'))
+                        conn.execute(text(SQLITE_BACKFILL))
+                        logger.info("Built patient search index (FTS5 trigram)")
+                return 'sqlite'
+
+            if dialect == 'postgresql':
+                with engine.begin() as conn:
+                    for statement in POSTGRES_INDEX_DDL:
+                        conn.execute(text(statement))
+                logger.info("Patient search using pg_trgm indexes")
+                return 'postgresql'
+        except SQLAlchemyError as e:
+            logger.warning(f"Patient search index unavailable on {dialect}, using LIKE scans: {str(e)}")
+            return None
+
+        return None
+
+    def _patients_created(self, target, connection, **kw):
+        with self._lock:
+            self._backends.pop(str(connection.engine.url), None)
+
+    def _patients_dropped(self, target, connection, **kw):
+        # The FTS table is not in the metadata, so drop_all() would leave it behind
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text('DROP TABLE IF EXISTS patients_fts'))
+        with self._lock:
+            self._backends.pop(str(connection.engine.url), None)
+
+    def rebuild(self):
+        """Drop and re-create the SQLite index contents from the patients table"""
+        if self.backend() != 'sqlite':
+            return
+        with db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM patients_fts'))
+            conn.execute(text(SQLITE_BACKFILL))
+
+    def search(self, query, limit=20):
+        """Patients matching every term of query, prefix matches first"""
+        query = (query or '').strip()
+        terms = query.split()
+        long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+        if not long_terms:
+            return Patient.like_search(query, limit)
+
+        backend = self.backend()
+        if backend == 'sqlite':
+            return self._search_sqlite(query, terms, long_terms, limit)
+        if backend == 'postgresql':
+            return self._search_postgres(query, terms, limit)
+        return Patient.like_search(query, limit)
+
+    def _search_sqlite(self, query, terms, long_terms, limit):
+        # Each long term is a quoted trigram phrase; short terms (1-2 chars)
+        # are checked with LIKE on the already narrowed rows
+        match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms)
+        params = {'match': match, 'prefix': _escape_like(query) + '%', 'exact': query, 'limit': limit}
+
+        short_filters = []
+        for index, term in enumerate(t for t in terms if len(t) < MIN_TERM_LENGTH):
+            params[f'short{index}'] = '%' + _escape_like(term) + '%'
+            short_filters.append('(' + ' OR '.join(
+                f"patients.{column} LIKE :short{index} ESCAPE '\\'" for column in SEARCH_COLUMNS
+            ) + ')')
+
+        prefix_match = ' OR '.join(f"patients.{column} LIKE :prefix ESCAPE '\\'" for column in SEARCH_COLUMNS)
+        statement = text(f"""
+            SELECT patients.* FROM patients_fts
+            JOIN patients ON patients.id = patients_fts.patient_uuid
+            WHERE patients_fts MATCH :match
+            {''.join(' AND ' + f for f in short_filters)}
+            ORDER BY
+                CASE WHEN patients.patient_id = :exact OR patients.phone_number = :exact THEN 0
+                     WHEN {prefix_match} THEN 1
+                     ELSE 2 END,
+                patients_fts.rank,
+                patients.last_name, patients.first_name
+            LIMIT :limit
+        """).bindparams(**params)
+
+        return db.session.execute(db.select(Patient).from_statement(statement)).scalars().all()
+
+    def _search_postgres(self, query, terms, limit):
+        columns = [getattr(Patient, column) for column in SEARCH_COLUMNS]
+        filters = [
+            db.or_(*[column.ilike('%' + _escape_like(term) + '%', escape='\\') for column in columns])
+            for term in terms
+        ]
+        prefix = _escape_like(query) + '%'
+        rank = case(
+            (db.or_(Patient.patient_id == query, Patient.phone_number == query), 0),
+            (db.or_(*[column.ilike(prefix, escape='\\') for column in columns]), 1),
+            else_=2
+        )
+        full_name = Patient.first_name + ' ' + Patient.last_name
+        return Patient.query.filter(*filters).order_by(
+            rank, func.similarity(full_name, query).desc(), Patient.last_name, Patient.first_name
+        ).limit(limit).all()
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Global instance
+patient_search = PatientSearchIndex()
+event.listen(Patient.__table__, 'after_create', patient_search._patients_created)
+event.listen(Patient.__table__, 'after_drop', patient_search._patients_dropped)
@@ -0,0 +1,199 @@
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from flask import g, request
+from flask_jwt_extended import get_current_user, verify_jwt_in_request
+
+logger = logging.getLogger(__name__)
+
+# A thread whose innermost Python frame is in one of these modules is
+# blocked (waiting on a lock, queue, socket or selector, or an idle
+# ThreadPoolExecutor worker in concurrent/futures/thread.py), not working
+IDLE_MODULES = {'threading.py', 'queue.py', 'selectors.py', 'socket.py', 'socketserver.py', 'ssl.py', 'thread.py'}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a whole-process profile is already being captured"""
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of running threads at a fixed interval.
+
+    Uses sys._current_frames(), so it needs no tracing hooks and costs the
+    profiled threads nothing between samples. Stacks are aggregated into
+    the collapsed format of flamegraph.pl / speedscope / inferno:
+    `thread;outer frame;...;inner frame <count>` per line.
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None, include_idle=False):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def run_for(self, seconds):
+        self.start()
+        self._stop.wait(seconds)
+        return self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                if not self.include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'thread-{ident}'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, top=25):
+        """Sample counts per thread and the frames most often on top of the stack"""
+        threads = Counter()
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            threads[frames[0]] += count
+            leaves[frames[-1]] += count
+        return {
+            'durationSeconds': round(self.duration, 3),
+            'intervalSeconds': self.interval,
+            'samples': self.samples,
+            'stacks': sum(self.stacks.values()),
+            'threads': dict(threads.most_common()),
+            'topFrames': [{'frame': frame, 'samples': count} for frame, count in leaves.most_common(top)]
+        }
+
+
+class Profiler:
+    """On-demand profiling of the running server.
+
+    capture() samples every thread (API request threads, AI job workers,
+    the inference batcher) for up to PROFILER_MAX_SECONDS; one capture runs
+    at a time. With PROFILER_REQUEST_HEADER enabled, a request sent by an
+    admin with `X-Profile: 1` samples just its own thread; the result is
+    kept among the last PROFILER_KEEP profiles and its id is returned in
+    the X-Profile-Id response header.
+    """
+
+    HEADER = 'X-Profile'
+
+    def __init__(self):
+        self.max_seconds = 60.0
+        self.default_interval = 0.005
+        self.request_profiling = False
+        self.keep = 20
+        self._capture_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.profiles = OrderedDict()  # id -> stored request profile
+
+    def init_app(self, app):
+        self.max_seconds = float(os.getenv('PROFILER_MAX_SECONDS', 60))
+        self.default_interval = float(os.getenv('PROFILER_INTERVAL_MS', 5)) / 1000
+        self.request_profiling = os.getenv('PROFILER_REQUEST_HEADER', 'true').lower() == 'true'
+        self.keep = int(os.getenv('PROFILER_KEEP', 20))
+        app.extensions['profiler'] = self
+        if self.request_profiling:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    def capture(self, seconds, interval=None, include_idle=False):
+        """Sample all threads for `seconds` (blocking); raises ProfilerBusy if a capture is running"""
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        interval = max(interval or self.default_interval, 0.001)
+        if not self._capture_lock.acquire(blocking=False):
+            raise ProfilerBusy('A profile is already being captured')
+        try:
+            logger.info(f"Capturing a {seconds}s sampling profile every {interval * 1000:g} ms")
+            return SamplingProfiler(interval, include_idle=include_idle).run_for(seconds)
+        finally:
+            self._capture_lock.release()
+
+    # -- Per-request profiling ---------------------------------------------
+
+    def _before_request(self):
+        if request.headers.get(self.HEADER) not in ('1', 'true'):
+            return
+        if not self._may_profile():
+            return
+        g._profiler = SamplingProfiler(self.default_interval, thread_ids=[threading.get_ident()],
+                                       include_idle=True).start()
+
+    def _after_request(self, response):
+        sampler = g.pop('_profiler', None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        profile_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.profiles[profile_id] = {
+                'id': profile_id,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'createdAt': datetime.utcnow(),
+                'summary': sampler.summary(),
+                'folded': sampler.folded()
+            }
+            while len(self.profiles) > self.keep:
+                self.profiles.popitem(last=False)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _may_profile(self):
+        """Only users who may manage users can profile their requests"""
+        try:
+            verify_jwt_in_request(optional=True)
+            user = get_current_user()
+        except Exception:
+            return False
+        return bool(user and user.has_permission('canManageUsers'))
+
+    def get(self, profile_id):
+        with self._lock:
+            return self.profiles.get(profile_id)
+
+    def recent(self):
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != 'folded'}
+                    for profile in reversed(self.profiles.values())]
+
+
+profiler = Profiler()
@@ -0,0 +1,137 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = {'completed', 'failed', 'cancelled'}
+
+
+class Subscription:
+    """One listener on a channel; events are read with get()"""
+
+    def __init__(self, broker, channel, max_queued):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=max_queued)
+        self.dropped = False
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A client that stops reading must not hold up the job or other
+            # listeners; it is disconnected and can reconnect for a snapshot
+            self.dropped = True
+
+    def get(self, timeout=None):
+        """Next (event, data) tuple, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class ProgressBroker:
+    """In-process fan-out of AI job progress to any number of listeners.
+
+    Jobs publish events on a channel (the upload session id); every
+    subscriber of that channel gets its own bounded queue, so many clients
+    can watch the same test. The latest event of each kind is kept per
+    channel and replayed to new subscribers, so a client that connects
+    mid-job immediately sees the current status and the images completed
+    so far. Channels of finished jobs are kept for PROGRESS_RETENTION_SECONDS.
+
+    Each open SSE stream holds a server thread for its whole lifetime, so
+    at most SSE_MAX_STREAMS streams are admitted per process (0 disables
+    the cap); the rest of the thread pool stays free for API requests.
+    """
+
+    def __init__(self):
+        self.max_queued = int(os.getenv('PROGRESS_MAX_QUEUED_EVENTS', 256))
+        self.retention = float(os.getenv('PROGRESS_RETENTION_SECONDS', 600))
+        self.max_streams = int(os.getenv('SSE_MAX_STREAMS', 2))
+        self.open_streams = 0
+        self.rejected_streams = 0
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+        self._history = OrderedDict()  # channel -> {'events': [...], 'finished_at': float | None}
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            history = self._history.setdefault(channel, {'events': [], 'finished_at': None})
+            self._history.move_to_end(channel)
+            if event == 'image':
+                history['events'].append((event, data))
+            else:
+                # Only the latest status is worth replaying
+                history['events'] = [item for item in history['events'] if item[0] == 'image']
+                history['events'].append((event, data))
+            if event in TERMINAL_EVENTS:
+                history['finished_at'] = time.monotonic()
+            subscribers = list(self._subscribers.get(channel, ()))
+            self._prune()
+
+        for subscription in subscribers:
+            subscription.put((event, data))
+
+    def subscribe(self, channel):
+        """Subscribe to a channel; events published so far are queued first"""
+        subscription = Subscription(self, channel, self.max_queued)
+        with self._lock:
+            history = self._history.get(channel)
+            if history:
+                for item in history['events'][-self.max_queued:]:
+                    subscription.put(item)
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def acquire_stream(self):
+        """Reserve a stream slot; False when SSE_MAX_STREAMS are already open"""
+        with self._lock:
+            if self.max_streams > 0 and self.open_streams >= self.max_streams:
+                self.rejected_streams += 1
+                return False
+            self.open_streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self.open_streams = max(0, self.open_streams - 1)
+
+    def has_channel(self, channel):
+        with self._lock:
+            return channel in self._history
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _prune(self):
+        """Forget finished channels older than the retention window (caller holds the lock)"""
+        now = time.monotonic()
+        for channel in list(self._history):
+            finished_at = self._history[channel]['finished_at']
+            if finished_at is not None and now - finished_at > self.retention \
+                    and channel not in self._subscribers:
+                del self._history[channel]
+
+
+# Global instance
+progress_broker = ProgressBroker()
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class StubDetector:
+    """Stand-in for MalariaDetector with a configurable service time.
+
+    Used by the load tests (AI_STUB_DETECTOR=true) so the whole API and AI
+    queue can be exercised without torch, ultralytics or best.pt. A batch
+    sleeps AI_STUB_BATCH_MS plus AI_STUB_IMAGE_MS per image, mimicking the
+    fixed + per-image cost of a forward pass, and returns detections in the
+    detector's result format. Counts are derived from the file name, so the
+    same image always gives the same result.
+    """
+
+    PARASITE_TYPES = ('PF', 'PM', 'PO', 'PV')
+
+    def __init__(self, batch_ms: Optional[float] = None, image_ms: Optional[float] = None):
+        self.batch_seconds = float(os.getenv('AI_STUB_BATCH_MS', 20) if batch_ms is None else batch_ms) / 1000
+        self.image_seconds = float(os.getenv('AI_STUB_IMAGE_MS', 80) if image_ms is None else image_ms) / 1000
+
+    def _result(self, image_path: str) -> Dict:
+        digest = hashlib.md5(os.path.basename(image_path).encode('utf-8')).digest()
+        parasite_count = digest[0] % 6
+        wbc_count = 5 + digest[1] % 20
+        parasite_type = self.PARASITE_TYPES[digest[2] % len(self.PARASITE_TYPES)]
+        parasites = [{
+            'type': parasite_type,
+            'confidence': 0.5 + (digest[3 + i] % 50) / 100,
+            'bbox': [10.0 * i, 10.0 * i, 10.0 * i + 24, 10.0 * i + 24]
+        } for i in range(parasite_count)]
+        wbcs = [{
+            'type': 'WBC',
+            'confidence': 0.6 + (digest[(9 + i) % 16] % 40) / 100,
+            'bbox': [300.0 + 5 * i, 300.0, 340.0 + 5 * i, 340.0]
+        } for i in range(wbc_count)]
+        return {
+            'parasitesDetected': parasites,
+            'wbcsDetected': wbcs,
+            'whiteBloodCellsDetected': wbc_count,
+            'parasiteCount': parasite_count,
+            'parasiteWbcRatio': parasite_count / wbc_count
+        }
+
+    def detect_batch(self, image_paths: List[str], confidence_threshold: float = 0.26,
+                     annotate: bool = False) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        time.sleep(self.batch_seconds + self.image_seconds * len(image_paths))
+        return [(self._result(path), None) if os.path.exists(path)
+                else (None, f"Error processing image: Image not found at {path}")
+                for path in image_paths]
+
+    def detectAndQuantify(self, image_path: str, confidence_threshold: float = 0.26) -> Tuple[Optional[Dict], Optional[str]]:
+        return self.detect_batch([image_path], confidence_threshold)[0]
+
+    def detect_and_quantify(self, image_path: str, confidence_threshold: float = 0.26) -> Tuple[Optional[Dict], Optional[str]]:
+        return self.detectAndQuantify(image_path, confidence_threshold)
@@ -0,0 +1,308 @@
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from utils.json_provider import encode_default
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def trace_id_for(key):
+    """Trace id shared by every span of one upload session (or other key)"""
+    return hashlib.md5(str(key).encode('utf-8')).hexdigest()
+
+
+class SpanContext:
+    __slots__ = ('trace_id', 'span_id')
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Span:
+    """One timed operation. Use as a context manager to make it the parent of
+    spans started inside the block (in the same thread), or call end()."""
+
+    __slots__ = ('tracer', 'name', 'context', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'events', 'links', 'error', '_token')
+
+    def __init__(self, tracer, name, trace_id, parent_id, attributes, links):
+        self.tracer = tracer
+        self.name = name
+        self.context = SpanContext(trace_id, secrets.token_hex(8))
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.events = []
+        self.links = links or []
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_error(self, error):
+        self.error = str(error)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is off"""
+
+    context = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _iso(ns):
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
+
+def _span_record(span):
+    """Flat JSON line written by the file exporter"""
+    return {
+        'traceId': span.context.trace_id,
+        'spanId': span.context.span_id,
+        'parentSpanId': span.parent_id,
+        'name': span.name,
+        'start': _iso(span.start_ns),
+        'end': _iso(span.end_ns),
+        'durationMs': round((span.end_ns - span.start_ns) / 1e6, 3),
+        'attributes': span.attributes,
+        'events': [{'time': _iso(ts), 'name': name, 'attributes': attributes}
+                   for ts, name, attributes in span.events],
+        'links': [{'traceId': link.trace_id, 'spanId': link.span_id} for link in span.links],
+        'status': 'error' if span.error else 'ok',
+        'error': span.error
+    }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _otlp_span(span):
+    otlp = {
+        'traceId': span.context.trace_id,
+        'spanId': span.context.span_id,
+        'name': span.name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': _otlp_attributes(span.attributes),
+        'events': [{'timeUnixNano': str(ts), 'name': name, 'attributes': _otlp_attributes(attributes)}
+                   for ts, name, attributes in span.events],
+        'links': [{'traceId': link.trace_id, 'spanId': link.span_id} for link in span.links],
+        'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+    }
+    if span.parent_id:
+        otlp['parentSpanId'] = span.parent_id
+    return otlp
+
+
+class Tracer:
+    """Minimal OpenTelemetry-style tracer for following a test through the pipeline.
+
+    Spans of one upload session share a trace id derived from the session
+    id, so the upload requests, the queue wait, the AI job with its images
+    and the result storage form one trace even though they run in different
+    requests and threads. Finished spans are exported by a background
+    thread, either as JSON lines to TRACING_FILE (TRACING_EXPORTER=file) or
+    as OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT (TRACING_EXPORTER=otlp).
+    With TRACING_EXPORTER=none (default) spans cost next to nothing.
+    """
+
+    def __init__(self):
+        self.exporter = 'none'
+        self.service_name = 'malaria-lab-server'
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.exporter != 'none'
+
+    def init_app(self, app):
+        self.exporter = os.getenv('TRACING_EXPORTER', 'none').lower()
+        if self.exporter not in ('none', 'file', 'otlp'):
+            logger.warning(f"Unknown TRACING_EXPORTER {self.exporter!r}, tracing disabled")
+            self.exporter = 'none'
+        self.service_name = os.getenv('TRACING_SERVICE_NAME', 'malaria-lab-server')
+        self.path = os.path.abspath(os.getenv('TRACING_FILE', os.path.join('logs', 'traces.jsonl')))
+        self.endpoint = os.getenv('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+        self.flush_interval = float(os.getenv('TRACING_FLUSH_INTERVAL', 2))
+        self.batch_size = int(os.getenv('TRACING_BATCH_SIZE', 256))
+        self.max_queued = int(os.getenv('TRACING_MAX_QUEUED', 10000))
+        app.extensions['tracer'] = self
+        if self.enabled:
+            if self.exporter == 'file':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atexit.register(self.flush)
+            logger.info(f"Tracing enabled: exporting spans to {self.path if self.exporter == 'file' else self.endpoint}")
+
+    # -- Spans ---------------------------------------------------------------
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, parent=None, trace_key=None, links=None, **attributes):
+        """Start a span; end it with end() or use it as a context manager.
+
+        The parent is `parent` (a Span or SpanContext), else the current
+        span of this thread. A span without a parent starts the trace of
+        `trace_key` (e.g. the session id), or a new random trace.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current_span.get()
+        parent_context = getattr(parent, 'context', parent)
+        if parent_context is not None:
+            trace_id, parent_id = parent_context.trace_id, parent_context.span_id
+        else:
+            trace_id = trace_id_for(trace_key) if trace_key is not None else secrets.token_hex(16)
+            parent_id = None
+        return Span(self, name, trace_id, parent_id, attributes,
+                    [getattr(link, 'context', link) for link in links or () if link is not None])
+
+    # -- Export --------------------------------------------------------------
+
+    def _export(self, span):
+        if self._queue.qsize() >= self.max_queued:
+            self.dropped += 1
+            return
+        self._queue.put(span)
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._queue = queue.Queue()  # spans finished before a fork belong to the parent
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+
+    def _drain(self, first=None):
+        spans = [first] if first is not None else []
+        while len(spans) < self.batch_size:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Let a burst of spans (one job's images) go out together
+            time.sleep(min(0.2, self.flush_interval))
+            self._write(self._drain(first))
+
+    def flush(self):
+        """Export everything finished so far (blocking)"""
+        spans = self._drain()
+        while spans:
+            self._write(spans)
+            spans = self._drain()
+
+    def _write(self, spans):
+        if not spans:
+            return
+        with self._write_lock:
+            self._send(spans)
+
+    def _send(self, spans):
+        try:
+            if self.exporter == 'file':
+                lines = ''.join(json.dumps(_span_record(span), default=encode_default, separators=(',', ':')) + '\n'
+                                for span in spans)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+            elif self.exporter == 'otlp':
+                body = {'resourceSpans': [{
+                    'resource': {'attributes': _otlp_attributes({'service.name': self.service_name})},
+                    'scopeSpans': [{'scope': {'name': 'malaria-lab'}, 'spans': [_otlp_span(span) for span in spans]}]
+                }]}
+                data = json.dumps(body, default=encode_default).encode('utf-8')
+                req = urllib.request.Request(self.endpoint, data=data, method='POST',
+                                             headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(req, timeout=5) as response:
+                    response.read()
+        except Exception as e:
+            self.dropped += len(spans)
+            logger.warning(f"Exporting {len(spans)} spans failed: {str(e)}")
+
+
+tracer = Tracer()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import pytest
+
+# Configured before the app is imported: a throwaway SQLite database and
+# directories, cheap bcrypt, and synchronous activity logging
+_tmp_dir = tempfile.mkdtemp(prefix='malaria-lab-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(_tmp_dir, 'test.db'),
+    'UPLOAD_FOLDER': os.path.join(_tmp_dir, 'uploads'),
+    'LOG_FILE': os.path.join(_tmp_dir, 'app.log'),
+    'AUDIT_WAL_DIR': os.path.join(_tmp_dir, 'audit_wal'),
+    'AUDIT_ARCHIVE_DIR': os.path.join(_tmp_dir, 'audit_archive'),
+    'AUDIT_ASYNC': 'false',
+    'AUDIT_RETENTION_MONTHS': '0',
+    'BCRYPT_LOG_ROUNDS': '4',
+    'TRACING_EXPORTER': 'none',
+    'AI_WARMUP': 'false',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """Fresh tables for each test, inside an app context"""
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers(client):
+    """Authorization header of a freshly registered admin"""
+    client.post('/api/auth/register', json={
+        'email': 'admin@malarialab.com', 'username': 'admin', 'password': 'admin12345',
+        'first_name': 'Ada', 'last_name': 'Admin', 'role': 'admin'
+    })
+    response = client.post('/api/auth/login', json={'email': 'admin@malarialab.com', 'password': 'admin12345'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
@@ -0,0 +1,90 @@
+import pytest
+
+from routes.upload import _queue_full_response
+from services.admission import AdmissionController, AdmissionRejected, JobTooLarge, ServiceTimeEstimator
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setenv('AI_MAX_OUTSTANDING_IMAGES', '500')
+    monkeypatch.setenv('AI_USER_MAX_OUTSTANDING_IMAGES', '100')
+    monkeypatch.setenv('AI_LAB_MAX_OUTSTANDING_IMAGES', '300')
+    monkeypatch.setenv('AI_MAX_RETRY_AFTER_SECONDS', '600')
+    return AdmissionController()
+
+
+def job(remaining, user_id='user-1', lab='lab-a'):
+    return {'remaining': remaining, 'user_id': user_id, 'lab': lab}
+
+
+def check(controller, jobs, images, user_id='user-1', lab='lab-a', seconds_per_image=2, parallelism=4):
+    controller.check(jobs, images, user_id, lab, ServiceTimeEstimator(seconds_per_image), parallelism)
+
+
+def test_jobs_within_every_limit_are_admitted(controller):
+    check(controller, [job(60), job(200, user_id='user-2')], 40)
+
+    assert controller.rejections == {'total': 0, 'user': 0, 'lab': 0}
+
+
+def test_user_limit_retry_after_covers_the_excess_at_one_image_at_a_time(controller):
+    with pytest.raises(AdmissionRejected) as info:
+        check(controller, [job(60), job(200, user_id='user-2', lab='lab-b')], 50)
+
+    # 10 images over the limit, drained one after another at 2s each
+    assert (info.value.reason, info.value.outstanding, info.value.retry_after) == ('user', 60, 20)
+    assert controller.rejections['user'] == 1
+
+
+def test_lab_and_total_limits_drain_in_parallel(controller):
+    with pytest.raises(AdmissionRejected) as info:
+        check(controller, [job(70, user_id=f'user-{i}') for i in range(4)], 40, user_id='user-new')
+    assert (info.value.reason, info.value.retry_after) == ('lab', 10)  # 20 excess * 2s / 4 workers
+
+    with pytest.raises(AdmissionRejected) as info:
+        check(controller, [job(90, user_id=f'user-{i}', lab=f'lab-{i}') for i in range(5)], 60,
+              user_id='user-new', lab='lab-x')
+    assert (info.value.reason, info.value.retry_after) == ('total', 5)
+
+
+def test_retry_after_is_capped(controller):
+    with pytest.raises(AdmissionRejected) as info:
+        check(controller, [job(99)], 2, seconds_per_image=10000)
+
+    assert info.value.retry_after == controller.max_retry_after
+
+
+def test_a_job_over_a_limit_on_its_own_is_too_large(controller):
+    with pytest.raises(JobTooLarge) as info:
+        check(controller, [], 101)
+
+    assert (info.value.reason, info.value.limit, info.value.outstanding) == ('user', 100, 101)
+    assert info.value.retry_after is None
+
+
+def test_zero_disables_a_limit(controller):
+    controller.max_per_user = 0
+
+    check(controller, [job(99)], 150)
+
+
+def test_rejections_map_to_429_with_retry_after_and_413_without(app):
+    with app.test_request_context():
+        response, status, headers = _queue_full_response(AdmissionRejected('user', 100, 60, retry_after=20))
+        assert status == 429 and headers == {'Retry-After': '20'}
+        assert response.get_json()['retryAfter'] == 20
+
+        response, status = _queue_full_response(JobTooLarge('user', 100, 101))
+        assert status == 413
+        assert response.get_json() == {'error': 'Too many images for one AI job', 'reason': 'user',
+                                       'limit': 100, 'images': 101}
+
+
+def test_service_time_estimate_follows_measured_images():
+    estimator = ServiceTimeEstimator(initial=2, smoothing=0.5)
+    estimator.observe(4)  # the first measurement replaces the default
+    estimator.observe(2)
+    assert estimator.seconds_per_image == 3
+
+    assert estimator.estimate(images_ahead=0, images=2, parallelism=4) == 6  # own images run in sequence
+    assert estimator.estimate(images_ahead=18, images=2, parallelism=4) == 15
@@ -0,0 +1,161 @@
+import json
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models.activity_log import ActivityLog
+from models.activity_log_archive import ActivityLogArchive
+from models.activity_log_rollup import ActivityLogRollup
+from models.user import User
+from services.audit_retention import audit_retention, default_archive_dir
+
+NOW = datetime(2026, 10, 15, 12, 0)
+
+
+def add_logs(db, user_id, entries):
+    """entries: (action, status, risk_level, created_at)"""
+    for action, status, risk_level, created_at in entries:
+        db.session.add(ActivityLog(
+            action=action, user_id=user_id, user_info={'username': 'admin'}, resource_type='patient',
+            status=status, risk_level=risk_level, request_info={}, created_at=created_at
+        ))
+    db.session.commit()
+
+
+def raw_counts(db):
+    rows = db.session.execute(db.select(
+        ActivityLog.action, ActivityLog.resource_type, ActivityLog.status, ActivityLog.risk_level,
+        db.func.count()
+    ).group_by(ActivityLog.action, ActivityLog.resource_type, ActivityLog.status, ActivityLog.risk_level)).all()
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def rollup_counts(start_day=date(2000, 1, 1)):
+    return {tuple(row[:4]): row[4] for row in ActivityLogRollup.totals(start_day)}
+
+
+@pytest.fixture
+def retention(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_retention, 'retention_months', 12)
+    monkeypatch.setattr(audit_retention, 'archive_dir', str(tmp_path))
+    return audit_retention
+
+
+@pytest.fixture
+def user_id(client, admin_headers):
+    return User.query.filter_by(email='admin@malarialab.com').one().id
+
+
+def test_incremental_rollups_match_raw_counts(db):
+    entries = [('patient_viewed', 'success', 'low')] * 5 + [('patient_deleted', 'failure', 'high')] * 2 \
+        + [('login', 'success', 'medium')]
+    for action, status, risk_level in entries:
+        ActivityLog.log_activity(action, 'user-1', {}, 'patient', status=status, risk_level=risk_level)
+
+    assert rollup_counts() == raw_counts(db)
+    assert sum(rollup_counts().values()) == len(entries)
+
+
+def test_rebuild_reproduces_the_incremental_rollups(db):
+    for action in ('login', 'login', 'logout'):
+        ActivityLog.log_activity(action, 'user-1', {}, 'auth')
+    incremental = rollup_counts()
+
+    ActivityLogRollup.rebuild()
+
+    assert rollup_counts() == incremental
+
+
+def test_summary_totals_match_the_logs_in_range(client, admin_headers, db, user_id):
+    now = datetime.utcnow()
+    add_logs(db, user_id, [
+        ('patient_viewed', 'success', 'low', now - timedelta(days=2)),
+        ('patient_viewed', 'success', 'low', now - timedelta(days=10)),
+        ('patient_deleted', 'failure', 'high', now - timedelta(days=29, hours=12)),
+        ('patient_deleted', 'failure', 'high', now - timedelta(days=45)),
+    ])
+    ActivityLogRollup.rebuild()
+
+    summary = client.get('/api/activity-logs/summary?days=30', headers=admin_headers).get_json()
+
+    in_range = Counter(log.action for log in ActivityLog.query.all()
+                       if log.created_at >= now - timedelta(days=30))
+    assert summary['totalActivities'] == sum(in_range.values())
+    assert summary['byAction'] == dict(in_range)
+
+
+def test_archiving_is_off_by_default(db, user_id):
+    add_logs(db, user_id, [('login', 'success', 'low', datetime(2020, 1, 5))])
+
+    assert audit_retention.retention_months == 0
+    assert audit_retention.due_months(NOW) == []
+    assert audit_retention.archive_expired(NOW) == []
+    assert ActivityLog.query.count() > 0
+
+
+def test_archives_default_outside_the_source_tree(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path))
+    assert default_archive_dir() == str(tmp_path / 'malaria-lab' / 'audit_archive')
+
+    monkeypatch.delenv('XDG_DATA_HOME')
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert not os.path.abspath(default_archive_dir()).startswith(server_dir + os.sep)
+
+
+def test_archived_months_keep_rollups_and_stay_exportable(client, admin_headers, db, user_id, retention):
+    add_logs(db, user_id, [
+        ('patient_viewed', 'success', 'low', datetime(2025, 3, 3, 9)),
+        ('patient_viewed', 'success', 'low', datetime(2025, 3, 20, 9)),
+        ('patient_deleted', 'failure', 'high', datetime(2025, 4, 1, 9)),
+        ('patient_viewed', 'success', 'low', datetime(2026, 9, 1, 9)),
+    ])
+    ActivityLogRollup.rebuild()
+    before = rollup_counts()
+
+    archived = retention.archive_expired(NOW)
+
+    assert [(archive.month, archive.status, archive.row_count) for archive in archived] == \
+        [('2025-03', 'archived', 2), ('2025-04', 'archived', 1)]
+    assert ActivityLog.query.filter(ActivityLog.created_at < datetime(2025, 10, 1)).count() == 0
+    assert rollup_counts() == before
+
+    response = client.get('/api/activity-logs/export?startDate=2025-03-10T00:00:00&endDate=2026-09-30T00:00:00'
+                          '&format=ndjson', headers=admin_headers)
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['createdAt'][:10] for record in records] == ['2026-09-01', '2025-04-01', '2025-03-20']
+
+
+def test_stale_running_claims_are_taken_over(db, user_id, retention):
+    add_logs(db, user_id, [('login', 'success', 'low', datetime(2025, 1, 5))])
+    db.session.add(ActivityLogArchive(month='2025-01', status='running', created_at=datetime.utcnow()))
+    db.session.commit()
+
+    assert retention.archive_month(2025, 1) is None  # a live claim is left alone
+
+    db.session.get(ActivityLogArchive, '2025-01').created_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.commit()
+    archive = retention.archive_month(2025, 1)
+
+    assert archive.status == 'archived' and archive.row_count == 1
+    assert list(retention.read_archive(archive.path))[0]['action'] == 'login'
+
+
+def test_summary_counts_a_partial_first_day_that_was_archived(client, admin_headers, db, user_id, retention):
+    days = (datetime.utcnow().date() - date(2025, 3, 3)).days
+    add_logs(db, user_id, [
+        ('patient_viewed', 'success', 'low', datetime(2025, 3, 3, 23, 59, 59)),  # partial first day
+        ('patient_viewed', 'success', 'low', datetime(2025, 3, 4, 9)),
+    ])
+    ActivityLogRollup.rebuild()
+
+    def summary():
+        return client.get(f'/api/activity-logs/summary?days={days}', headers=admin_headers).get_json()
+
+    before = summary()
+    assert [archive.month for archive in retention.archive_expired(NOW)] == ['2025-03']
+    after = summary()
+
+    assert after['byAction']['patient_viewed'] == 2
+    assert after['totalActivities'] == before['totalActivities']
@@ -0,0 +1,82 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+
+from models.activity_log import ActivityLog
+from models.activity_log_rollup import ActivityLogRollup
+from services.audit_writer import AuditWriter
+from utils.json_provider import encode_default
+
+
+@pytest.fixture
+def writer(app, db, tmp_path, monkeypatch):
+    monkeypatch.setenv('AUDIT_ASYNC', 'true')
+    monkeypatch.setenv('AUDIT_WAL_DIR', str(tmp_path))
+    monkeypatch.setenv('AUDIT_FLUSH_INTERVAL', '3600')  # flushed explicitly by the tests
+    original = app.extensions['audit_writer']
+    writer = AuditWriter()
+    writer.init_app(app)
+    yield writer
+    writer.shutdown()
+    app.extensions['audit_writer'] = original
+
+
+def record(**fields):
+    return {
+        'id': str(uuid.uuid4()), 'action': 'login', 'user_id': 'user-1', 'user_info': {'username': 'u'},
+        'resource_type': 'auth', 'request_info': {}, 'status': 'success', 'risk_level': 'low',
+        'created_at': datetime(2025, 1, 2, 3, 4, 5), **fields
+    }
+
+
+def write_segment(path, records, torn_tail=b''):
+    with open(path, 'wb') as handle:
+        for item in records:
+            handle.write(json.dumps(item, default=encode_default).encode('utf-8') + b'\n')
+        handle.write(torn_tail)
+
+
+def test_submitted_records_reach_the_database_on_flush(writer, db):
+    first = writer.submit(action='login', user_id='user-1', user_info={}, resource_type='auth', request_info={})
+    writer.submit(action='logout', user_id='user-1', user_info={}, resource_type='auth', request_info={})
+    segments = [name for name in os.listdir(writer.wal_dir) if name.endswith('.jsonl')]
+    assert len(segments) == 1  # written ahead before any insert
+
+    writer.flush()
+
+    assert db.session.get(ActivityLog, first['id']).action == 'login'
+    assert ActivityLog.query.count() == 2
+    assert os.listdir(writer.wal_dir) == []
+
+
+def test_recovery_replays_orphaned_segments_and_skips_torn_lines(writer, db):
+    records = [record(), record(action='logout')]
+    path = os.path.join(writer.wal_dir, 'audit-99999-1-1.jsonl')
+    write_segment(path, records, torn_tail=b'{"id": "half-writ')
+
+    writer._recover()
+
+    assert {log.id for log in ActivityLog.query.all()} == {item['id'] for item in records}
+    assert not os.path.exists(path)
+
+
+def test_replays_do_not_duplicate_stored_records(writer, db):
+    stored = record()
+    writer._bulk_insert([dict(stored)])
+    path = os.path.join(writer.wal_dir, 'audit-99999-2-1.jsonl')
+    write_segment(path, [stored, record(action='logout')])
+
+    writer._recover()
+    writer._bulk_insert([dict(stored)])
+
+    assert ActivityLog.query.count() == 2
+    rollups = {(row.action, row.count) for row in ActivityLogRollup.query.all()}
+    assert rollups == {('login', 1), ('logout', 1)}
+
+
+def test_invalid_actions_are_refused(writer):
+    with pytest.raises(ValueError):
+        writer.submit(action='not-an-action', user_id='u', user_info={}, resource_type='auth')
@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models.analysis_checkpoint import AnalysisCheckpoint
+from models.analysis_job import AnalysisJob
+from services.ai_analysis import AIAnalysisService
+from services.model_loader import ModelLoader
+from services.stub_detector import StubDetector
+
+SESSION = 'SESS-20260101-001'
+
+
+class RecordingDetector(StubDetector):
+    """Instant stub detector that records analysed images; paths in `failing` error out"""
+
+    def __init__(self):
+        super().__init__(batch_ms=0, image_ms=0)
+        self.seen = []
+        self.failing = set()
+
+    def detect_batch(self, image_paths, confidence_threshold=0.26, annotate=False):
+        self.seen.extend(image_paths)
+        results = super().detect_batch(image_paths, confidence_threshold, annotate)
+        return [(None, 'Error processing image: unreadable') if path in self.failing else result
+                for path, result in zip(image_paths, results)]
+
+
+@pytest.fixture
+def detector():
+    return RecordingDetector()
+
+
+@pytest.fixture
+def service(app, db, detector):
+    service = AIAnalysisService()
+    service.app = app
+    service.model_loader = ModelLoader(lambda: detector, name='stub detector')
+    service.stored = []
+    service._store_analysis_results = lambda test_id, results: service.stored.append(results) or True
+    return service
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for index in range(3):
+        path = tmp_path / f'slide{index}.jpg'
+        path.write_bytes(b'jpeg')
+        paths.append(str(path))
+    return paths
+
+
+def new_job(service, images):
+    job = {'session_id': SESSION, 'test_id': 'test-1', 'image_paths': images, 'priority': 'normal',
+           'status': 'queued', 'progress': 0, 'remaining': len(images)}
+    service.jobs[SESSION] = job
+    return job
+
+
+def test_resumed_job_skips_checkpointed_images(service, detector, images):
+    for index in (0, 1):
+        AnalysisCheckpoint.save(SESSION, index, images[index], {'parasiteCount': index, 'imagePath': images[index]})
+    job = new_job(service, images)
+
+    service._process_job_with_context(job)
+
+    assert detector.seen == [images[2]]
+    assert job['status'] == 'completed' and job['remaining'] == 0
+    assert [result['imagePath'] for result in service.stored[0]] == images
+    assert AnalysisCheckpoint.for_session(SESSION) == {}
+
+
+def test_preempted_job_continues_where_it_stopped(service, detector, images, monkeypatch):
+    job = new_job(service, images)
+    preempt = iter([True])
+    monkeypatch.setattr(service, '_should_preempt', lambda current: next(preempt, False))
+
+    service._process_job_with_context(job)
+    assert job['status'] == 'queued' and service.processing_queue.pop() is job
+    assert list(AnalysisCheckpoint.for_session(SESSION)) == [images[0]]
+
+    service._process_job_with_context(job)
+    assert detector.seen == images  # every image analysed exactly once
+    assert job['status'] == 'completed'
+
+
+def test_failed_images_are_retried_when_the_job_is_queued_again(service, detector, images):
+    detector.failing = set(images)
+    job = new_job(service, images)
+
+    service._process_job_with_context(job)
+    assert job['status'] == 'failed'
+    assert AnalysisCheckpoint.for_session(SESSION) == {}
+
+    detector.failing = set()
+    service._process_job_with_context(job)
+    assert job['status'] == 'completed'
+    assert len(service.stored[0]) == 3
+
+
+def test_error_rows_from_older_versions_are_retried(service, detector, images, db):
+    db.session.add(AnalysisCheckpoint(session_id=SESSION, position=0, image_path=images[0], error='boom'))
+    db.session.commit()
+    job = new_job(service, images)
+
+    service._process_job_with_context(job)
+
+    assert detector.seen == images
+    assert job['status'] == 'completed'
+
+
+def test_remaining_counts_only_existing_unanalysed_images(service, images):
+    AnalysisCheckpoint.save(SESSION, 0, images[0], {'parasiteCount': 0})
+
+    assert service._unfinished_images(SESSION, images + ['/missing/slide.jpg']) == 2
+
+
+def test_a_job_whose_row_cannot_be_written_is_not_left_queued(service, images, monkeypatch):
+    def locked(*args):
+        raise OperationalError('INSERT INTO analysis_jobs', {}, Exception('database is locked'))
+
+    start = AnalysisJob.start
+    monkeypatch.setattr(service, 'start', lambda: None)
+    monkeypatch.setattr(service, '_start_processing', lambda: None)
+    monkeypatch.setattr(AnalysisJob, 'start', locked)
+
+    assert service.add_to_processing_queue(SESSION, 'test-1', images) is False
+    assert SESSION not in service.jobs
+    assert service.outstanding_images() == 0
+
+    monkeypatch.setattr(AnalysisJob, 'start', start)
+    assert service.add_to_processing_queue(SESSION, 'test-1', images) is True
+    assert service.processing_queue.pop() is service.jobs[SESSION]
@@ -0,0 +1,86 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from middleware.compression import ResponseCompressor
+from utils import negotiation
+from utils.json_provider import FastJSONProvider
+from utils.negotiation import negotiated_response
+
+BIG = {'rows': [{'id': index, 'status': 'POSITIVE'} for index in range(200)]}
+PAYLOAD = {'testId': 'TEST-20260101-001', 'createdAt': datetime(2026, 1, 1, 8, 0)}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('COMPRESS_MIN_SIZE', '1024')
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    ResponseCompressor(app)
+
+    app.add_url_rule('/big', 'big', lambda: jsonify(BIG))
+    app.add_url_rule('/small', 'small', lambda: jsonify({'ok': True}))
+    app.add_url_rule('/events', 'events', lambda: Response('data: x\n\n' * 500, mimetype='text/event-stream'))
+    app.add_url_rule('/stream', 'stream', lambda: Response((f'{i},row\n' for i in range(5000)), mimetype='text/csv'))
+    app.add_url_rule('/result', 'result', lambda: negotiated_response(PAYLOAD))
+    return app.test_client()
+
+
+def test_large_json_is_gzipped_for_clients_that_accept_it(client):
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert json.loads(gzip.decompress(response.get_data())) == BIG
+
+
+def test_brotli_is_preferred_when_installed(client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.get_data())) == BIG
+
+
+def test_small_bodies_event_streams_and_plain_clients_are_left_alone(client):
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/events', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/big').headers
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk(client):
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+    assert lines[0] == '0,row' and len(lines) == 5000
+
+
+def test_json_is_returned_unless_messagepack_is_preferred(client):
+    for accept in (None, '*/*', 'application/json, application/msgpack'):
+        response = client.get('/result', headers={'Accept': accept} if accept else {})
+        assert response.mimetype == 'application/json'
+        assert response.get_json() == {'testId': 'TEST-20260101-001', 'createdAt': '2026-01-01T08:00:00'}
+    assert 'Accept' in response.vary
+
+
+def test_messagepack_is_negotiated_when_installed(client):
+    msgpack = pytest.importorskip('msgpack')
+    response = client.get('/result', headers={'Accept': 'application/msgpack'})
+
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.get_data()) == {'testId': 'TEST-20260101-001',
+                                                    'createdAt': '2026-01-01T08:00:00'}
+
+
+def test_messagepack_requests_fall_back_to_json_without_the_packer(client, monkeypatch):
+    monkeypatch.setattr(negotiation, 'msgpack', None)
+
+    response = client.get('/result', headers={'Accept': 'application/msgpack'})
+
+    assert response.mimetype == 'application/json'
@@ -0,0 +1,63 @@
+import struct
+
+import pytest
+
+from models.diagnosis_image import BOX_FIELDS, UNKNOWN_CLASS_ID, DiagnosisImage, float32_decimal
+
+PARASITES = [
+    {'type': 'PF', 'confidence': 0.91234, 'bbox': [10.5, 20.25, 30.125, 40.07]},
+    {'type': 'PV', 'confidence': 0.5, 'bbox': [100, 200, 300, 400]},
+]
+WBCS = [{'type': 'WBC', 'confidence': 0.77, 'bbox': [1.1, 2.0, 3.0, 4.0]}]
+
+
+def test_boxes_are_packed_as_little_endian_float32_rows():
+    packed = DiagnosisImage.pack_boxes(PARASITES + WBCS)
+
+    assert len(packed) == 3 * len(BOX_FIELDS) * 4
+    first_row = struct.unpack('<6f', packed[:24])
+    assert first_row == pytest.approx((10.5, 20.25, 30.125, 40.07, 0.91234, 0), rel=1e-6)
+    assert struct.unpack('<6f', packed[-24:])[5] == DiagnosisImage.class_id_for('WBC')
+
+
+def test_detections_read_back_exactly_as_written():
+    image = DiagnosisImage()
+    image.set_boxes(PARASITES, WBCS)
+
+    data = image.to_dict()
+    assert image.box_count == 3
+    assert data['parasitesDetected'] == PARASITES
+    assert data['wbcsDetected'] == WBCS
+
+
+def test_stored_rows_are_unrounded_float32_values():
+    image = DiagnosisImage()
+    image.set_boxes(PARASITES, [])
+
+    row = image.box_rows()[0]
+    assert row[4] != 0.91234 and row[4] == pytest.approx(0.91234, rel=1e-7)
+    assert image.to_dict(compact=True)['boxes'][0] == [10.5, 20.25, 30.125, 40.07, 0.91234, 0]
+
+
+def test_float32_decimal_recovers_short_decimals():
+    for value in (0.9, 0.26, 123.45, 1e-05, 0.0, 1234567.0):
+        stored = DiagnosisImage.pack_boxes([{'type': 'PF', 'confidence': value, 'bbox': [0, 0, 0, 0]}])
+        assert float32_decimal(struct.unpack('<6f', stored)[4]) == value
+
+
+def test_unknown_detection_types_are_rejected_on_write():
+    image = DiagnosisImage()
+
+    with pytest.raises(ValueError, match='XYZ'):
+        image.set_boxes([{'type': 'XYZ', 'confidence': 0.5, 'bbox': [0, 0, 1, 1]}], [])
+    assert DiagnosisImage.rows_from_detections([{'type': 'XYZ'}], []) == [[0, 0, 0, 0, None, UNKNOWN_CLASS_ID]]
+
+
+def test_empty_boxes():
+    image = DiagnosisImage()
+    image.set_boxes([], None)
+
+    assert image.box_count == 0
+    assert image.box_rows() == []
+    assert image.split_boxes() == ([], [])
+
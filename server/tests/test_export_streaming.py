@@ -0,0 +1,96 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.activity_log import ActivityLog
+from models.user import User
+from services.export_service import csv_lines, json_document_lines, validate_export_args
+
+START = datetime(2025, 6, 1)
+RANGE = 'startDate=2025-06-01T00:00:00&endDate=2025-06-30T23:59:59'
+
+
+@pytest.fixture
+def logs(db, admin_headers):
+    """Five June logs plus one outside the range, oldest first"""
+    user = User.query.filter_by(email='admin@malarialab.com').one()
+    created = []
+    for day in range(5):
+        created.append(ActivityLog(
+            action='patient_viewed', user_id=user.id, user_info={'username': 'admin'},
+            resource_type='patient', resource_id=f'PAT-{day}', details={'day': day}, request_info={},
+            created_at=START + timedelta(days=day, hours=8)
+        ))
+    db.session.add_all(created)
+    db.session.add(ActivityLog(
+        action='patient_viewed', user_id=user.id, user_info={}, resource_type='patient', request_info={},
+        created_at=datetime(2025, 7, 2)
+    ))
+    db.session.commit()
+    return created
+
+
+def test_ndjson_streams_one_document_per_log_newest_first(client, admin_headers, logs):
+    response = client.get(f'/api/activity-logs/export?{RANGE}&format=ndjson', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['resourceId'] for record in records] == ['PAT-4', 'PAT-3', 'PAT-2', 'PAT-1', 'PAT-0']
+
+
+def test_csv_export_has_header_and_flattened_rows(client, admin_headers, logs):
+    response = client.get(f'/api/activity-logs/export?{RANGE}&format=csv', headers=admin_headers)
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['Action', 'User', 'Resource', 'Status', 'Risk Level', 'Timestamp', 'Details']
+    assert len(rows) == 6
+    assert rows[1][:3] == ['patient_viewed', 'admin', 'patient: PAT-4']
+    assert rows[1][5].startswith('2025-06-05T08:00:00')
+    assert json.loads(rows[1][6]) == {'day': 4}
+
+
+def test_json_document_reports_total_records(client, admin_headers, logs):
+    response = client.get(f'/api/activity-logs/export?{RANGE}&format=json', headers=admin_headers)
+
+    document = json.loads(response.get_data(as_text=True))
+    assert len(document['logs']) == 5
+    assert document['exportInfo']['totalRecords'] == 5
+    assert document['exportInfo']['exportedBy'] == 'admin'
+
+
+def test_gzip_export_decompresses_to_the_plain_export(client, admin_headers, logs):
+    # A streamed response keeps its request context until it has been read
+    with client.get(f'/api/activity-logs/export?{RANGE}&format=ndjson', headers=admin_headers) as plain:
+        plain_records = [json.loads(line) for line in plain.get_data(as_text=True).splitlines()]
+    compressed = client.get(f'/api/activity-logs/export?{RANGE}&format=ndjson&compress=gzip', headers=admin_headers)
+
+    assert compressed.mimetype == 'application/gzip'
+    assert compressed.headers['Content-Disposition'].endswith('.ndjson.gz')
+    unpacked = gzip.decompress(compressed.get_data()).decode('utf-8')
+    assert [json.loads(line) for line in unpacked.splitlines()] == plain_records
+
+
+def test_invalid_export_arguments_are_rejected(client, admin_headers):
+    response = client.get(f'/api/activity-logs/export?{RANGE}&format=xml', headers=admin_headers)
+    assert response.status_code == 400
+    assert validate_export_args({'compress': 'zip'})[2] == 'compress must be gzip'
+
+
+def test_json_document_lines_handles_empty_exports(app):
+    with app.app_context():
+        document = json.loads(''.join(json_document_lines(iter(()), 'rows', 'info', {'name': 'x'})))
+    assert document == {'rows': [], 'info': {'name': 'x', 'totalRecords': 0}}
+
+
+def test_csv_lines_encodes_nested_values_and_blanks(app):
+    columns = [('Name', 'name'), ('Tags', 'tags'), ('Missing', 'missing')]
+    with app.app_context():
+        lines = list(csv_lines(columns, [{'name': 'a,b', 'tags': ['x', 'y']}]))
+    assert lines[0] == 'Name,Tags,Missing\r\n'
+    assert next(csv.reader(io.StringIO(lines[1]))) == ['a,b', '["x","y"]', '']
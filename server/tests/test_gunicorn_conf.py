@@ -0,0 +1,76 @@
+import importlib.util
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+from services.ai_analysis import AIAnalysisService
+from services.audit_retention import AuditRetention, audit_retention
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for name in ('GUNICORN_WORKERS', 'GUNICORN_THREADS', 'GUNICORN_PRELOAD', 'GUNICORN_GRACEFUL_TIMEOUT'):
+        monkeypatch.delenv(name, raising=False)
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', CONFIG_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Server:
+    log = logging.getLogger('gunicorn.test')
+
+
+def test_defaults_are_one_threaded_worker_with_a_graceful_timeout(config):
+    assert (config.worker_class, config.workers, config.threads) == ('gthread', 1, 8)
+    assert config.preload_app is True
+    assert config.graceful_timeout == 120
+
+
+def test_retention_thread_is_restarted_in_a_forked_process(app):
+    retention = AuditRetention()
+    retention.app = app
+    retention.retention_months = 12
+    retention.interval = 3600
+
+    retention.start()
+    first = retention._thread
+    retention.start()
+    assert retention._thread is first  # one thread per process
+
+    retention._pid = -1  # as seen by a child after the fork
+    retention.start()
+    assert retention._thread is not first and retention._thread.is_alive()
+
+    retention.stop()
+    retention._thread.join(5)
+    assert not retention._thread.is_alive()
+
+
+def test_when_ready_stops_the_masters_retention_thread(config, monkeypatch):
+    stopped = []
+    monkeypatch.setattr(audit_retention, 'stop', lambda: stopped.append(True))
+
+    config.when_ready(Server())
+
+    assert stopped == [True]
+
+
+def test_worker_exit_lets_the_running_job_finish(config, monkeypatch):
+    service = AIAnalysisService()
+    finish = threading.Event()
+    job = threading.Thread(target=finish.wait, args=(5,))
+    job.start()
+    service._workers = {job}
+    monkeypatch.setattr(sys.modules['services.ai_analysis'], 'ai_service', service)
+
+    threading.Timer(0.1, finish.set).start()
+    config.worker_exit(Server(), None)
+
+    assert not job.is_alive()
+    assert service._stopping
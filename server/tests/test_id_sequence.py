@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from models.id_sequence import IdSequence
+from models.patient import Patient
+from models.test import Test as LabTest
+from models.upload_session import UploadSession
+
+DAY = datetime(2026, 3, 14, 9, 30)
+
+
+def test_ids_count_up_per_prefix_and_day(db):
+    assert IdSequence.next_id('TEST', LabTest.test_id, DAY) == 'TEST-20260314-001'
+    assert IdSequence.next_id('TEST', LabTest.test_id, DAY) == 'TEST-20260314-002'
+    assert IdSequence.next_id('SESS', UploadSession.session_id, DAY) == 'SESS-20260314-001'
+    assert IdSequence.next_id('TEST', LabTest.test_id, datetime(2026, 3, 15)) == 'TEST-20260315-001'
+
+
+def test_counter_is_seeded_from_ids_issued_before_it_existed(db):
+    for patient_id in ('PAT-20260314-004', 'PAT-20260314-012', 'PAT-20260313-050', 'PAT-20260314-abc'):
+        db.session.execute(db.insert(Patient.__table__).values(
+            id=patient_id, patient_id=patient_id, first_name='A', last_name='B', created_by='u',
+            created_at=DAY
+        ))
+
+    assert IdSequence.next_id('PAT', Patient.patient_id, DAY) == 'PAT-20260314-013'
+    assert IdSequence.next_id('PAT', Patient.patient_id, DAY) == 'PAT-20260314-014'
+
+
+def test_collision_on_counter_creation_takes_the_next_value(db, monkeypatch):
+    # Another request creates today's counter between our UPDATE and INSERT
+    db.session.add(IdSequence(prefix='TEST', day='20260314', value=5))
+    db.session.flush()
+    increment = IdSequence._increment
+    calls = []
+
+    def racing_increment(prefix, date_str):
+        calls.append(prefix)
+        return None if len(calls) == 1 else increment(prefix, date_str)
+
+    monkeypatch.setattr(IdSequence, '_increment', staticmethod(racing_increment))
+
+    assert IdSequence.next_id('TEST', LabTest.test_id, DAY) == 'TEST-20260314-006'
+    assert len(calls) == 2
+    assert db.session.get(IdSequence, ('TEST', '20260314')).value == 6
+
+
+def test_generated_ids_are_unique(db):
+    ids = {IdSequence.next_id('SESS', UploadSession.session_id, DAY) for _ in range(50)}
+    assert len(ids) == 50
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models.user import User
+from services.identity_cache import identity_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    identity_cache.clear()
+    yield
+    identity_cache.clear()
+
+
+@contextmanager
+def user_queries(db):
+    """Collects the SQL statements that read the users table"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_profile_is_served_from_the_cached_identity(client, admin_headers, db):
+    client.get('/api/auth/profile', headers=admin_headers)  # caches the identity
+
+    with user_queries(db) as statements:
+        response = client.get('/api/auth/profile', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['user']['email'] == 'admin@malarialab.com'
+    assert statements == []
+
+
+def test_a_committed_user_update_invalidates_the_cached_identity(client, admin_headers, db):
+    response = client.put('/api/auth/profile', json={'first_name': 'Grace'}, headers=admin_headers)
+    assert response.status_code == 200
+
+    assert client.get('/api/auth/profile', headers=admin_headers).get_json()['user']['firstName'] == 'Grace'
+
+    user = User.query.filter_by(email='admin@malarialab.com').one()
+    assert identity_cache.get(user.id).role == 'admin'
+    user.role = 'technician'
+    db.session.commit()
+
+    assert identity_cache.get(user.id).role == 'technician'
+
+
+def test_invalid_password_changes_do_not_load_the_user_row(client, admin_headers, db):
+    client.get('/api/auth/profile', headers=admin_headers)
+
+    with user_queries(db) as statements:
+        response = client.post('/api/auth/change-password', json={'current_password': 'admin12345'},
+                               headers=admin_headers)
+
+    assert response.status_code == 400
+    assert statements == []
+
+
+def test_password_change_updates_the_loaded_row(client, admin_headers):
+    response = client.post('/api/auth/change-password', headers=admin_headers,
+                           json={'current_password': 'admin12345', 'new_password': 'newpass123'})
+    assert response.status_code == 200
+
+    response = client.post('/api/auth/login', json={'email': 'admin@malarialab.com', 'password': 'newpass123'})
+    assert response.status_code == 200
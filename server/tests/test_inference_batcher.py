@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.inference_batcher import InferenceBatcher
+
+
+class Detector:
+    """run_batch stand-in that records its batches.
+
+    A batch containing 'boom' raises, and one containing 'short' returns a
+    result too few.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, image_paths, **options):
+        self.entered.set()
+        self.release.wait()
+        self.batches.append(list(image_paths))
+        if 'boom' in image_paths:
+            raise RuntimeError('CUDA out of memory')
+        if 'short' in image_paths:
+            return [({'image': path}, None) for path in image_paths[:-1]]
+        return [({'image': path, **options}, None) for path in image_paths]
+
+
+def blocked_batcher(detector, **options):
+    """A batcher whose inference thread is held inside a batch of 'first'"""
+    detector.release.clear()
+    batcher = InferenceBatcher(detector, max_wait_ms=0, **options)
+    blocker = batcher.submit('first')
+    assert detector.entered.wait(5)
+    batcher.max_wait = 0.2  # later batches wait for company
+    return batcher, blocker
+
+
+def test_concurrent_images_share_a_batch():
+    detector = Detector()
+    batcher, blocker = blocked_batcher(detector, max_batch_size=4, timeout=5)
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(batcher.detect, f'img{i}') for i in range(4)]
+        time.sleep(0.05)
+        detector.release.set()
+        results = [future.result() for future in futures]
+
+    assert blocker.result(timeout=5) == ({'image': 'first'}, None)
+    assert [result for result, _ in results] == [{'image': f'img{i}'} for i in range(4)]
+    assert sorted(detector.batches[1]) == ['img0', 'img1', 'img2', 'img3']
+
+
+def test_a_failing_batch_resolves_with_errors_and_the_thread_survives():
+    batcher = InferenceBatcher(Detector(), max_batch_size=4, max_wait_ms=0, timeout=5)
+
+    result, error = batcher.detect('boom')
+    assert result is None and 'CUDA out of memory' in error
+
+    assert batcher.detect('after') == ({'image': 'after'}, None)
+    assert batcher._thread.is_alive()
+    assert batcher.stats()['failedBatches'] == 1
+
+
+def test_a_short_result_list_fails_the_batch_instead_of_hanging():
+    batcher = InferenceBatcher(Detector(), max_batch_size=4, max_wait_ms=0, timeout=5)
+
+    result, error = batcher.detect('short')
+    assert result is None and 'returned 0 results for 1 images' in error
+    assert batcher.detect('after') == ({'image': 'after'}, None)
+
+
+def test_detect_times_out_and_the_cancelled_request_is_skipped():
+    detector = Detector()
+    batcher, _ = blocked_batcher(detector, max_batch_size=1, timeout=0.1)
+
+    result, error = batcher.detect('waiting')
+    assert result is None and 'timed out' in error
+
+    detector.release.set()
+    assert batcher.detect('next') == ({'image': 'next'}, None)
+    assert ['waiting'] not in detector.batches
+    assert batcher.stats()['timeouts'] == 1
+
+
+def test_images_with_different_options_are_not_batched_together():
+    detector = Detector()
+    batcher, _ = blocked_batcher(detector, max_batch_size=4, timeout=5)
+    plain = batcher.submit('plain')
+    annotated = batcher.submit('annotated', annotate=True)
+    detector.release.set()
+
+    assert plain.result(timeout=5) == ({'image': 'plain'}, None)
+    assert annotated.result(timeout=5) == ({'image': 'annotated', 'annotate': True}, None)
+    assert ['plain'] in detector.batches and ['annotated'] in detector.batches
@@ -0,0 +1,110 @@
+import pytest
+
+from services import job_scheduler
+from services.ai_analysis import AIAnalysisService
+from services.job_scheduler import PriorityJobQueue, priority_level
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_scheduler.time, 'monotonic', clock)
+    return clock
+
+
+def job(session_id, priority='normal'):
+    return {'session_id': session_id, 'priority': priority}
+
+
+def drain(queue):
+    order = []
+    while len(queue):
+        order.append(queue.pop()['session_id'])
+    return order
+
+
+def test_higher_priority_runs_first_and_ties_keep_fifo_order(clock):
+    queue = PriorityJobQueue(aging_seconds=300)
+    for session_id, priority in (('a', 'normal'), ('b', 'low'), ('c', 'urgent'), ('d', 'normal'), ('e', 'high')):
+        queue.push(job(session_id, priority))
+        clock.now += 1
+
+    assert drain(queue) == ['c', 'e', 'a', 'd', 'b']
+
+
+def test_waiting_jobs_age_past_newer_higher_priority_work(clock):
+    queue = PriorityJobQueue(aging_seconds=300)
+    queue.push(job('old-low', 'low'))
+    clock.now += 301  # more than one aging period
+    queue.push(job('new-normal', 'normal'))
+    clock.now += 400
+    queue.push(job('newer-high', 'high'))
+
+    assert drain(queue) == ['old-low', 'new-normal', 'newer-high']
+
+
+def test_requeued_job_keeps_its_place(clock):
+    queue = PriorityJobQueue(aging_seconds=300)
+    first = job('first')
+    queue.push(first)
+    clock.now += 10
+    queue.push(job('second'))
+    assert queue.pop() is first
+
+    clock.now += 1000
+    queue.push(first)  # preempted and pushed back
+    assert drain(queue) == ['first', 'second']
+
+
+def test_unknown_priority_is_normal_and_remove_keeps_depth(clock):
+    queue = PriorityJobQueue(aging_seconds=300)
+    queue.push(job('x', 'whenever'))
+    queue.push(job('y', 'high'))
+
+    assert queue.remove('x')['priority'] == 'normal'
+    assert queue.remove('missing') is None
+    assert queue.stats()['normal']['queued'] == 0
+    assert queue.stats()['high']['queued'] == 1
+    assert priority_level(None) == priority_level('normal')
+
+
+def busy_service(running, queued):
+    service = AIAnalysisService()
+    service.job_workers = 1
+    service._workers = {object()}
+    service.processing_queue.push(running)
+    service.processing_queue.pop()
+    for item in queued:
+        service.processing_queue.push(item)
+    return service
+
+
+def test_urgent_job_preempts_running_lower_priority_work(clock):
+    running = job('running', 'normal')
+    clock.now += 1
+    service = busy_service(running, [job('urgent', 'urgent')])
+
+    assert service._should_preempt(running)
+
+
+def test_preemption_needs_busy_workers_and_an_urgent_head(clock):
+    running = job('running', 'normal')
+    service = busy_service(running, [job('high', 'high')])
+    assert not service._should_preempt(running)
+
+    urgent = job('urgent', 'urgent')
+    service.processing_queue.push(urgent)
+    service._workers = set()  # a free worker picks the urgent job up instead
+    assert not service._should_preempt(running)
+
+    service._workers = {object()}
+    assert service._should_preempt(running)
+    assert not service._should_preempt(urgent)  # urgent work is never preempted
@@ -0,0 +1,59 @@
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+
+import numpy as np
+import pytest
+
+from utils.json_provider import FastJSONProvider, encode_default
+
+PAYLOAD = {
+    'createdAt': datetime(2026, 1, 2, 3, 4, 5, 600000),
+    'day': date(2026, 1, 2),
+    'at': time(8, 30),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'dose': decimal.Decimal('1.10'),
+    'confidence': np.float32(0.5),
+    'count': np.int64(7),
+    'bbox': np.array([1.5, 2.0], dtype=np.float32),
+}
+
+EXPECTED = {
+    'createdAt': '2026-01-02T03:04:05.600000',
+    'day': '2026-01-02',
+    'at': '08:30:00',
+    'id': '12345678-1234-5678-1234-567812345678',
+    'dose': '1.10',
+    'confidence': 0.5,
+    'count': 7,
+    'bbox': [1.5, 2.0],
+}
+
+
+def test_encode_default_converts_the_values_the_stdlib_rejects():
+    assert {key: encode_default(value) for key, value in PAYLOAD.items()} == EXPECTED
+
+    with pytest.raises(TypeError):
+        encode_default(object())
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_every_backend_encodes_the_same_document(app, backend):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    provider = FastJSONProvider(app, backend=backend)
+
+    assert json.loads(provider.encode(PAYLOAD)) == EXPECTED
+    assert json.loads(provider.dumps(PAYLOAD)) == EXPECTED
+    assert provider.encode({'b': 1, 'a': 2}) == b'{"b":1,"a":2}'  # keys keep their order
+
+
+def test_jsonify_uses_the_fast_provider(app):
+    assert isinstance(app.json, FastJSONProvider)
+
+    with app.test_request_context():
+        response = app.json.response(PAYLOAD)
+
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == EXPECTED
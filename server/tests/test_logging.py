@@ -0,0 +1,54 @@
+import logging
+import queue
+from logging.handlers import QueueListener
+
+import pytest
+
+from utils.logging import DroppingQueueHandler, dropped_records, setup_logging
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('tests.dropping')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    yield logger
+    logger.handlers.clear()
+
+
+def test_records_are_dropped_and_counted_when_the_queue_is_full(logger):
+    handler = DroppingQueueHandler(queue.Queue(2))
+    logger.addHandler(handler)
+
+    for index in range(5):
+        logger.info('image %d analysed', index)
+
+    assert handler.dropped == 3
+    queued = [handler.queue.get_nowait() for _ in range(2)]
+    # Formatted by the caller, so the listener never touches the original args
+    assert [(record.getMessage(), record.args) for record in queued] == [
+        ('image 0 analysed', None), ('image 1 analysed', None)]
+
+
+def test_the_listener_writes_queued_records_out(logger, tmp_path):
+    path = tmp_path / 'app.log'
+    handler = DroppingQueueHandler(queue.Queue(10))
+    logger.addHandler(handler)
+    file_handler = logging.FileHandler(path)
+    listener = QueueListener(handler.queue, file_handler)
+    listener.start()
+
+    logger.warning('slow disk')
+    listener.stop()
+    file_handler.close()
+
+    assert path.read_text() == 'slow disk\n'
+    assert handler.dropped == 0
+
+
+def test_setup_logging_installs_one_handler(app):
+    handler = setup_logging()
+
+    assert setup_logging() is handler
+    assert logging.getLogger().handlers.count(handler) == 1
+    assert dropped_records() == handler.dropped
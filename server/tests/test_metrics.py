@@ -0,0 +1,39 @@
+import pytest
+
+from services.metrics import metrics
+
+TOKEN = 's3cret-scrape-token'
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(metrics, 'token', TOKEN)
+    return TOKEN
+
+
+def test_metrics_are_refused_until_a_token_is_configured(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'token', None)
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer anything'})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize('authorization', [None, 'Bearer wrong', TOKEN, f'Basic {TOKEN}'])
+def test_scrapes_without_the_bearer_token_are_unauthorized(client, token, authorization):
+    headers = {'Authorization': authorization} if authorization else {}
+
+    response = client.get('/metrics', headers=headers)
+
+    assert response.status_code == 401
+    assert b'http_request' not in response.data
+
+
+def test_scrape_with_the_token_renders_prometheus_text(client, token, db, admin_headers):
+    client.get('/api/auth/profile', headers=admin_headers)
+
+    response = client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert 'endpoint="auth.get_profile"' in response.get_data(as_text=True)
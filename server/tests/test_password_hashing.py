@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from models.user import User
+from services.password_hashing import PasswordHasher, PasswordHasherBusy, password_hasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher()
+    hasher.workers = 1
+    hasher.max_pending = 1
+    hasher.wait_timeout = 0.1
+    hasher.nice = 0
+    yield hasher
+    if hasher._executor is not None:
+        hasher._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_a_timed_out_hash_keeps_its_slot_until_it_finishes(hasher):
+    release = threading.Event()
+
+    def slow_hash():
+        release.wait(5)
+        return 'hash'
+
+    with pytest.raises(PasswordHasherBusy):
+        hasher._run(slow_hash)
+    with pytest.raises(PasswordHasherBusy):
+        hasher._run(lambda: 'never runs')  # the bcrypt job still holds the only slot
+
+    release.set()
+    assert hasher._slots.acquire(timeout=5)  # given back once the job is done
+    hasher._slots.release()
+    assert hasher._run(lambda: 'next') == 'next'
+
+
+@pytest.fixture
+def saturated(app, monkeypatch):
+    """The app's hasher with every queue slot taken"""
+    password_hasher._pool()
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(password_hasher, '_slots', slots)
+    return password_hasher
+
+
+def test_login_answers_503_with_retry_after_when_the_hasher_is_busy(client, admin_headers, saturated):
+    response = client.post('/api/auth/login', json={'email': 'admin@malarialab.com', 'password': 'admin12345'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(max(1, int(saturated.wait_timeout)))
+
+
+def test_registration_is_not_stored_when_the_hasher_is_busy(client, saturated):
+    response = client.post('/api/auth/register', json={
+        'email': 'tech@malarialab.com', 'username': 'tech', 'password': 'tech12345',
+        'first_name': 'Tess', 'last_name': 'Tech'
+    })
+
+    assert response.status_code == 503 and 'Retry-After' in response.headers
+    assert User.query.filter_by(email='tech@malarialab.com').first() is None
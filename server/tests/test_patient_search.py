@@ -0,0 +1,51 @@
+from models.patient import Patient
+from services.patient_search import patient_search
+
+
+def add_patient(db, patient_id, first_name, last_name, phone_number=None):
+    patient = Patient(patient_id=patient_id, first_name=first_name, last_name=last_name,
+                      phone_number=phone_number, created_by='user-1')
+    db.session.add(patient)
+    db.session.commit()
+    return patient
+
+
+def found(query):
+    return [patient.patient_id for patient in patient_search.search(query)]
+
+
+def test_search_uses_the_trigram_index_and_ranks_exact_and_prefix_matches_first(db):
+    add_patient(db, 'PAT-20260101-001', 'Amani', 'Omwana', '0712345678')
+    add_patient(db, 'PAT-20260101-002', 'Mwanaisha', 'Juma')
+    add_patient(db, 'PAT-20260101-003', 'Peter', 'Otieno')
+
+    assert patient_search.backend() == 'sqlite'
+    assert found('mwana') == ['PAT-20260101-002', 'PAT-20260101-001']
+    assert found('0712345678') == ['PAT-20260101-001']
+    assert found('pet oti') == ['PAT-20260101-003']
+    assert found('PAT-20260101-003') == ['PAT-20260101-003']
+
+
+def test_triggers_keep_the_index_in_sync(db):
+    patient = add_patient(db, 'PAT-20260101-001', 'Amani', 'Omwana')
+    patient_search.backend()
+
+    patient.last_name = 'Kariuki'
+    db.session.commit()
+    assert found('omwana') == []
+    assert found('kariuki') == ['PAT-20260101-001']
+
+    db.session.delete(patient)
+    db.session.commit()
+    assert found('kariuki') == []
+
+
+def test_recreated_tables_get_the_index_back(db):
+    add_patient(db, 'PAT-20260101-001', 'Amani', 'Omwana')
+    assert found('amani') == ['PAT-20260101-001']
+
+    db.drop_all()
+    db.create_all()
+    add_patient(db, 'PAT-20260101-002', 'Amani', 'Kariuki')
+
+    assert found('amani') == ['PAT-20260101-002']
@@ -0,0 +1,50 @@
+import pytest
+
+from services.profiler import profiler
+
+
+@pytest.fixture
+def technician_headers(client, admin_headers):
+    client.post('/api/auth/register', json={
+        'email': 'tech@malarialab.com', 'username': 'tech', 'password': 'tech12345',
+        'first_name': 'Tom', 'last_name': 'Tech', 'role': 'technician'
+    })
+    response = client.post('/api/auth/login', json={'email': 'tech@malarialab.com', 'password': 'tech12345'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_admin_requests_with_the_header_are_profiled(client, admin_headers):
+    response = client.get('/api/auth/profile', headers={**admin_headers, 'X-Profile': '1'})
+
+    profile_id = response.headers['X-Profile-Id']
+    stored = client.get(f'/api/admin/profiles/{profile_id}?format=json', headers=admin_headers).get_json()
+    assert (stored['method'], stored['path'], stored['status']) == ('GET', '/api/auth/profile', 200)
+    listed = client.get('/api/admin/profiles', headers=admin_headers).get_json()['profiles']
+    assert listed[0]['id'] == profile_id and 'folded' not in listed[0]
+
+
+@pytest.mark.parametrize('anonymous', [True, False])
+def test_other_requests_with_the_header_are_not_profiled(client, technician_headers, anonymous):
+    headers = {'X-Profile': '1'} if anonymous else {**technician_headers, 'X-Profile': '1'}
+
+    response = client.get('/api/auth/profile', headers=headers)
+
+    assert 'X-Profile-Id' not in response.headers
+
+
+def test_profiles_are_only_served_to_users_who_may_manage_users(client, admin_headers, technician_headers):
+    profile_id = client.get('/api/auth/profile', headers={**admin_headers, 'X-Profile': '1'}).headers['X-Profile-Id']
+
+    assert client.get('/api/admin/profiles', headers=technician_headers).status_code == 403
+    assert client.get(f'/api/admin/profiles/{profile_id}', headers=technician_headers).status_code == 403
+    assert client.post('/api/admin/profile?seconds=0.1', headers=technician_headers).status_code == 403
+    assert client.get('/api/admin/profiles').status_code == 401
+
+
+def test_capture_samples_the_process_and_allows_one_at_a_time(client, admin_headers):
+    response = client.post('/api/admin/profile?seconds=0.1&format=json', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.get_json()['samples'] > 0
+
+    with profiler._capture_lock:
+        assert client.post('/api/admin/profile?seconds=0.1', headers=admin_headers).status_code == 409
@@ -0,0 +1,109 @@
+import json
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from models.upload_session import UploadSession
+from models.user import User
+from services.progress_broker import ProgressBroker, progress_broker
+
+
+def parse_events(body):
+    """(event, data) pairs of an SSE body, skipping retry and keep-alive lines"""
+    events = []
+    for message in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith((':', 'retry')))
+        if fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@pytest.fixture
+def session_id(db, admin_headers):
+    user_id = User.query.filter_by(email='admin@malarialab.com').one().id
+    session = UploadSession(user_id=user_id, status='processing')
+    db.session.add(session)
+    db.session.commit()
+    return session.session_id
+
+
+@pytest.fixture(autouse=True)
+def streams(monkeypatch):
+    monkeypatch.setenv('SSE_HEARTBEAT_SECONDS', '0.05')
+    monkeypatch.setenv('SSE_MAX_SECONDS', '5')
+    monkeypatch.setattr(progress_broker, 'open_streams', 0)
+    monkeypatch.setattr(progress_broker, 'max_streams', 2)
+    # Session ids repeat once the tables are recreated, so no channel may outlive its test
+    monkeypatch.setattr(progress_broker, '_history', OrderedDict())
+    monkeypatch.setattr(progress_broker, '_subscribers', {})
+    return progress_broker
+
+
+def stream(client, headers, session_id):
+    with client.get(f'/api/upload/progress/{session_id}/stream', headers=headers) as response:
+        return response, parse_events(response.get_data(as_text=True))
+
+
+def test_new_subscribers_get_the_latest_status_and_every_image_so_far():
+    broker = ProgressBroker()
+    broker.publish('s', 'status', {'progress': 0})
+    broker.publish('s', 'image', {'index': 0})
+    broker.publish('s', 'status', {'progress': 50})
+    broker.publish('s', 'image', {'index': 1})
+
+    subscription = broker.subscribe('s')
+
+    replay = [subscription.get(timeout=1) for _ in range(3)]
+    assert replay == [('image', {'index': 0}), ('status', {'progress': 50}), ('image', {'index': 1})]
+    assert subscription.get(timeout=0.01) is None
+
+
+def test_a_subscriber_that_stops_reading_is_dropped_without_blocking_the_job():
+    broker = ProgressBroker()
+    broker.max_queued = 2
+    slow = broker.subscribe('s')
+    fast = broker.subscribe('s')
+
+    for index in range(3):
+        broker.publish('s', 'image', {'index': index})
+        fast.get(timeout=1)
+
+    assert slow.dropped and not fast.dropped
+
+
+def test_stream_replays_and_follows_the_job_until_it_finishes(client, admin_headers, session_id):
+    progress_broker.publish(session_id, 'status', {'status': 'processing', 'progress': 0})
+
+    def finish():
+        progress_broker.publish(session_id, 'image', {'index': 0, 'parasites': 2})
+        progress_broker.publish(session_id, 'completed', {'status': 'completed', 'progress': 100})
+
+    threading.Timer(0.2, finish).start()
+    response, events = stream(client, admin_headers, session_id)
+
+    assert response.mimetype == 'text/event-stream'
+    assert [event for event, _ in events] == ['status', 'image', 'completed']
+    assert events[-1][1]['progress'] == 100
+    assert progress_broker.subscriber_count(session_id) == 0
+    assert progress_broker.open_streams == 0
+
+
+def test_stream_of_a_job_unknown_to_this_process_starts_from_the_database(client, admin_headers, db, session_id):
+    UploadSession.query.filter_by(session_id=session_id).one().status = 'completed'
+    db.session.commit()
+
+    _, events = stream(client, admin_headers, session_id)
+
+    assert events == [('completed', {'sessionId': session_id, 'testId': None, 'status': 'completed',
+                                     'progress': 100})]
+
+
+def test_streams_beyond_the_cap_get_503_with_retry_after(client, admin_headers, session_id):
+    assert progress_broker.acquire_stream() and progress_broker.acquire_stream()
+
+    response = client.get(f'/api/upload/progress/{session_id}/stream', headers=admin_headers)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '0'
+    assert progress_broker.rejected_streams >= 1
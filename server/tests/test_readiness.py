@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from services.ai_analysis import ai_service
+from services.model_loader import ModelLoader, ModelNotReady
+
+
+class Model:
+    warmup_stats = {'runs': 2}
+
+
+@pytest.fixture
+def release(monkeypatch):
+    """Installs a model loader that blocks until the returned event is set"""
+    release = threading.Event()
+
+    def load():
+        assert release.wait(5)
+        return Model()
+
+    monkeypatch.setattr(ai_service, 'model_loader', ModelLoader(load, name='test model'))
+    monkeypatch.setattr(ai_service, 'lease_seconds', 0)  # no lease thread
+    monkeypatch.setattr(ai_service, 'app', ai_service.app)
+    yield release
+    release.set()
+
+
+def test_ready_only_once_the_model_has_loaded(client, release):
+    assert client.get('/api/health/live').status_code == 200
+
+    response = client.get('/api/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'not_ready'
+    assert response.get_json()['model']['state'] == 'loading'
+    assert response.get_json()['database'] == {'state': 'ready'}
+
+    release.set()
+    ai_service.model_loader.get(timeout=5)
+
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    model = response.get_json()['model']
+    assert model['state'] == 'ready' and 'loadSeconds' in model
+    assert model['warmup'] == {'runs': 2}
+
+
+def test_a_failed_load_stays_not_ready_with_its_error(client, monkeypatch):
+    def broken():
+        raise RuntimeError('best.pt not found')
+
+    monkeypatch.setattr(ai_service, 'model_loader', ModelLoader(broken))
+    monkeypatch.setattr(ai_service, 'lease_seconds', 0)
+    monkeypatch.setattr(ai_service, 'app', ai_service.app)
+    with pytest.raises(ModelNotReady, match='best.pt not found'):
+        ai_service.model_loader.get(timeout=5)
+
+    response = client.get('/api/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()['model'] == {'state': 'failed', 'loadSeconds': pytest.approx(0, abs=1),
+                                            'error': 'best.pt not found'}
+
+
+def test_readiness_can_ignore_the_model(client, release, monkeypatch):
+    monkeypatch.setenv('READINESS_REQUIRES_MODEL', 'false')
+
+    response = client.get('/api/health/ready')
+
+    assert response.status_code == 200
+    assert response.get_json()['model']['state'] == 'loading'
+
+
+def test_get_times_out_while_loading_and_a_fork_starts_over(release):
+    loader = ai_service.model_loader
+    with pytest.raises(ModelNotReady, match='still loading'):
+        loader.get(timeout=0.05)
+
+    release.set()
+    assert isinstance(loader.get(timeout=5), Model)
+
+    loader._pid = -1  # as seen by a child after the fork
+    assert loader.state == 'not_loaded'
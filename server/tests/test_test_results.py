@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from models.diagnosis_image import BOX_CLASSES, BOX_FIELDS
+from models.diagnosis_result import DiagnosisResult
+from models.patient import Patient
+from models.test import Test as LabTest
+from models.user import User
+
+PARASITE = {'type': 'PF', 'confidence': 0.91, 'bbox': [10.5, 20.25, 30.0, 40.0]}
+WBC = {'type': 'WBC', 'confidence': 0.77, 'bbox': [1.0, 2.0, 3.0, 4.0]}
+
+
+@pytest.fixture
+def stored_test(db, admin_headers):
+    user_id = User.query.filter_by(email='admin@malarialab.com').one().id
+    patient = Patient(patient_id='PAT-20260101-001', first_name='Amani', last_name='Omwana', created_by=user_id)
+    db.session.add(patient)
+    db.session.flush()
+    test = LabTest(patient_id=patient.id, sample_type='blood_smear', sample_collection_date=datetime(2026, 1, 1),
+                sample_collected_by=user_id, technician_id=user_id, created_by=user_id,
+                images=[{'filename': 'slide.jpg'}], clinical_notes={'symptoms': ['fever']})
+    db.session.add(test)
+    db.session.flush()
+    result = DiagnosisResult(test_id=test.id, status='POSITIVE', model_version='test')
+    result.add_detection('img-1', 'slide.jpg', [PARASITE], [WBC], 1, 1, 0.9)
+    db.session.add(result)
+    db.session.commit()
+    return test.id
+
+
+def results(client, headers, test_id, query=''):
+    return client.get(f'/api/tests/{test_id}/results?{query}', headers=headers)
+
+
+def test_default_response_has_every_section_with_full_boxes(client, admin_headers, stored_test):
+    data = results(client, admin_headers, stored_test).get_json()
+
+    assert data['patientId'] == 'PAT-20260101-001'
+    assert data['images'] == [{'filename': 'slide.jpg'}]
+    assert data['clinicalNotes'] == {'symptoms': ['fever']}
+    assert data['detections'][0]['parasitesDetected'] == [PARASITE]
+    assert data['detections'][0]['wbcsDetected'] == [WBC]
+    assert 'boxFormat' not in data
+
+
+def test_fields_selects_top_level_keys(client, admin_headers, stored_test):
+    data = results(client, admin_headers, stored_test, 'fields=testId,status,totalParasites').get_json()
+
+    assert set(data) == {'testId', 'status', 'totalParasites'}
+    assert data['status'] == 'POSITIVE'
+
+
+def test_include_none_drops_the_optional_sections(client, admin_headers, stored_test):
+    data = results(client, admin_headers, stored_test, 'include=none').get_json()
+
+    assert not {'images', 'clinicalNotes', 'detections'} & set(data)
+    assert data['totalParasites'] == 1
+
+
+def test_compact_boxes_come_with_their_format(client, admin_headers, stored_test):
+    data = results(client, admin_headers, stored_test, 'include=detections&boxes=compact').get_json()
+
+    assert data['detections'][0]['boxes'] == [[10.5, 20.25, 30.0, 40.0, 0.91, 0], [1.0, 2.0, 3.0, 4.0, 0.77, 4]]
+    assert data['boxFormat'] == {'fields': list(BOX_FIELDS), 'classes': list(BOX_CLASSES)}
+    assert 'images' not in data
+
+
+def test_boxes_none_keeps_per_image_counts_only(client, admin_headers, stored_test):
+    detection = results(client, admin_headers, stored_test, 'boxes=none').get_json()['detections'][0]
+
+    assert detection['totalParasites'] == 1 and detection['whiteBloodCellsDetected'] == 1
+    assert not {'boxes', 'parasitesDetected', 'wbcsDetected'} & set(detection)
+
+
+def test_unknown_box_format_is_rejected(client, admin_headers, stored_test):
+    response = results(client, admin_headers, stored_test, 'boxes=png')
+
+    assert response.status_code == 400
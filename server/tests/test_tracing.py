@@ -0,0 +1,87 @@
+import json
+import threading
+
+import pytest
+
+from services.tracing import NOOP_SPAN, Tracer, trace_id_for
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer()
+    tracer.exporter = 'file'
+    tracer.path = str(tmp_path / 'traces.jsonl')
+    tracer.batch_size = 256
+    tracer.max_queued = 100
+    # Spans are written by flush() in the test instead of the exporter thread
+    monkeypatch.setattr(tracer, '_ensure_started', lambda: None)
+    return tracer
+
+
+def exported(tracer):
+    tracer.flush()
+    with open(tracer.path, encoding='utf-8') as f:
+        return {record['name']: record for record in map(json.loads, f)}
+
+
+def test_spans_of_one_session_form_one_trace_across_threads(tracer):
+    with tracer.start_span('upload', trace_key='SESS-1') as upload:
+        with tracer.start_span('validate'):
+            pass
+
+    def job():
+        with tracer.start_span('ai_job', trace_key='SESS-1', links=[upload]):
+            tracer.start_span('image', index=0).end()
+
+    worker = threading.Thread(target=job)
+    worker.start()
+    worker.join()
+
+    spans = exported(tracer)
+    assert {span['traceId'] for span in spans.values()} == {trace_id_for('SESS-1')}
+    assert spans['upload']['parentSpanId'] is None and spans['ai_job']['parentSpanId'] is None
+    assert spans['validate']['parentSpanId'] == spans['upload']['spanId']
+    assert spans['image']['parentSpanId'] == spans['ai_job']['spanId']
+    assert spans['image']['attributes'] == {'index': 0}
+    assert spans['ai_job']['links'] == [{'traceId': trace_id_for('SESS-1'), 'spanId': spans['upload']['spanId']}]
+
+
+def test_an_explicit_parent_wins_over_the_current_span(tracer):
+    with tracer.start_span('job', trace_key='SESS-1') as job:
+        pass
+    with tracer.start_span('request', trace_key='SESS-2'):
+        tracer.start_span('store', parent=job.context).end()
+
+    spans = exported(tracer)
+    assert spans['store']['traceId'] == trace_id_for('SESS-1')
+    assert spans['store']['parentSpanId'] == spans['job']['spanId']
+
+
+def test_errors_are_recorded_and_the_parent_is_restored(tracer):
+    with tracer.start_span('outer'):
+        with pytest.raises(ValueError):
+            with tracer.start_span('inner'):
+                raise ValueError('bad image')
+        assert tracer.current_span().name == 'outer'
+    assert tracer.current_span() is None
+
+    spans = exported(tracer)
+    assert (spans['inner']['status'], spans['inner']['error']) == ('error', 'bad image')
+    assert spans['outer']['status'] == 'ok'
+
+
+def test_spans_beyond_the_queue_limit_are_dropped(tracer):
+    tracer.max_queued = 2
+    for index in range(5):
+        tracer.start_span(f'span-{index}').end()
+
+    assert tracer.dropped == 3
+    assert list(exported(tracer)) == ['span-0', 'span-1']
+
+
+def test_disabled_tracer_hands_out_the_noop_span():
+    tracer = Tracer()
+
+    with tracer.start_span('upload', trace_key='SESS-1') as span:
+        assert span is NOOP_SPAN
+        assert tracer.current_span() is None
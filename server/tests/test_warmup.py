@@ -0,0 +1,76 @@
+import pytest
+
+import malaria_detector
+from malaria_detector import MalariaDetector
+from services.ai_analysis import _build_detector
+from services.stub_detector import StubDetector
+
+
+class YOLO:
+    """Stands in for the ultralytics model; records the batch of every predict"""
+
+    def __init__(self):
+        self.overrides = {'imgsz': 64}
+        self.batches = []
+
+    def predict(self, images, **options):
+        assert images[0].shape == (64, 64, 3)
+        self.batches.append(len(images))
+
+
+class Detector:
+    """MalariaDetector stand-in for _build_detector"""
+
+    fail = False
+
+    def __init__(self):
+        self.warmups = []
+
+    def warmup(self, **options):
+        self.warmups.append(options)
+        if self.fail:
+            raise RuntimeError('out of memory')
+
+
+@pytest.fixture
+def detector_class(monkeypatch):
+    monkeypatch.setattr(malaria_detector, 'MalariaDetector', Detector)
+    monkeypatch.delenv('AI_STUB_DETECTOR', raising=False)
+    return Detector
+
+
+def test_warmup_runs_synthetic_slides_at_each_batch_size():
+    detector = object.__new__(MalariaDetector)
+    detector.model = YOLO()
+
+    stats = detector.warmup(batch_sizes=[1, 4], runs=2)
+
+    assert detector.model.batches == [1, 1, 1, 4, 4]  # first predict, then runs per batch size
+    assert set(stats['batchSizes']) == {'1', '4'}
+    assert stats['imgsz'] == 64 and not stats['compiled']
+    assert detector.warmup_stats is stats
+
+
+def test_model_is_warmed_up_with_the_configured_options(detector_class, monkeypatch):
+    monkeypatch.setenv('AI_WARMUP', 'true')
+    monkeypatch.setenv('AI_WARMUP_BATCH_SIZES', '1, 8')
+    monkeypatch.setenv('AI_WARMUP_RUNS', '3')
+
+    detector = _build_detector()
+
+    assert detector.warmups == [{'batch_sizes': [1, 8], 'runs': 3, 'channels_last': False, 'compile_model': False}]
+
+
+def test_a_failed_warmup_still_returns_the_model(detector_class, monkeypatch):
+    monkeypatch.setenv('AI_WARMUP', 'true')
+    monkeypatch.setattr(detector_class, 'fail', True)
+
+    assert isinstance(_build_detector(), Detector)
+
+
+def test_warmup_can_be_disabled_and_the_stub_skips_the_model(detector_class, monkeypatch):
+    monkeypatch.setenv('AI_WARMUP', 'false')
+    assert _build_detector().warmups == []
+
+    monkeypatch.setenv('AI_STUB_DETECTOR', 'true')
+    assert isinstance(_build_detector(), StubDetector)
@@ -0,0 +1,112 @@
+import dataclasses
+import decimal
+import json
+import logging
+import uuid
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+# Optional fast encoders, picked in order of preference
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def encode_default(obj):
+    """Encode values the stdlib encoder does not handle natively.
+
+    datetimes/dates are written as ISO 8601 (the format the to_dict methods
+    used to produce by hand), UUIDs as strings and NumPy scalars/arrays via
+    tolist(), which turns float32/float64/int64 into plain Python numbers.
+    """
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, 'tolist') and hasattr(obj, 'dtype'):
+        return obj.tolist()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson or msgspec when installed.
+
+    Falls back to the stdlib encoder (with the same ISO 8601 datetime
+    handling) when neither is available, so responses look the same
+    whichever backend is active. Keys are not sorted: on large detection
+    payloads sorting is measurable and no client depends on key order.
+    """
+
+    sort_keys = False
+
+    def __init__(self, app, backend=None):
+        super().__init__(app)
+        self.backend = backend or self.detect_backend()
+        if self.backend == 'msgspec':
+            self._msgspec_encoder = msgspec.json.Encoder(enc_hook=encode_default)
+        logger.info(f"JSON provider using {self.backend} backend")
+
+    @staticmethod
+    def detect_backend():
+        """Name of the fastest available encoder"""
+        if orjson is not None:
+            return 'orjson'
+        if msgspec is not None:
+            return 'msgspec'
+        return 'json'
+
+    def encode(self, obj, indent=False):
+        """Serialise obj to UTF-8 JSON bytes"""
+        if self.backend == 'orjson':
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=encode_default, option=option)
+
+        if self.backend == 'msgspec' and not indent and not self.sort_keys:
+            return self._msgspec_encoder.encode(obj)
+
+        return json.dumps(
+            obj,
+            default=encode_default,
+            ensure_ascii=self.ensure_ascii,
+            sort_keys=self.sort_keys,
+            indent=2 if indent else None,
+            separators=None if indent else (',', ':')
+        ).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', encode_default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """Build a JSON response without the str round trip of the default provider"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.encode(obj, indent=indent) + b'\n', mimetype=self.mimetype)
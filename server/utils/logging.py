@@ -0,0 +1,96 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+_server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the logging thread.
+
+    The record is formatted by the caller (QueueHandler.prepare) and handed
+    to the listener thread, which does the file and console I/O. When the
+    queue is full the record is dropped and counted instead of waiting.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener(handlers):
+    global _listener
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork (gunicorn preload_app), and
+    # the queue's lock may have been held by it; give the child fresh ones
+    if _listener is None:
+        return
+    _handler.queue = queue.Queue(_handler.queue.maxsize)
+    _start_listener(_listener.handlers)
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()  # writes out whatever is still queued
+
+
+def setup_logging():
+    """Route the root logger through a queue to a rotating file and the console.
+
+    Request and inference threads only enqueue records; a listener thread
+    writes them out, so slow disks never stall a request or a forward pass.
+    Configured with LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT and
+    LOG_QUEUE_SIZE (records held before new ones are dropped). Calling it
+    again is a no-op. Returns the queue handler (its `dropped` count is
+    exported as a metric).
+    """
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return _handler
+
+        level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+        path = os.getenv('LOG_FILE', os.path.join('logs', 'app.log'))
+        if not os.path.isabs(path):
+            path = os.path.join(_server_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = RotatingFileHandler(path, maxBytes=int(os.getenv('LOG_MAX_BYTES', 10240000)),
+                                           backupCount=int(os.getenv('LOG_BACKUP_COUNT', 10)))
+        console_handler = logging.StreamHandler()
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(formatter)
+
+        _handler = DroppingQueueHandler(queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', 10000))))
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(_handler)
+        _start_listener((file_handler, console_handler))
+
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(_stop_listener)
+        return _handler
+
+
+def dropped_records():
+    """Log records dropped because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,38 @@
+from flask import current_app, jsonify, request
+
+from utils.json_provider import encode_default
+
+# Optional MessagePack encoder
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIME_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def wants_msgpack():
+    """True when the client prefers MessagePack over JSON in its Accept header.
+
+    JSON is listed first so that */* and missing Accept headers keep JSON.
+    """
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIME_TYPES)
+    return best in MSGPACK_MIME_TYPES
+
+
+def negotiated_response(payload, status=200):
+    """Return payload as JSON, or MessagePack when the client asks for it.
+
+    Values the packer cannot handle natively (datetimes, UUIDs, NumPy
+    values) are converted the same way as in JSON responses.
+    """
+    if wants_msgpack():
+        body = msgpack.packb(payload, default=encode_default, use_bin_type=True)
+        response = current_app.response_class(body, status=status, mimetype='application/msgpack')
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
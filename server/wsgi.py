@@ -0,0 +1,17 @@
+"""
+WSGI entrypoint for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Tables are created here because `python app.py` is no longer the process
+that starts the server. With preload_app this runs once in the gunicorn
+master; otherwise once per worker (create_all skips existing tables).
+"""
+
+from app import create_app
+from models import db
+
+app = create_app()
+
+with app.app_context():
+    db.create_all()